@@ -36,6 +36,12 @@ class DefaultSettings:
 			"createStationSubDir": True,	  # 番組ごとにサブフォルダを作成
 			"output_directory": "OUTPUT"  # 録音ファイルの出力先フォルダ
 		}
+		config["programCache"] = {
+			"fetch_concurrency": 4,  # 番組表取得の最大並列数
+			"fetch_requests_per_second": 5,  # 番組表サーバーへの毎秒のリクエスト数上限
+			"bulk_fetch": True,  # エリア単位で番組表を一括取得する
+			"parse_processes": 0  # 番組表XMLの解析に使うプロセス数（0の場合は別プロセスを使わない）
+		}
 		return config
 
 initialValues={
@@ -26,6 +26,7 @@ SETTING_FILE_NAME="settings.ini"
 KEYMAP_FILE_NAME="keymap.ini"
 FFMPEG_LOG_FILE = "ffmpeg_log.txt"
 PROGRAM_CACHE_DB_NAME = "program_cache.db"
+HTTP_CACHE_DIR = "http_cache"
 
 
 
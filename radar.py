@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 #Application startup file
 
+import multiprocessing
 import os
 import sys
 import simpleDialog
@@ -97,4 +98,7 @@ def main():
 		print(f"Error during normal cleanup: {cleanup_error}")
 
 #global schope
-if __name__ == "__main__": main()
+if __name__ == "__main__":
+	# 番組表の解析をプロセスプールで行う場合に、実行ファイルから子プロセスを起動できるようにする
+	multiprocessing.freeze_support()
+	main()
@@ -122,6 +122,54 @@ class CalendarUtil:
         
         return base_date.strftime('%Y%m%d')
 
+    def get_broadcast_datetime(self, date, time_str):
+        """
+        放送日と番組表上の時刻から実際の日時を返す関数
+
+        放送日は5時から翌朝5時までのため、24時以降の表記（25:00など）と
+        5時未満の時刻は放送日の翌日の時刻として扱う。
+
+        Args:
+            date (str): 放送日（YYYYMMDD形式）
+            time_str (str): 時刻（HH:MM:SS形式、HH:MM形式またはHHMM形式）
+        Returns:
+            datetime.datetime: 実際の日時。解析できない場合はNone
+        """
+        try:
+            base_date = datetime.datetime.strptime(date, '%Y%m%d')
+            if ':' in time_str:
+                parts = time_str.split(':')
+            else:
+                parts = [time_str[:2], time_str[2:4]]
+            hour = int(parts[0])
+            minute = int(parts[1])
+            second = int(parts[2]) if len(parts) >= 3 else 0
+        except (ValueError, TypeError, IndexError):
+            return None
+
+        days_offset = hour // 24
+        hour = hour % 24
+        if days_offset == 0 and hour < 5:
+            days_offset = 1
+        return base_date + datetime.timedelta(days=days_offset, hours=hour, minutes=minute, seconds=second)
+
+    def get_broadcast_epochs(self, date, start_time, end_time):
+        """
+        放送日と番組の開始・終了時刻から、開始・終了のUNIX時刻（秒）を返す関数
+
+        Returns:
+            tuple: (開始時刻, 終了時刻)。解析できない値はNone
+        """
+        start = self.get_broadcast_datetime(date, start_time) if start_time else None
+        end = self.get_broadcast_datetime(date, end_time) if end_time else None
+        if start and end and end <= start:
+            # 終了時刻が開始時刻以前になる表記は日付をまたいだものとして扱う
+            end += datetime.timedelta(days=1)
+        return (
+            int(start.timestamp()) if start else None,
+            int(end.timestamp()) if end else None
+        )
+
     def format_now(self):
         now = datetime.datetime.now()
 
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# 並列取得のレート制限と並列数制御（concurrentFetcher）のテスト
+
+import tempfile
+import unittest
+from unittest import mock
+import requests
+from views import concurrentFetcher, httpCache
+from views.concurrentFetcher import AdaptiveConcurrencyLimit, ConcurrentFetcher, TokenBucket
+
+class FakeClock:
+    """time.monotonicとtime.sleepの代わりに使う時計"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+class ClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(concurrentFetcher, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+class TokenBucketTest(ClockTestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, [])
+        bucket.acquire()
+        self.assertEqual(self.clock.slept, [0.5])
+
+    def test_refills_up_to_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+        self.clock.now += 100
+        for _ in range(2):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, [])
+        bucket.acquire()
+        self.assertEqual(self.clock.slept, [1.0])
+
+class AdaptiveConcurrencyLimitTest(ClockTestCase):
+    def test_additive_increase(self):
+        limit = AdaptiveConcurrencyLimit(2, maximum=4)
+        limit.limit = 1
+        for expected in (2, 2, 3, 3, 3, 4):
+            limit.acquire()
+            limit.release(0.1)
+            self.assertEqual(limit.limit, expected)
+        # 上限を超えない
+        for _ in range(10):
+            limit.acquire()
+            limit.release(0.1)
+        self.assertEqual(limit.limit, 4)
+
+    def test_multiplicative_decrease_with_cooldown(self):
+        limit = AdaptiveConcurrencyLimit(8)
+        limit.acquire()
+        limit.release(0.1, overloaded=True)
+        self.assertEqual(limit.limit, 4)
+        # 同じ混雑で続けて減らさない
+        limit.acquire()
+        limit.release(0.1, overloaded=True)
+        self.assertEqual(limit.limit, 4)
+        self.clock.now += concurrentFetcher.BACKOFF_COOLDOWN
+        limit.acquire()
+        limit.release(0.1, overloaded=True)
+        self.assertEqual(limit.limit, 2)
+
+    def test_latency_spike_decreases(self):
+        limit = AdaptiveConcurrencyLimit(4)
+        limit.acquire()
+        limit.release(0.1)
+        limit.acquire()
+        limit.release(0.1 * concurrentFetcher.LATENCY_SPIKE_FACTOR * 2)
+        self.assertEqual(limit.limit, 2)
+
+    def test_cache_hits_do_not_adjust(self):
+        limit = AdaptiveConcurrencyLimit(4)
+        limit.acquire()
+        limit.release(0.5)
+        for _ in range(10):
+            limit.acquire()
+            limit.release(0.0, network=False)
+        self.assertEqual(limit.limit, 4)
+        self.assertEqual(limit.successes, 1)
+        self.assertEqual(limit.average_latency, 0.5)
+        self.assertEqual(limit.in_flight, 0)
+
+    def test_never_below_minimum(self):
+        limit = AdaptiveConcurrencyLimit(2, minimum=1)
+        for _ in range(5):
+            self.clock.now += concurrentFetcher.BACKOFF_COOLDOWN
+            limit.acquire()
+            limit.release(0.1, overloaded=True)
+        self.assertEqual(limit.limit, 1)
+
+class OverloadErrorTest(unittest.TestCase):
+    def http_error(self, status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(response=response)
+
+    def test_overload_errors(self):
+        self.assertTrue(concurrentFetcher.is_overload_error(requests.Timeout()))
+        self.assertTrue(concurrentFetcher.is_overload_error(requests.ConnectionError()))
+        self.assertTrue(concurrentFetcher.is_overload_error(self.http_error(429)))
+        self.assertTrue(concurrentFetcher.is_overload_error(self.http_error(503)))
+        self.assertFalse(concurrentFetcher.is_overload_error(self.http_error(404)))
+        self.assertFalse(concurrentFetcher.is_overload_error(ValueError()))
+
+class ConcurrentFetcherTest(unittest.TestCase):
+    def test_collects_results_and_errors(self):
+        def fail():
+            raise ValueError("failed")
+        fetcher = ConcurrentFetcher(max_workers=3)
+        results, errors = fetcher.run([
+            ('a', 'host', lambda: 1),
+            ('b', 'host', fail),
+            ('c', 'other', lambda: 3),
+        ])
+        self.assertEqual(results, {'a': 1, 'c': 3})
+        self.assertEqual(list(errors), ['b'])
+        self.assertIsInstance(errors['b'], ValueError)
+
+class NetworkLatencyTest(ClockTestCase):
+    """ディスクキャッシュから返しただけのタスクが並列数の制御に影響しないことのテスト"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = httpCache.HttpCache(cache_dir=directory.name)
+        patcher = mock.patch.object(httpCache.httpClient, 'get', self.fake_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_get(self, url, headers=None, timeout=None):
+        # 通信には0.5秒かかる
+        self.clock.now += 0.5
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'<radiko/>'
+        return response
+
+    def test_cache_hits_do_not_lower_average_latency(self):
+        url = 'https://radiko.jp/v3/program/date/20260101/JP13.xml'
+        other_url = 'https://radiko.jp/v3/program/date/20260102/JP13.xml'
+        fetcher = ConcurrentFetcher(max_workers=1)
+        # ワーカーは1つのまま、並列数の上限が下がるかどうかを見る
+        fetcher.concurrency = AdaptiveConcurrencyLimit(2)
+        tasks = [('first', 'host', lambda: self.cache.get(url))]
+        tasks += [(('hit', i), 'host', lambda: self.cache.get(url)) for i in range(5)]
+        tasks.append(('second', 'host', lambda: self.cache.get(other_url)))
+        results, errors = fetcher.run(tasks)
+        self.assertEqual(errors, {})
+        self.assertEqual(len(results), 7)
+        self.assertEqual(self.cache.get_stats()['fresh_hits'], 5)
+        # キャッシュヒットの0秒が平均に入ると、2回目の通信が遅延の急増とみなされて上限が下がる
+        self.assertEqual(fetcher.concurrency.average_latency, 0.5)
+        self.assertEqual(fetcher.concurrency.limit, 2)
+
+if __name__ == '__main__':
+    unittest.main()
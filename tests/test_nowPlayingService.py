@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# 放送中の番組のキャッシュ（nowPlayingService）のテスト
+
+import datetime
+import unittest
+from unittest import mock
+from views import nowPlayingService
+from views.nowPlayingService import NowPlayingService
+
+NOW = datetime.datetime(2024, 6, 1, 10, 30)
+
+def now_xml(*programs):
+    body = ''.join(
+        f'<prog ft="{start:%Y%m%d%H%M%S}" to="{end:%Y%m%d%H%M%S}"><title>{title}</title></prog>'
+        for title, start, end in programs
+    )
+    return f'<radiko><stations><station id="TBS"><progs>{body}</progs></station></stations></radiko>'.encode('utf-8')
+
+class FakeProgramManager:
+    values = {'TBS': 'JP13'}
+
+    def getprogramlist(self):
+        return 'https://radiko.jp/v3'
+
+class NowPlayingServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.responses = []
+        cache = mock.Mock()
+        cache.get.side_effect = lambda url, timeout=None, revalidate=False: self.next_response()
+        for patcher in (
+            mock.patch.object(nowPlayingService.httpCache, 'get_shared_cache', return_value=cache),
+            mock.patch.object(nowPlayingService.wx, 'CallAfter', side_effect=lambda func, *args: func(*args)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.service = NowPlayingService(FakeProgramManager())
+        self.service.watch(['TBS'])
+        self.changed = []
+        self.service.add_listener(self.changed.append)
+
+    def next_response(self):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def refresh_at(self, moment):
+        with mock.patch.object(nowPlayingService, 'time') as fake_time:
+            fake_time.time.return_value = moment.timestamp()
+            self.service._refresh('JP13')
+
+    def plan_at(self, moment):
+        return self.service._plan(moment.timestamp())
+
+    def test_failed_first_fetch_is_retried_after_error_interval(self):
+        self.responses = [OSError('network down')]
+        self.refresh_at(NOW)
+        self.assertIsNone(self.service.get('TBS', NOW))
+
+        # 30分待たずに、再試行の間隔が過ぎたら取り直す
+        due, wait = self.plan_at(NOW)
+        self.assertEqual(due, set())
+        self.assertAlmostEqual(wait, nowPlayingService.ERROR_RETRY_INTERVAL)
+        retry = NOW + datetime.timedelta(seconds=nowPlayingService.ERROR_RETRY_INTERVAL)
+        due, _ = self.plan_at(retry)
+        self.assertEqual(due, {'JP13'})
+
+        self.responses = [now_xml(('朝の番組', NOW.replace(hour=10, minute=0), NOW.replace(hour=11, minute=0)))]
+        self.refresh_at(retry)
+        self.assertEqual(self.service.get('TBS', retry).title, '朝の番組')
+        self.assertEqual(self.changed, [{'TBS'}])
+
+    def test_refetches_at_program_boundary(self):
+        end = NOW.replace(hour=10, minute=45)
+        self.responses = [now_xml(('朝の番組', NOW.replace(hour=10, minute=0), end))]
+        self.refresh_at(NOW)
+        due, wait = self.plan_at(NOW)
+        self.assertEqual(due, set())
+        self.assertAlmostEqual(wait, (end - NOW).total_seconds() + nowPlayingService.BOUNDARY_DELAY)
+        due, _ = self.plan_at(end + datetime.timedelta(seconds=nowPlayingService.BOUNDARY_DELAY))
+        self.assertEqual(due, {'JP13'})
+
+    def test_failure_after_success_keeps_programs(self):
+        end = NOW.replace(hour=11, minute=0)
+        self.responses = [now_xml(('朝の番組', NOW.replace(hour=10, minute=0), end)), OSError('network down')]
+        self.refresh_at(NOW)
+        self.refresh_at(NOW)
+        self.assertEqual(self.service.get('TBS', NOW).title, '朝の番組')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# オンエア曲のポーリング（onairMusicPoller）のテスト
+
+import unittest
+from unittest import mock
+from views import onairMusicPoller
+from views.onairMusicPoller import OnairMusicPoller, Track
+
+def feed(*items):
+    body = ''.join(f'<item stamp="{stamp}" title="{title}" artist="{artist}" />' for stamp, title, artist in items)
+    return f'<noa><item_list>{body}</item_list></noa>'.encode('utf-8')
+
+class ParseTracksTest(unittest.TestCase):
+    def test_sorted_oldest_first(self):
+        tracks = onairMusicPoller.parse_tracks('TBS', feed(
+            ('2024-06-01 10:05:00', '曲B', '歌手B'),
+            ('2024-06-01 10:00:00', '曲A', '歌手A'),
+        ))
+        self.assertEqual(tracks, [
+            Track('TBS', '曲A', '歌手A', '2024-06-01 10:00:00'),
+            Track('TBS', '曲B', '歌手B', '2024-06-01 10:05:00'),
+        ])
+
+    def test_format_track(self):
+        self.assertEqual(onairMusicPoller.format_track(Track('TBS', '曲', '歌手', '')), '歌手 - 曲')
+        self.assertEqual(onairMusicPoller.format_track(Track('TBS', '曲', '', '')), '曲')
+        self.assertEqual(onairMusicPoller.format_track(None), '')
+
+class PollTest(unittest.TestCase):
+    def setUp(self):
+        self.poller = OnairMusicPoller()
+        self.responses = []
+        cache = mock.Mock()
+        cache.get.side_effect = lambda url, timeout=None: self.next_response()
+        for patcher in (
+            mock.patch.object(onairMusicPoller.httpCache, 'get_shared_cache', return_value=cache),
+            mock.patch.object(onairMusicPoller.wx, 'CallAfter', side_effect=lambda func, *args: func(*args)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.notified = []
+        self.poller.subscribe('TBS', self.listener)
+
+    def next_response(self):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def listener(self, station_id, tracks):
+        self.notified.append([track.title for track in tracks])
+
+    def test_notifies_only_new_tracks(self):
+        self.responses = [
+            feed(('1', 'A', ''), ('2', 'B', '')),
+            feed(('1', 'A', ''), ('2', 'B', '')),
+            feed(('2', 'B', ''), ('3', 'C', '')),
+        ]
+        for _ in range(3):
+            self.poller._poll('TBS')
+        self.assertEqual(self.notified, [['A', 'B'], ['C']])
+        self.assertEqual([track.title for track in self.poller.get_history('TBS')], ['A', 'B', 'C'])
+        self.assertEqual(self.poller.get_current('TBS').title, 'C')
+
+    def test_tracks_pushed_out_of_history_are_not_added_again(self):
+        self.responses = [
+            feed(*[(f'{i:03d}', f'T{i}', '') for i in range(onairMusicPoller.HISTORY_SIZE + 5)]),
+            feed(('000', 'T0', ''), ('100', 'new', '')),
+        ]
+        self.poller._poll('TBS')
+        self.poller._poll('TBS')
+        self.assertEqual(self.notified[-1], ['new'])
+        self.assertEqual(len(self.poller.get_history('TBS')), onairMusicPoller.HISTORY_SIZE)
+
+    def test_errors_back_off(self):
+        self.responses = [IOError('failed')] * 3 + [feed(('1', 'A', ''))]
+        delays = []
+        with mock.patch.object(onairMusicPoller, 'time') as fake_time:
+            fake_time.time.return_value = 0
+            for _ in range(3):
+                self.poller._poll('TBS')
+                delays.append(self.poller.next_poll['TBS'])
+            self.assertEqual(delays, [
+                onairMusicPoller.ERROR_RETRY_INTERVAL,
+                onairMusicPoller.ERROR_RETRY_INTERVAL * 2,
+                onairMusicPoller.ERROR_RETRY_INTERVAL * 4,
+            ])
+            self.poller._poll('TBS')
+        self.assertEqual(self.poller.failures, {})
+
+    def test_unsubscribe_drops_history(self):
+        self.responses = [feed(('1', 'A', ''))]
+        self.poller._poll('TBS')
+        self.poller.unsubscribe('TBS', self.listener)
+        self.assertEqual(self.poller.get_history('TBS'), [])
+        self.assertNotIn('TBS', self.poller.next_poll)
+
+class SharedPollerTest(unittest.TestCase):
+    def test_stop_without_poller_does_not_create_one(self):
+        with mock.patch.object(onairMusicPoller, '_shared_poller', None), \
+                mock.patch.object(onairMusicPoller, 'OnairMusicPoller') as poller_class:
+            onairMusicPoller.stop_shared_poller()
+            poller_class.assert_not_called()
+            self.assertIsNone(onairMusicPoller._shared_poller)
+
+    def test_stop_shared_poller(self):
+        poller = mock.Mock()
+        with mock.patch.object(onairMusicPoller, '_shared_poller', poller):
+            onairMusicPoller.stop_shared_poller()
+            poller.stop.assert_called_once_with()
+            self.assertIsNone(onairMusicPoller._shared_poller)
+
+if __name__ == '__main__':
+    unittest.main()
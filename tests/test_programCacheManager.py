@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# 番組キャッシュ（ProgramCacheManager）のテスト
+
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+import tcutil
+from views.programCacheManager import ProgramCacheManager, SCHEMA_VERSION
+from views.programIntervalIndex import ProgramIntervalIndex
+
+# バージョン管理前（user_version = 0）の番組キャッシュのスキーマ
+LEGACY_SCHEMA = '''
+    CREATE TABLE programs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station_id TEXT NOT NULL,
+        station_name TEXT NOT NULL,
+        title TEXT NOT NULL,
+        performer TEXT,
+        start_time DATETIME NOT NULL,
+        end_time DATETIME NOT NULL,
+        description TEXT,
+        date TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE cache_metadata (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_station_date ON programs(station_id, date);
+'''
+
+def future_date(days):
+    return (datetime.datetime.now() + datetime.timedelta(days=days)).strftime('%Y%m%d')
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'programs.db')
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            manager.close()
+        self.directory.cleanup()
+
+    def open_manager(self):
+        manager = ProgramCacheManager(self.db_path)
+        self.managers.append(manager)
+        return manager
+
+class SchemaMigrationTest(CacheTestCase):
+    def create_legacy_database(self, rows):
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(LEGACY_SCHEMA)
+        conn.executemany('''
+            INSERT INTO programs (station_id, station_name, title, performer, start_time, end_time, description, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        conn.close()
+
+    def test_migrates_legacy_database_to_current_version(self):
+        date = future_date(2)
+        long_description = '番組の説明です。' * 100
+        self.create_legacy_database([
+            ('TBS', 'TBSラジオ', '朝の番組', '出演者A', '06:00:00', '08:30:00', long_description, date),
+            ('TBS', 'TBSラジオ', '深夜の番組', '出演者A', '25:00:00', '27:00:00', '', date),
+            ('QRR', '文化放送', '昼の番組', '', '12:00:00', '13:00:00', '短い説明', date),
+        ])
+
+        manager = self.open_manager()
+        conn = manager.reader_connection()
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+        self.assertEqual(manager.partition_dates, [date])
+        self.assertEqual(manager.get_program_count(date), 3)
+
+        rows = {
+            row['title']: row for row in conn.execute(
+                "SELECT station_id, station_name, title, performer, start_epoch, end_epoch, description FROM program_details"
+            )
+        }
+        self.assertEqual(set(rows), {'朝の番組', '深夜の番組', '昼の番組'})
+        self.assertEqual(rows['朝の番組']['station_name'], 'TBSラジオ')
+        self.assertEqual(rows['朝の番組']['performer'], '出演者A')
+        self.assertEqual(rows['朝の番組']['description'], long_description)
+        self.assertEqual(rows['昼の番組']['performer'], '')
+        expected = tcutil.CalendarUtil().get_broadcast_epochs(date, '25:00:00', '27:00:00')
+        self.assertEqual((rows['深夜の番組']['start_epoch'], rows['深夜の番組']['end_epoch']), expected)
+        # 同じ放送局・出演者は正規化されて1行になる
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM stations").fetchone()[0], 2)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM performers").fetchone()[0], 1)
+        self.assertEqual(
+            conn.execute("SELECT type FROM sqlite_master WHERE name = 'programs'").fetchone()[0], 'view'
+        )
+
+    def test_migrated_programs_are_searchable(self):
+        date = future_date(1)
+        self.create_legacy_database([
+            ('TBS', 'TBSラジオ', 'ニュース番組', '', '07:00:00', '08:00:00', '', date),
+        ])
+        manager = self.open_manager()
+        results = manager.search_programs({'title': 'ニュース番組'})
+        self.assertEqual([program['title'] for program in results], ['ニュース番組'])
+
+    def test_reopening_current_version_keeps_data(self):
+        date = future_date(1)
+        manager = self.open_manager()
+        manager.update_programs_data({'TBS': {'name': 'TBSラジオ', 'programs': [
+            {'title': '番組', 'performer': '', 'start_time': '07:00:00', 'end_time': '08:00:00', 'description': ''},
+        ]}}, date)
+        manager.close()
+
+        manager = self.open_manager()
+        self.assertEqual(manager.get_program_count(date), 1)
+        self.assertEqual(manager.reader_connection().execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+
+    def test_newer_schema_version_is_rejected(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        conn.close()
+        with self.assertRaises(sqlite3.DatabaseError):
+            self.open_manager()
+
+class SearchCursorTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = self.open_manager()
+        # 複数の放送日にまたがり、同じ開始時刻の番組が放送局の数だけ並ぶデータ
+        for days in (1, 2, 3):
+            self.manager.update_programs_data({
+                f'ST{station:02d}': {'name': f'放送局{station}', 'programs': [
+                    {
+                        'title': f'定時ニュース{hour}', 'performer': '', 'description': '',
+                        'start_time': f'{hour:02d}:00:00', 'end_time': f'{hour + 1:02d}:00:00',
+                    }
+                    for hour in range(6, 18)
+                ]}
+                for station in range(8)
+            }, future_date(days))
+
+    @staticmethod
+    def key(program):
+        return (program['station_id'], program['date'], program['start_time'])
+
+    def collect_pages(self, criteria, page_size):
+        cursor = self.manager.open_search_cursor(criteria, page_size=page_size)
+        pages = list(cursor)
+        self.assertFalse(cursor.has_more)
+        self.assertTrue(all(len(page) <= page_size for page in pages))
+        return [program for page in pages for program in page]
+
+    def test_pages_cover_results_without_duplicates(self):
+        criteria = {'title': '定時ニュース'}
+        expected = self.manager.search_programs(dict(criteria, limit=10000))
+        self.assertEqual(len(expected), 3 * 8 * 12)
+        for page_size in (1, 7, 96, 1000):
+            with self.subTest(page_size=page_size):
+                programs = self.collect_pages(criteria, page_size)
+                keys = [self.key(program) for program in programs]
+                self.assertEqual(len(keys), len(set(keys)))
+                self.assertEqual(keys, [self.key(program) for program in expected])
+
+    def test_pages_are_in_broadcast_order(self):
+        programs = self.collect_pages({'title': '定時ニュース'}, 5)
+        order = [(program['start_epoch'], program['station_id']) for program in programs]
+        self.assertEqual(order, sorted(order))
+
+    def test_relevance_pages_without_duplicates(self):
+        programs = self.collect_pages({'title': '定時ニュース1', 'sort': 'relevance'}, 7)
+        keys = [self.key(program) for program in programs]
+        self.assertEqual(len(keys), len(set(keys)))
+        # 10時台〜17時台の番組（放送日3日 × 放送局8局 × 8番組）
+        self.assertEqual(len(keys), 3 * 8 * 8)
+
+    def test_exact_page_size_ends_with_empty_page(self):
+        cursor = self.manager.open_search_cursor({'title': '定時ニュース6'}, page_size=24)
+        self.assertEqual(len(cursor.fetch_page()), 24)
+        self.assertEqual(cursor.fetch_page(), [])
+        self.assertFalse(cursor.has_more)
+
+class IntervalIndexTest(CacheTestCase):
+    def programs(self, title):
+        return {'TBS': {'name': 'TBSラジオ', 'programs': [
+            {'title': title, 'performer': '', 'description': '', 'start_time': '07:00:00', 'end_time': '08:00:00'},
+        ]}}
+
+    def test_index_follows_ingestion(self):
+        date = future_date(1)
+        manager = self.open_manager()
+        manager.update_programs_data(self.programs('旧番組'), date)
+        index = manager.get_interval_index()
+        start_epoch, _ = tcutil.CalendarUtil().get_broadcast_epochs(date, '07:00:00', '08:00:00')
+        self.assertEqual(index.program_at('TBS', start_epoch).title, '旧番組')
+
+        manager.update_programs_data(self.programs('新番組'), date)
+        self.assertEqual(index.program_at('TBS', start_epoch).title, '新番組')
+
+    def test_changes_during_build_are_applied(self):
+        date = future_date(1)
+        manager = self.open_manager()
+        manager.update_programs_data(self.programs('旧番組'), date)
+        start_epoch, _ = tcutil.CalendarUtil().get_broadcast_epochs(date, '07:00:00', '08:00:00')
+
+        # 読み込みの後、公開する前にコミットされた取り込みも反映される
+        original_load = ProgramIntervalIndex.load
+        def load(index, programs):
+            original_load(index, programs)
+            manager.update_programs_data(self.programs('新番組'), date)
+        with mock.patch.object(ProgramIntervalIndex, 'load', load):
+            index = manager.get_interval_index()
+        self.assertEqual(index.program_at('TBS', start_epoch).title, '新番組')
+
+    def test_index_is_not_built_without_request(self):
+        manager = self.open_manager()
+        self.assertIsNone(manager.get_interval_index(build=False))
+        self.assertIsNotNone(manager.get_interval_index())
+        self.assertIsNotNone(manager.get_interval_index(build=False))
+
+if __name__ == '__main__':
+    unittest.main()
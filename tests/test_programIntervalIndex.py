@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 放送時間帯のインデックス（ProgramIntervalIndex）のテスト
+
+import unittest
+from views.programIntervalIndex import IntervalProgram, ProgramIntervalIndex, StationIntervals
+
+def program(station_id, title, start_epoch, end_epoch, date='20240601'):
+    return IntervalProgram(station_id, station_id, title, '', start_epoch, end_epoch, date)
+
+class StationIntervalsTest(unittest.TestCase):
+    def setUp(self):
+        # 0-100, 100-200, 250-300 と、それらに重なる長い特別番組 50-260
+        self.intervals = StationIntervals([
+            program('A', 'p1', 0, 100),
+            program('A', 'p2', 100, 200),
+            program('A', 'special', 50, 260),
+            program('A', 'p3', 250, 300),
+        ])
+
+    def test_at_boundaries(self):
+        self.assertEqual(self.intervals.at(0).title, 'p1')
+        self.assertEqual(self.intervals.at(100).title, 'p2')
+        self.assertIsNone(self.intervals.at(300))
+        self.assertIsNone(self.intervals.at(-1))
+
+    def test_at_finds_overlapping_program_after_gap(self):
+        # 200-250は通常の番組が無いが、特別番組が放送中
+        self.assertEqual(self.intervals.at(220).title, 'special')
+
+    def test_overlapping(self):
+        titles = lambda start, end: [p.title for p in self.intervals.overlapping(start, end)]
+        self.assertEqual(titles(0, 10), ['p1'])
+        self.assertEqual(titles(90, 110), ['p1', 'special', 'p2'])
+        self.assertEqual(titles(200, 250), ['special'])
+        self.assertEqual(titles(260, 1000), ['p3'])
+        self.assertEqual(titles(300, 400), [])
+        # 終了時刻ちょうどに始まる時間帯とは重ならない
+        self.assertEqual(titles(100, 101), ['special', 'p2'])
+
+    def test_overlapping_matches_brute_force(self):
+        programs = self.intervals.programs
+        for start in range(-10, 320, 7):
+            for length in (1, 13, 60, 400):
+                expected = [p for p in programs if p.start_epoch < start + length and p.end_epoch > start]
+                self.assertEqual(self.intervals.overlapping(start, start + length), expected)
+
+    def test_next_start(self):
+        self.assertEqual(self.intervals.next_start(0), 50)
+        self.assertEqual(self.intervals.next_start(100), 250)
+        self.assertIsNone(self.intervals.next_start(250))
+
+class ProgramIntervalIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = ProgramIntervalIndex()
+        self.index.load([
+            program('A', 'a1', 0, 100, '20240601'),
+            program('A', 'a2', 100, 200, '20240602'),
+            program('B', 'b1', 0, 150, '20240601'),
+            program('B', 'b2', 160, 300, '20240602'),
+        ])
+
+    def test_programs_at(self):
+        self.assertEqual({k: p.title for k, p in self.index.programs_at(120).items()}, {'A': 'a2', 'B': 'b1'})
+        # 放送中の番組が無い放送局は含まない
+        self.assertEqual({k: p.title for k, p in self.index.programs_at(155).items()}, {'A': 'a2'})
+
+    def test_programs_between(self):
+        result = self.index.programs_between(90, 170)
+        self.assertEqual({k: [p.title for p in v] for k, v in result.items()}, {'A': ['a1', 'a2'], 'B': ['b1', 'b2']})
+        self.assertEqual(list(self.index.programs_between(90, 170, station_id='B')), ['B'])
+
+    def test_next_change(self):
+        # Aは100で次の番組、Bは150で終了
+        self.assertEqual(self.index.next_change(50), 100)
+        self.assertEqual(self.index.next_change(120), 150)
+        # 番組の無い時間帯の後は、次の番組の開始が変わり目
+        self.assertEqual(self.index.next_change(150, station_ids={'B'}), 160)
+        self.assertEqual(self.index.next_change(200, station_ids={'A'}), None)
+        self.assertEqual(self.index.next_change(250), 300)
+
+    def test_replace_station_day(self):
+        self.index.replace_station_day('A', '20240602', [program('A', 'new', 100, 180, '20240602')])
+        self.assertEqual(self.index.program_at('A', 150).title, 'new')
+        self.assertIsNone(self.index.program_at('A', 190))
+        # 他の放送日は変わらない
+        self.assertEqual(self.index.program_at('A', 50).title, 'a1')
+
+    def test_duplicate_across_dates_is_merged(self):
+        # 放送日をまたぐ番組が両方の日に載っていても1件として扱う
+        self.index.replace_station_day('B', '20240602', [program('B', 'b1', 0, 150, '20240602')])
+        self.assertEqual([p.title for p in self.index.programs_between(0, 150)['B']], ['b1'])
+
+    def test_drop_dates(self):
+        self.index.drop_dates(['20240601'])
+        self.assertIsNone(self.index.program_at('A', 50))
+        self.assertEqual(self.index.program_at('A', 150).title, 'a2')
+        self.assertEqual(self.index.next_change(0), 100)
+
+if __name__ == '__main__':
+    unittest.main()
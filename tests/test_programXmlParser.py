@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 番組表XMLの逐次解析（programXmlParser）のテスト
+
+import unittest
+import lxml.etree as ET
+from views import programXmlParser
+from views.programXmlParser import ProgramRecord
+
+def prog(ftl, tol, title=None, pfm=None, desc=None):
+    children = ''.join(
+        f'<{tag}>{value}</{tag}>' for tag, value in (('title', title), ('pfm', pfm), ('desc', desc)) if value is not None
+    )
+    return f'<prog ft="x" to="x" ftl="{ftl}" tol="{tol}">{children}<info>i</info></prog>'
+
+def document(stations):
+    body = ''.join(
+        f'<station id="{station_id}"><name>n</name><progs><date>20240601</date>{"".join(progs)}</progs></station>'
+        for station_id, progs in stations
+    )
+    return f'<radiko><stations>{body}</stations></radiko>'.encode('utf-8')
+
+class ParseProgramsTest(unittest.TestCase):
+    def test_parses_programs_per_station(self):
+        result = programXmlParser.parse_programs(document([
+            ('TBS', [prog('0500', '0600', 'A', '出演', '説明'), prog('0600', '0700', 'B')]),
+            ('QRR', [prog('2500', '2600', 'C')]),
+        ]))
+        self.assertEqual(result, {
+            'TBS': [ProgramRecord('A', '出演', '0500', '0600', '説明'), ProgramRecord('B', '', '0600', '0700', '')],
+            'QRR': [ProgramRecord('C', '', '2500', '2600', '')],
+        })
+
+    def test_missing_fields_do_not_shift_programs(self):
+        result = programXmlParser.parse_programs(document([
+            ('TBS', [prog('0500', '0600', 'A', pfm='出演A'), prog('0600', '0700', 'B'), prog('0700', '0800', 'C', pfm='出演C')]),
+        ]))
+        self.assertEqual([(p.title, p.performer) for p in result['TBS']], [('A', '出演A'), ('B', ''), ('C', '出演C')])
+
+    def test_strips_html_from_description(self):
+        result = programXmlParser.parse_programs(document([
+            ('TBS', [prog('0500', '0600', 'A', desc='&lt;p&gt;本文&lt;br /&gt;&lt;/p&gt;')]),
+        ]))
+        self.assertEqual(result['TBS'][0].description, '本文')
+
+    def test_large_document_across_chunks(self):
+        progs = [prog(f'{i % 24:02d}00', f'{(i + 1) % 24:02d}00', f'T{i}', desc='x' * 500) for i in range(500)]
+        content = document([('TBS', progs), ('QRR', progs[:10])])
+        self.assertGreater(len(content), programXmlParser.FEED_CHUNK_SIZE * 2)
+        result = programXmlParser.parse_programs(content)
+        self.assertEqual([p.title for p in result['TBS']], [f'T{i}' for i in range(500)])
+        self.assertEqual(len(result['QRR']), 10)
+
+    def test_syntax_error(self):
+        with self.assertRaises(ET.XMLSyntaxError):
+            programXmlParser.parse_programs(b'<radiko><stations>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# 番組キャッシュの更新計画（RefreshPlanner）のテスト
+
+import unittest
+from views.refreshPlanner import RefreshPlanner
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+class RefreshPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.planner = RefreshPlanner([(0, 6 * HOUR), (2, 3 * DAY), (None, 7 * DAY)])
+        self.now = 1_000_000_000
+
+    def test_ttl_by_offset(self):
+        self.assertEqual(self.planner.ttl(0), 6 * HOUR)
+        self.assertEqual(self.planner.ttl(1), 3 * DAY)
+        self.assertEqual(self.planner.ttl(2), 3 * DAY)
+        self.assertEqual(self.planner.ttl(6), 7 * DAY)
+
+    def test_unfetched_targets_are_always_due(self):
+        targets = [('TBS', '20240601'), ('TBS', '20240607')]
+        self.assertEqual(self.planner.plan(targets, {}, '20240601', now=self.now), targets)
+
+    def test_expiry_depends_on_distance_from_today(self):
+        fetched_at = {
+            ('TBS', '20240601'): self.now - 7 * HOUR,  # 今日: 6時間で期限切れ
+            ('TBS', '20240602'): self.now - 7 * HOUR,  # 明日: 3日は取り直さない
+            ('TBS', '20240605'): self.now - 4 * DAY,  # 4日後: 7日は取り直さない
+            ('QRR', '20240602'): self.now - 3 * DAY,
+        }
+        targets = list(fetched_at)
+        self.assertEqual(
+            self.planner.plan(targets, fetched_at, '20240601', now=self.now),
+            [('TBS', '20240601'), ('QRR', '20240602')]
+        )
+
+    def test_past_dates_use_today_policy(self):
+        fetched_at = {('TBS', '20240531'): self.now - 7 * HOUR}
+        self.assertEqual(self.planner.plan(list(fetched_at), fetched_at, '20240601', now=self.now), [('TBS', '20240531')])
+
+    def test_keeps_target_order(self):
+        targets = [('B', '20240603'), ('A', '20240601'), ('C', '20240602')]
+        self.assertEqual(self.planner.plan(targets, {}, '20240601', now=self.now), targets)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# 放送局一覧のカタログ（stationCatalog）のテスト
+
+import unittest
+from unittest import mock
+import lxml.etree as ET
+from views import stationCatalog
+from views.stationCatalog import Station, StationCatalog
+
+FULL_XML = '''
+<region>
+  <stations ascii_name="HOKKAIDO-TOHOKU" region_name="北海道・東北">
+    <station><id>HBC</id><name>HBCラジオ</name><ascii_name>HBC</ascii_name><area_id>JP1</area_id></station>
+    <station><id>RN1</id><name>ラジオNIKKEI第1</name><ascii_name>RN1</ascii_name><area_id>JP13</area_id></station>
+  </stations>
+  <stations ascii_name="KANTO" region_name="関東">
+    <station><id>TBS</id><name>TBSラジオ</name><ascii_name>TBS</ascii_name><area_id>JP13</area_id></station>
+    <station><id>RN1</id><name>ラジオNIKKEI第1</name><ascii_name>RN1</ascii_name><area_id>JP13</area_id></station>
+  </stations>
+</region>
+'''.encode('utf-8')
+
+class ParseCatalogTest(unittest.TestCase):
+    def test_parse(self):
+        stations = stationCatalog.parse_catalog(FULL_XML)
+        self.assertEqual(len(stations), 4)
+        self.assertEqual(stations[0], Station('HBC', 'HBCラジオ', 'HBC', 'JP1', 'HOKKAIDO-TOHOKU', '北海道・東北'))
+
+    def test_syntax_error(self):
+        with self.assertRaises(ET.XMLSyntaxError):
+            stationCatalog.parse_catalog(b'<region>')
+
+class StationCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = mock.Mock()
+        self.cache.get.return_value = FULL_XML
+        self.cache.get_stored.return_value = None
+        patcher = mock.patch.object(stationCatalog.httpCache, 'get_shared_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.catalog = StationCatalog()
+
+    def test_lookups(self):
+        self.catalog.ensure_fresh()
+        self.assertEqual(self.catalog.get('TBS').name, 'TBSラジオ')
+        # 複数の地方に載っている放送局は最初の掲載を代表とする
+        self.assertEqual(self.catalog.get('RN1').region, 'HOKKAIDO-TOHOKU')
+        self.assertEqual([s.station_id for s in self.catalog.stations_in_regions(['KANTO', 'HOKKAIDO-TOHOKU'])], ['HBC', 'RN1', 'TBS'])
+        self.assertEqual([s.station_id for s in self.catalog.stations_in_area('JP13')], ['RN1', 'TBS'])
+        self.assertEqual(self.catalog.area_codes(), {'HBC': 'JP1', 'RN1': 'JP13', 'TBS': 'JP13'})
+
+    def test_fetches_once_within_ttl(self):
+        self.catalog.ensure_fresh()
+        self.catalog.ensure_fresh()
+        self.assertEqual(self.cache.get.call_count, 1)
+
+    def test_refetches_after_ttl(self):
+        with mock.patch.object(stationCatalog, 'time') as fake_time:
+            fake_time.time.return_value = 1000
+            self.catalog.ensure_fresh()
+            fake_time.time.return_value = 1000 + stationCatalog.CATALOG_TTL
+            self.catalog.ensure_fresh()
+        self.assertEqual(self.cache.get.call_count, 2)
+
+    def test_snapshot_is_used_without_network(self):
+        self.cache.get_stored.return_value = FULL_XML
+        self.assertTrue(self.catalog.load_snapshot())
+        self.assertEqual(self.catalog.get('TBS').area_id, 'JP13')
+        self.cache.get.assert_not_called()
+
+    def test_keeps_stored_list_when_refresh_fails(self):
+        self.cache.get.side_effect = OSError('network down')
+        self.cache.get_stored.return_value = FULL_XML
+        self.catalog.ensure_fresh()
+        self.assertIsNotNone(self.catalog.get('TBS'))
+
+    def test_refresh_failure_without_stored_list_raises(self):
+        self.cache.get.side_effect = OSError('network down')
+        with self.assertRaises(OSError):
+            self.catalog.ensure_fresh()
+
+if __name__ == '__main__':
+    unittest.main()
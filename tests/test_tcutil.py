@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# tcutil.CalendarUtilの放送日時の変換のテスト
+
+import datetime
+import unittest
+import tcutil
+
+def epoch(*args):
+    return int(datetime.datetime(*args).timestamp())
+
+class BroadcastEpochsTest(unittest.TestCase):
+    def setUp(self):
+        self.calendar_util = tcutil.CalendarUtil()
+
+    def test_daytime_program(self):
+        self.assertEqual(
+            self.calendar_util.get_broadcast_epochs('20240601', '09:00:00', '10:30:00'),
+            (epoch(2024, 6, 1, 9, 0), epoch(2024, 6, 1, 10, 30))
+        )
+
+    def test_hours_after_24_are_next_day(self):
+        # 放送日は翌朝5時までなので、25:00は翌日の1:00
+        self.assertEqual(
+            self.calendar_util.get_broadcast_epochs('20240601', '24:00:00', '25:30:00'),
+            (epoch(2024, 6, 2, 0, 0), epoch(2024, 6, 2, 1, 30))
+        )
+
+    def test_early_morning_is_next_day(self):
+        self.assertEqual(
+            self.calendar_util.get_broadcast_epochs('20240601', '0300', '0500'),
+            (epoch(2024, 6, 2, 3, 0), epoch(2024, 6, 2, 5, 0))
+        )
+
+    def test_program_across_midnight(self):
+        self.assertEqual(
+            self.calendar_util.get_broadcast_epochs('20240601', '23:00', '01:00'),
+            (epoch(2024, 6, 1, 23, 0), epoch(2024, 6, 2, 1, 0))
+        )
+
+    def test_program_across_month_end(self):
+        self.assertEqual(
+            self.calendar_util.get_broadcast_epochs('20240630', '23:30:00', '24:30:00'),
+            (epoch(2024, 6, 30, 23, 30), epoch(2024, 7, 1, 0, 30))
+        )
+
+    def test_end_before_start_wraps_to_next_day(self):
+        self.assertEqual(
+            self.calendar_util.get_broadcast_epochs('20240601', '05:00:00', '05:00:00'),
+            (epoch(2024, 6, 1, 5, 0), epoch(2024, 6, 2, 5, 0))
+        )
+
+    def test_unparsable_time(self):
+        self.assertEqual(self.calendar_util.get_broadcast_epochs('20240601', 'xx', ''), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
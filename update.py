@@ -12,6 +12,7 @@ import os
 import subprocess
 import sys
 from views import updateDialog
+from views import httpClient
 import time
 import threading
 import win32api
@@ -66,7 +67,7 @@ class update(threading.Thread):
 		}
 		timeout = globalVars.app.config.getint("general", "timeout", 3)
 		try:
-			response = requests.get(constants.UPDATE_URL, params, timeout = timeout)
+			response = httpClient.get(constants.UPDATE_URL, params = params, timeout = timeout, retry = False)
 		except requests.exceptions.ConnectTimeout:
 			if not auto:
 				self.log.info("failed to check update reason: connection timed out")
@@ -134,7 +135,7 @@ class update(threading.Thread):
 		self.log.info("downloading update file...")
 		url = self.info["updater_url"]
 		self._file_name = "update_file.zip"
-		response = requests.get(url, stream = True)
+		response = httpClient.get(url, stream = True, retry = False)
 		total_size = int(response.headers["Content-Length"])
 		wx.CallAfter(self.dialog.gauge.SetRange, (int)(total_size/100))
 		now_size = 0
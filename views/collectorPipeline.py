@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# 番組データ収集のパイプラインモジュール（取得 → 解析 → 書き込み）
+
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+import constants
+from views import programXmlParser
+
+# 段の間のキューに置ける件数（後ろの段が追いつかない場合は前の段を待たせる）
+QUEUE_SIZE = 16
+# 解析段のスレッド数
+DEFAULT_PARSE_WORKERS = 2
+# 1回の書き込み（トランザクション）にまとめる放送局数
+WRITE_BATCH_SIZE = 50
+# 書き込み待ちの間隔がこの秒数を超えたら、まとまっていなくても書き込む
+WRITE_FLUSH_INTERVAL = 0.5
+
+# 各段のスレッドに終了を伝える目印
+_STOP = object()
+
+class StageStats:
+    """パイプラインの段ごとの処理件数・処理量・処理時間"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.items = 0
+        self.units = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+
+    def record(self, busy, units=0, error=False):
+        """処理1件分を記録"""
+        now = time.monotonic()
+        with self.lock:
+            if self.started is None:
+                self.started = now - busy
+            self.finished = now
+            self.items += 1
+            self.units += units
+            self.busy += busy
+            if error:
+                self.errors += 1
+
+    def measure(self, func, *args):
+        """funcを実行して処理時間を記録する（戻り値がbytesの場合はバイト数も記録）"""
+        started = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception:
+            self.record(time.monotonic() - started, error=True)
+            raise
+        self.record(time.monotonic() - started, len(result) if isinstance(result, bytes) else 0)
+        return result
+
+    def as_dict(self):
+        """統計を辞書で取得（throughputは段が動いていた時間あたりの件数）"""
+        with self.lock:
+            wall = (self.finished - self.started) if self.started is not None else 0.0
+            return {
+                'items': self.items,
+                'units': self.units,
+                'errors': self.errors,
+                'busy': self.busy,
+                'wall': wall,
+                'throughput': self.items / wall if wall > 0 else 0.0,
+            }
+
+class CollectorPipeline:
+    """解析段と書き込み段をつないだ収集パイプライン
+
+    取得段（ConcurrentFetcherのワーカー）が取得したXMLをsubmit()で渡すと、
+    解析段のスレッドが番組レコードに変換してhandleに渡し、handleが返した
+    (日付, {放送局ID: データ}) を単一の書き込みスレッドが日付ごとにまとめてwriteに渡す。
+    段の間のキューは有限で、後ろの段が詰まると前の段が待つ。
+
+    parse_processesに1以上を指定すると、XMLの解析をその数のプロセスで行い、GUIスレッドとGILを取り合わないようにする。
+    """
+
+    def __init__(self, write, parse_workers=DEFAULT_PARSE_WORKERS, parse_processes=0, queue_size=QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.CollectorPipeline")
+        self.write = write
+        self.batch_size = batch_size
+        self.parse_queue = queue.Queue(queue_size)
+        self.write_queue = queue.Queue(queue_size)
+        self.stages = {name: StageStats(name) for name in ('fetch', 'parse', 'write')}
+        self.executor = ProcessPoolExecutor(max_workers=parse_processes) if parse_processes else None
+        self.parsers = [
+            threading.Thread(target=self._parse_loop, name=f"CollectorPipeline-parse-{i}", daemon=True)
+            for i in range(max(1, parse_workers))
+        ]
+        self.writer = threading.Thread(target=self._write_loop, name="CollectorPipeline-write", daemon=True)
+        for thread in self.parsers:
+            thread.start()
+        self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fetch(self, func, *args):
+        """取得段の処理を実行して統計に記録（取得ワーカーのスレッドで呼ぶ）"""
+        return self.stages['fetch'].measure(func, *args)
+
+    def submit(self, body, handle):
+        """取得したXMLを解析段に渡す（キューが一杯の場合は空くまで待つ）
+
+        handle(stations, error) は解析段のスレッドで呼ばれ、書き込む (日付, {放送局ID: データ}) のリストを返す。
+        stationsはparse_programs()の結果で、解析に失敗した場合はNoneとその例外が渡される。
+        """
+        self.parse_queue.put((body, handle))
+
+    def join_parsing(self):
+        """渡したXMLがすべて解析され、handleの呼び出しが終わるまで待つ"""
+        self.parse_queue.join()
+
+    def _parse(self, body):
+        if self.executor is not None:
+            return self.executor.submit(programXmlParser.parse_programs, body).result()
+        return programXmlParser.parse_programs(body)
+
+    def _parse_loop(self):
+        """解析段: XMLを解析してhandleに渡し、結果を書き込み段に送る"""
+        while True:
+            item = self.parse_queue.get()
+            try:
+                if item is _STOP:
+                    return
+                body, handle = item
+                started = time.monotonic()
+                stations = error = None
+                try:
+                    stations = self._parse(body)
+                except Exception as e:
+                    error = e
+                try:
+                    writes = handle(stations, error) or []
+                except Exception as e:
+                    self.log.error(f"Failed to handle parsed listings: {e}")
+                    writes = []
+                self.stages['parse'].record(time.monotonic() - started, len(body), error is not None)
+                for write in writes:
+                    self.write_queue.put(write)
+            finally:
+                self.parse_queue.task_done()
+
+    def _write_loop(self):
+        """書き込み段: 日付ごとにまとめて書き込む（書き込みはこのスレッドだけが行う）"""
+        pending = {}
+        count = 0
+        while True:
+            try:
+                item = self.write_queue.get(timeout=WRITE_FLUSH_INTERVAL)
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _STOP:
+                date, stations = item
+                pending.setdefault(date, {}).update(stations)
+                count += len(stations)
+                if count < self.batch_size:
+                    continue
+            for date, stations in pending.items():
+                started = time.monotonic()
+                try:
+                    self.write(date, stations)
+                    failed = False
+                except Exception as e:
+                    self.log.error(f"Failed to write programs for {date}: {e}")
+                    failed = True
+                self.stages['write'].record(time.monotonic() - started, len(stations), failed)
+            pending = {}
+            count = 0
+            if item is _STOP:
+                return
+
+    def close(self):
+        """残りの解析・書き込みを終えてスレッドを停止し、段ごとの統計を記録"""
+        for _ in self.parsers:
+            self.parse_queue.put(_STOP)
+        for thread in self.parsers:
+            thread.join()
+        self.write_queue.put(_STOP)
+        self.writer.join()
+        if self.executor is not None:
+            self.executor.shutdown()
+        for name, stats in self.get_stats().items():
+            self.log.info(
+                f"Pipeline stage {name}: {stats['items']} items ({stats['units']} units, {stats['errors']} errors) "
+                f"in {stats['wall']:.1f}s, busy {stats['busy']:.1f}s, {stats['throughput']:.1f} items/s"
+            )
+
+    def get_stats(self):
+        """段ごとの統計を取得"""
+        return {name: stats.as_dict() for name, stats in self.stages.items()}
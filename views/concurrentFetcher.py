@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# 番組表の並列取得モジュール（ホストごとのレート制限と適応的な並列数制御）
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import getLogger
+import requests
+import constants
+from views import httpCache
+
+# 既定の最大並列数
+DEFAULT_MAX_WORKERS = 4
+# ホストごとの既定のリクエスト数上限（毎秒）
+DEFAULT_REQUESTS_PER_SECOND = 5
+# 連続で送出できるリクエスト数（トークンバケットの容量）
+DEFAULT_BURST = 5
+# 平均応答時間の何倍を超えたら遅延の急増とみなすか
+LATENCY_SPIKE_FACTOR = 3.0
+# 並列数を減らした後、次に減らせるようになるまでの秒数
+BACKOFF_COOLDOWN = 1.0
+# 平均応答時間の平滑化係数
+LATENCY_SMOOTHING = 0.2
+
+class TokenBucket:
+    """トークンバケットによるレート制限（スレッドセーフ）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得する（不足している場合は補充されるまで待機）"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            # 待機中も他のスレッドがバケットを参照できるよう、ロックの外で眠る
+            time.sleep(wait)
+
+class HostRateLimiter:
+    """ホストごとにトークンバケットを持つレート制限"""
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, host):
+        """指定ホストへのリクエスト1回分の許可を得る"""
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.requests_per_second, self.burst)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+class AdaptiveConcurrencyLimit:
+    """応答状況に応じて同時実行数を増減させる制御（AIMD）
+
+    現在の上限と同じ回数だけ連続で成功したら上限を1増やし、
+    過負荷（タイムアウトや429・5xx）や応答時間の急増を検知したら上限を半分にする。
+    キャッシュから返しただけで通信しなかったタスクは、上限と平均応答時間のどちらにも影響させない。
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or initial)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.in_flight = 0
+        self.successes = 0
+        self.average_latency = None
+        self.last_backoff = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """実行枠が空くまで待機して1つ確保する"""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, overloaded=False, network=True):
+        """実行枠を返却し、結果に応じて上限を調整する（networkがFalseなら枠を返すだけ）"""
+        with self.condition:
+            self.in_flight -= 1
+            if not network:
+                self.condition.notify_all()
+                return
+            spike = (
+                self.average_latency is not None
+                and latency > self.average_latency * LATENCY_SPIKE_FACTOR
+            )
+            if overloaded or spike:
+                self._decrease()
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            # 失敗したリクエストの応答時間は平均に含めない
+            if not overloaded:
+                if self.average_latency is None:
+                    self.average_latency = latency
+                else:
+                    self.average_latency += (latency - self.average_latency) * LATENCY_SMOOTHING
+            self.condition.notify_all()
+
+    def _decrease(self):
+        """上限を半分にする（同じ混雑で何度も減らさないよう一定時間は据え置く）"""
+        self.successes = 0
+        now = time.monotonic()
+        if now - self.last_backoff < BACKOFF_COOLDOWN:
+            return
+        self.last_backoff = now
+        self.limit = max(self.minimum, self.limit // 2)
+
+class FetchCancelled(Exception):
+    """取り消されたため実行しなかったタスクの例外"""
+
+def is_overload_error(error):
+    """サーバーの過負荷を示すエラーかどうか（404などの個別の失敗は含めない）"""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+class ConcurrentFetcher:
+    """取得処理をスレッドプールで並列実行するクラス
+
+    各タスクは (キー, ホスト, 関数) の組で、関数は引数なしで呼び出される。
+    ホストごとのレート制限を守りつつ、同時実行数は応答状況に応じて自動調整する。
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.ConcurrentFetcher")
+        self.max_workers = max(1, int(max_workers))
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.concurrency = AdaptiveConcurrencyLimit(self.max_workers, maximum=self.max_workers)
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'failures': 0, 'overloads': 0, 'elapsed': 0.0}
+
+    def run(self, tasks, on_result=None, cancel_event=None):
+        """タスクをすべて実行し、(キー -> 結果, キー -> 例外) の辞書を返す
+
+        on_resultを指定した場合は、タスクが終わった順に on_result(キー, 結果, 例外) を
+        呼び出し元のスレッドで呼ぶ（結果と例外の一方はNone）。
+        cancel_eventがセットされると、まだ始まっていないタスクはFetchCancelledで終わる。
+        """
+        tasks = list(tasks)
+        results = {}
+        errors = {}
+        if not tasks:
+            return results, errors
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ConcurrentFetcher") as executor:
+            futures = {executor.submit(self._run_task, host, func, cancel_event): key for key, host, func in tasks}
+            # コールバックがある場合は完了順に処理し、終わった単位から結果を確定できるようにする
+            ordered = as_completed(futures) if on_result is not None else futures
+            for future in ordered:
+                key = futures[future]
+                result = error = None
+                try:
+                    result = results[key] = future.result()
+                except Exception as e:
+                    error = errors[key] = e
+                if on_result is not None:
+                    try:
+                        on_result(key, result, error)
+                    except Exception as e:
+                        self.log.error(f"Result callback failed for {key}: {e}")
+        elapsed = time.monotonic() - started
+
+        with self.stats_lock:
+            self.stats['elapsed'] += elapsed
+        self.log.info(
+            f"Fetched {len(results)}/{len(tasks)} items in {elapsed:.1f}s "
+            f"(concurrency limit={self.concurrency.limit}, failures={len(errors)})"
+        )
+        return results, errors
+
+    def _run_task(self, host, func, cancel_event=None):
+        """レート制限と同時実行数の制御の下でタスクを1つ実行"""
+        if cancel_event is not None and cancel_event.is_set():
+            raise FetchCancelled()
+        self.concurrency.acquire()
+        overloaded = False
+        started = None
+        network_requests = httpCache.network_request_count()
+        try:
+            self.rate_limiter.acquire(host)
+            started = time.monotonic()
+            return func()
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            with self.stats_lock:
+                self.stats['failures'] += 1
+                if overloaded:
+                    self.stats['overloads'] += 1
+            raise
+        finally:
+            latency = time.monotonic() - started if started is not None else 0.0
+            # ディスクキャッシュから返しただけのタスクは応答時間の平均に含めない
+            network = overloaded or httpCache.network_request_count() > network_requests
+            with self.stats_lock:
+                self.stats['requests'] += 1
+            self.concurrency.release(latency, overloaded, network)
+
+    def get_stats(self):
+        """取得状況の統計を取得"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['concurrency_limit'] = self.concurrency.limit
+        return stats
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# radiko XMLのディスクHTTPキャッシュモジュール
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from logging import getLogger
+import constants
+from views import httpClient
+
+# エンドポイントごとの有効期間（秒）。期間内は通信せずにキャッシュを返し、期限切れ後は条件付きリクエストで再検証する
+TTL_POLICIES = [
+    (re.compile(r'/station/region/full\.xml$'), 24 * 60 * 60),  # 放送局一覧
+    (re.compile(r'/program/(station/)?date/'), 10 * 60),  # 日付指定の番組表
+    (re.compile(r'/program/now/'), 30),  # 現在放送中の番組
+    (re.compile(r'/feed/pc/noa/'), 15),  # オンエア曲
+]
+# どのポリシーにも当てはまらないURLは毎回再検証する
+DEFAULT_TTL = 0
+# 最後の取得からこの秒数を過ぎたエントリは起動時に削除する
+MAX_ENTRY_AGE = 8 * 24 * 60 * 60
+
+# スレッドごとの通信回数（キャッシュを返しただけの取得と通信した取得を呼び出し元で見分けるため）
+_thread_state = threading.local()
+
+def network_request_count():
+    """呼び出し元のスレッドでHttpCache.get()が通信した回数を返す"""
+    return getattr(_thread_state, 'network_requests', 0)
+
+class HttpCache:
+    """ETag/Last-Modifiedによる条件付きリクエストに対応したディスクHTTPキャッシュ
+
+    URLごとに本文とメタデータ（ETag、Last-Modified、有効期限）をファイルに保存する。
+    304 Not Modifiedはキャッシュヒットとして扱い、保存済みの本文を返す。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.HttpCache")
+        self.cache_dir = cache_dir or constants.HTTP_CACHE_DIR
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0,  # 呼び出し回数
+            'fresh_hits': 0,  # 有効期間内で通信しなかった回数
+            'revalidated': 0,  # 304で再検証できた回数
+            'misses': 0,  # 本文を取得し直した回数
+            'bytes_received': 0,  # 受信した本文のバイト数
+            'bytes_saved': 0,  # キャッシュから返したことで受信せずに済んだバイト数
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.prune()
+        except OSError as e:
+            self.log.error(f"Failed to prepare HTTP cache directory {self.cache_dir}: {e}")
+
+    def _paths(self, url):
+        """URLに対応する本文ファイルとメタデータファイルのパス"""
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + '.body', base + '.json'
+
+    def _ttl(self, url):
+        """URLに適用する有効期間"""
+        for pattern, ttl in TTL_POLICIES:
+            if pattern.search(url):
+                return ttl
+        return DEFAULT_TTL
+
+    def _load(self, url):
+        """保存済みのメタデータと本文を読み込む（無い場合は(None, None)）"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('url') != url:
+                return None, None
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            return meta, body
+        except (OSError, ValueError):
+            return None, None
+
+    def _write_atomic(self, path, data):
+        """一時ファイルに書いてから置き換える（並行する書き込みで壊れないように）"""
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _store(self, url, meta, body=None):
+        """メタデータ（と本文）を保存"""
+        body_path, meta_path = self._paths(url)
+        try:
+            if body is not None:
+                self._write_atomic(body_path, body)
+            else:
+                # 再検証のみの場合も本文の更新時刻を進め、prune()で削除されないようにする
+                os.utime(body_path)
+            self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        except OSError as e:
+            self.log.warning(f"Failed to store HTTP cache entry for {url}: {e}")
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def get(self, url, timeout=None, revalidate=False):
+        """URLの本文を取得する（キャッシュが有効なら通信しない）
+
+        revalidateの場合は有効期間内でも条件付きリクエストで確認する（内容が切り替わる時刻が分かっている場合に使う）。
+        通信エラーやHTTPエラーは呼び出し元に送出する。
+        """
+        self._count('requests')
+        now = time.time()
+        meta, body = self._load(url)
+        if meta is not None and not revalidate and now < meta.get('expires_at', 0):
+            self._count('fresh_hits')
+            self._count('bytes_saved', len(body))
+            return body
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        _thread_state.network_requests = network_request_count() + 1
+        response = httpClient.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and meta is not None:
+            meta['fetched_at'] = now
+            meta['expires_at'] = now + self._ttl(url)
+            self._store(url, meta)
+            self._count('revalidated')
+            self._count('bytes_saved', len(body))
+            return body
+
+        response.raise_for_status()
+        body = response.content
+        self._count('misses')
+        self._count('bytes_received', len(body))
+        # 検証子の無い応答も有効期間の間は再利用する
+        self._store(url, {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now,
+            'expires_at': now + self._ttl(url),
+        }, body)
+        return body
+
+    def get_stored(self, url):
+        """保存済みの本文を有効期限に関わらず返す（通信はしない。無い場合はNone）"""
+        meta, body = self._load(url)
+        return body if meta is not None else None
+
+    def prune(self, max_age=MAX_ENTRY_AGE):
+        """長期間使われていないエントリを削除"""
+        threshold = time.time() - max_age
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if os.path.getmtime(path) < threshold:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            self.log.debug(f"Pruned {removed} HTTP cache files")
+        return removed
+
+    def get_stats(self):
+        """キャッシュの統計（ヒット率と転送量）を取得"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        hits = stats['fresh_hits'] + stats['revalidated']
+        stats['hit_ratio'] = hits / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def get_shared_cache():
+    """プロセス全体で共有するキャッシュを取得"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = HttpCache()
+        return _shared_cache
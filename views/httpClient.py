@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# 共有HTTPクライアントモジュール（接続プール・再試行・エンドポイント別の統計）
+
+import re
+import threading
+import time
+from logging import getLogger
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import constants
+
+# 既定のタイムアウト（接続, 読み取り）秒
+DEFAULT_TIMEOUT = (5, 30)
+# ホストごとに保持する接続数（並列取得の最大並列数より大きくしておく）
+POOL_MAXSIZE = 32
+# 再試行の回数と間隔（0.5秒, 1秒, 2秒...）
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# 統計を集計するエンドポイントの分類
+ENDPOINTS = [
+    (re.compile(r'/v3/station/'), 'station_list'),
+    (re.compile(r'/v3/program/(station/)?date/'), 'program_date'),
+    (re.compile(r'/v3/program/now/'), 'program_now'),
+    (re.compile(r'/v3/feed/pc/noa/'), 'now_on_air'),
+    (re.compile(r'/v2/api/auth'), 'auth'),
+    (re.compile(r'\.m3u8'), 'stream'),
+]
+
+class HttpClient:
+    """全通信で共有するHTTPクライアント
+
+    keep-aliveの接続プールを再利用し、名前解決とTCP/TLSの接続確立を通信ごとに行わない。
+    GETは接続エラーと429・5xxに対して指数バックオフで再試行する。
+    認証やアップデート確認のように再試行させたくない通信はretry=Falseで送る。
+    """
+
+    def __init__(self):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.HttpClient")
+        self.session = self._create_session(retry=True)
+        self.no_retry_session = self._create_session(retry=False)
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+
+    def _create_session(self, retry):
+        """セッションを作成（retryがFalseの場合は再試行しない）"""
+        max_retries = 0
+        if retry:
+            max_retries = Retry(
+                total=RETRY_TOTAL,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET', 'HEAD']),
+                respect_retry_after_header=True,
+                # 再試行し尽くした場合も応答を返し、呼び出し元のraise_for_status()でHTTPErrorにする
+                raise_on_status=False,
+            )
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE, max_retries=max_retries)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _endpoint(self, url):
+        """URLから統計用のエンドポイント名を決める"""
+        for pattern, name in ENDPOINTS:
+            if pattern.search(url):
+                return name
+        return 'other'
+
+    def _record(self, endpoint, elapsed, response=None, error=None, size=0):
+        """エンドポイント別の統計を更新"""
+        with self.stats_lock:
+            stats = self.stats.setdefault(endpoint, {'requests': 0, 'errors': 0, 'bytes': 0, 'elapsed': 0.0, 'status': {}})
+            stats['requests'] += 1
+            stats['elapsed'] += elapsed
+            if error is not None:
+                stats['errors'] += 1
+                return
+            status = response.status_code
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+            if status >= 400:
+                stats['errors'] += 1
+            stats['bytes'] += size
+
+    def request(self, method, url, timeout=None, retry=True, **kwargs):
+        """リクエストを送信する（timeoutを省略した場合は既定値を使う）
+
+        通信エラーはrequestsの例外として送出する。HTTPのエラー応答はそのまま返す。
+        retryがFalseの場合は接続エラーや5xxでも再試行しない。
+        """
+        endpoint = self._endpoint(url)
+        session = self.session if retry else self.no_retry_session
+        started = time.monotonic()
+        try:
+            response = session.request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        except requests.RequestException as e:
+            self._record(endpoint, time.monotonic() - started, error=e)
+            raise
+        # ストリーミング時は本文を読まずに済むよう、ヘッダーの長さで数える
+        length = response.headers.get('Content-Length')
+        if kwargs.get('stream'):
+            size = int(length) if length and length.isdigit() else 0
+        else:
+            size = len(response.content)
+        self._record(endpoint, time.monotonic() - started, response=response, size=size)
+        return response
+
+    def get(self, url, timeout=None, retry=True, **kwargs):
+        """GETリクエストを送信"""
+        return self.request('GET', url, timeout=timeout, retry=retry, **kwargs)
+
+    def get_stats(self):
+        """エンドポイント別の統計を取得"""
+        with self.stats_lock:
+            endpoints = {name: dict(stats, status=dict(stats['status'])) for name, stats in self.stats.items()}
+        return {'endpoints': endpoints}
+
+    def close(self):
+        """接続プールを閉じる"""
+        self.session.close()
+        self.no_retry_session.close()
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def get_client():
+    """プロセス全体で共有するクライアントを取得"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
+
+def get(url, timeout=None, retry=True, **kwargs):
+    """共有クライアントでGETリクエストを送信"""
+    return get_client().get(url, timeout=timeout, retry=retry, **kwargs)
@@ -14,7 +14,7 @@ import constants
 import globalVars
 import update
 import menuItemsStore
-import urllib
+import requests
 import ConfigManager
 from recorder import recorder_manager
 from recorder import schedule_manager
@@ -29,7 +29,7 @@ from views import radioManager
 from views import recordingHandler
 from views import programInfoHandler
 from views import volumeHandler
-from views import programCacheController
+from views import startupBootstrap
 from views import programSearchDialog
 
 
@@ -54,8 +54,8 @@ class MainView(BaseView):
 		# outputディレクトリの存在チェックと作成
 		self._ensure_output_directory()
 
-		# プログラム管理の初期化
-		self.progs = programmanager.ProgramManager()
+		# プログラム管理の初期化（放送局のエリア情報は起動処理の中で取得する）
+		self.progs = programmanager.ProgramManager(load_area_codes=False)
 		
 		# 各ハンドラーの初期化
 		self.radio_manager = radioManager.RadioManager(self)
@@ -63,14 +63,11 @@ class MainView(BaseView):
 		self.program_info_handler = programInfoHandler.ProgramInfoHandler(self)
 		self.volume_handler = volumeHandler.VolumeHandler(self)
 		
-		# エリア判定（放送局リストの初期化）
-		self.radio_manager.areaDetermination(self.progs)
-		
-		# 番組キャッシュコントローラーの初期化（放送局リスト初期化後）
-		self.program_cache_controller = programCacheController.ProgramCacheController(self.radio_manager)
+		# 前回のエリアと保存済みの放送局一覧で先に画面を作り、通信を待たずに操作できるようにする
+		self.radio_manager.area = self.app.config.getstring("play", "area", "") or None
 		
 		# UIの設定
-		self.radio_manager.setup_radio_ui()
+		self.radio_manager.setup_radio_ui(cached_only=True)
 		# 番組情報の表示設定に応じてUIを初期化
 		if self.events.displaying:
 			self.program_info_handler.setup_program_info_ui()
@@ -79,6 +76,12 @@ class MainView(BaseView):
 			if hasattr(self, 'menu'):
 				self.menu.SetMenuLabel("HIDE_PROGRAMINFO", _("番組情報を表示(&P)"))
 
+		# エリア判定・放送局一覧の更新・番組キャッシュの準備はバックグラウンドで行う
+		# （番組キャッシュコントローラーは準備ができた時点でself.program_cache_controllerに設定される）
+		self.bootstrap = startupBootstrap.StartupBootstrap(self)
+		self.bootstrap.add_listener(self.events.onBootstrapProgress)
+		self.bootstrap.start()
+
 	def _ensure_output_directory(self):
 		"""outputディレクトリの存在をチェックし、存在しない場合は作成する"""
 		output_dir = "output"
@@ -205,10 +208,15 @@ class Events(BaseEvents):
 	current_selected_station_id = None  # 現在選択されている放送局ID
 
 
-	def onUpdateProcess(self, event):
-		"""番組情報を定期的に更新"""
-		if self.playing and self.current_playing_station_id:
-			# 現在再生中の放送局の番組情報を更新
+	def onNowPlayingChanged(self, station_ids):
+		"""放送中の番組が切り替わったときの処理"""
+		if self.playing and self.current_playing_station_id in station_ids:
+			if hasattr(self.parent, 'program_info_handler'):
+				self.parent.program_info_handler.get_latest_info()
+
+	def onOnairMusicChanged(self, station_id, tracks):
+		"""再生中の放送局で新しい曲が流れたときの処理"""
+		if self.playing and self.current_playing_station_id == station_id:
 			if hasattr(self.parent, 'program_info_handler'):
 				self.parent.program_info_handler.get_latest_info()
 
@@ -476,10 +484,14 @@ class Events(BaseEvents):
 
 	def _start_playback(self):
 		"""再生開始処理"""
+		# 認証は起動処理の中で行うため、終わるまでは再生できない
+		if not getattr(self.parent.progs, 'token', None):
+			dialog(_("準備中"), _("起動処理が完了していません。しばらくしてから再度お試しください。"))
+			return False
 		try:
 			self.parent.radio_manager.play(self.current_playing_station_id, self.parent.progs)
 			return True
-		except urllib.request.HTTPError as error:
+		except requests.HTTPError as error:
 			errorDialog(_("再生に失敗しました。聴取可能な都道府県内であることをご確認ください。\nこの症状が引き続き発生する場合は、放送局一覧を再描画してからお試しください。"))
 			self.parent.log.error("Playback failure!" + str(error))
 			return False
@@ -522,6 +534,18 @@ class Events(BaseEvents):
 		if hasattr(self.parent, 'program_info_handler'):
 			self.parent.program_info_handler.show_onair_music(self.current_playing_station_id)
 
+	def onBootstrapProgress(self, step, state, detail):
+		"""起動処理の進捗通知"""
+		if state != 'failed':
+			if step == 'all':
+				self.parent.log.info("startup bootstrap completed in %.1fs" % detail)
+			return
+		# 保存済みの状態で表示できている場合は、通知せずにそのまま使う
+		if step == 'area' and not self.parent.radio_manager.area:
+			errorDialog(_("エリア情報の取得に失敗しました。\nインターネットの接続状況をご確認ください"))
+		elif step == 'stations' and not self.parent.radio_manager.stid and self.parent.radio_manager.area:
+			errorDialog(_("放送局情報の取得に失敗しました。\n{detail}").format(detail=detail))
+
 	def onRadioSelected(self, event):
 		if not hasattr(self.parent, 'radio_manager'):
 			return
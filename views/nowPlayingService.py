@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# 現在放送中の番組情報をエリアごとにキャッシュするモジュール
+
+import datetime
+import threading
+import time
+from collections import namedtuple
+from logging import getLogger
+import lxml.etree as ET
+import wx
+import constants
+from views import httpCache
+from views import programXmlParser
+
+# 番組の終了時刻から、次の番組を取りに行くまでの秒数（配信側で切り替わるのを待つ）
+BOUNDARY_DELAY = 3
+# 終了時刻を過ぎても次の番組が届いていなかった場合に取り直すまでの秒数
+BOUNDARY_RETRY_INTERVAL = 10
+# 取得に失敗した場合に取り直すまでの秒数
+ERROR_RETRY_INTERVAL = 60
+# 番組の終了時刻が分からない場合に取り直すまでの秒数
+MAX_REFRESH_INTERVAL = 30 * 60
+
+# 放送中の番組1つ分の情報（start/endは放送開始・終了の日時）
+NowProgram = namedtuple('NowProgram', ['station_id', 'title', 'performer', 'description', 'start', 'end'])
+
+def parse_now_programs(content):
+    """現在放送中の番組のXML（/program/now/）を解析し、放送局IDをキー、開始順のNowProgramのリストを値に持つ辞書を返す
+
+    解析エラーはET.XMLSyntaxErrorとして送出する。
+    """
+    stations = {}
+    root = ET.fromstring(content)
+    for station in root.iter('station'):
+        station_id = station.get('id') or ''
+        programs = []
+        for prog in station.iter('prog'):
+            try:
+                start = datetime.datetime.strptime(prog.get('ft') or '', '%Y%m%d%H%M%S')
+                end = datetime.datetime.strptime(prog.get('to') or '', '%Y%m%d%H%M%S')
+            except ValueError:
+                continue
+            programs.append(NowProgram(
+                station_id,
+                (prog.findtext('title') or '').strip(),
+                (prog.findtext('pfm') or '').strip(),
+                programXmlParser.strip_html(prog.findtext('desc') or '').strip(),
+                start,
+                end,
+            ))
+        programs.sort(key=lambda program: program.start)
+        stations[station_id] = programs
+    return stations
+
+def find_program(programs, at):
+    """atの時点で放送中の番組（無い場合はNone）"""
+    for program in programs or ():
+        if program.start <= at < program.end:
+            return program
+    return None
+
+class NowPlayingService:
+    """現在放送中の番組情報をエリア単位で取得し、メモリから答えるクラス
+
+    watch()で指定した放送局のエリアだけを、バックグラウンドのスレッドが番組の終了時刻（tol）に合わせて取り直す。
+    同じエリアの放送局はまとめて取得されるため、エリア内で放送局を切り替えても通信しない。
+    get()は通信せずにキャッシュから答える（まだ取得できていない場合はNone）。
+    放送中の番組が変わると、add_listener()で登録した関数に listener(放送局IDのセット) の形でGUIスレッドから通知する。
+    """
+
+    def __init__(self, progs):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.NowPlayingService")
+        self.progs = progs
+        self.condition = threading.Condition()
+        # エリアコード -> {'stations': {放送局ID: [NowProgram]}, 'last_success': 最後に取得できた時刻（一度も無ければNone）, 'retry_at': 次に取り直せる時刻}
+        self.areas = {}
+        self.watched = set()
+        self.listeners = []
+        self.stopped = False
+        self.thread = None
+
+    def add_listener(self, listener):
+        """番組の切り替わりの通知先を登録"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """番組情報を取得するスレッドを開始"""
+        self.thread = threading.Thread(target=self._run, name="NowPlayingService", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """スレッドを停止"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def watch(self, station_ids):
+        """番組の切り替わりを追う放送局を指定（キャッシュに無いエリアはすぐに取得する）"""
+        with self.condition:
+            self.watched = set(station_ids)
+            self.condition.notify_all()
+
+    def wake(self):
+        """取得の予定を計算し直す（放送局のエリア情報が読み込まれた場合など）"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def get(self, station_id, at=None):
+        """放送局で放送中の番組をキャッシュから取得（無い場合はNone）"""
+        area = self._area_of(station_id)
+        with self.condition:
+            entry = self.areas.get(area)
+            programs = entry['stations'].get(station_id) if entry else None
+        return find_program(programs, at or datetime.datetime.now())
+
+    def _area_of(self, station_id):
+        return self.progs.values.get(station_id)
+
+    def _run(self):
+        """取得スレッドの本体: 次の取得時刻まで待ち、取り直しが必要なエリアを取得する"""
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                due, wait = self._plan(time.time())
+                if not due:
+                    self.condition.wait(wait)
+                    continue
+            for area in due:
+                self._refresh(area)
+
+    def _plan(self, now):
+        """取り直しが必要なエリアと、次に確認するまでの秒数（ロックを取った状態で呼ぶ）"""
+        due = set()
+        wait = MAX_REFRESH_INTERVAL
+        current = datetime.datetime.fromtimestamp(now)
+        for station_id in self.watched:
+            area = self._area_of(station_id)
+            if area is None:
+                # エリア情報の読み込みを待つ
+                wait = min(wait, BOUNDARY_RETRY_INTERVAL)
+                continue
+            entry = self.areas.get(area)
+            if entry is None:
+                due.add(area)
+                continue
+            programs = entry['stations'].get(station_id) or []
+            program = find_program(programs, current)
+            if entry['last_success'] is None:
+                # まだ一度も取得できていないエリアは、失敗後の再試行の時刻に取り直す
+                refresh_at = entry['retry_at']
+            elif program is not None:
+                refresh_at = program.end.timestamp() + BOUNDARY_DELAY
+            else:
+                # 直前の番組が終わってから少し待ち、終了時刻が分からない場合は一定の間隔で取り直す
+                ended = [p.end.timestamp() for p in programs if p.end <= current]
+                refresh_at = max(ended) + BOUNDARY_DELAY if ended else entry['last_success'] + MAX_REFRESH_INTERVAL
+            refresh_at = max(refresh_at, entry['retry_at'])
+            if refresh_at <= now:
+                due.add(area)
+            else:
+                wait = min(wait, refresh_at - now)
+        return due, wait
+
+    def _refresh(self, area):
+        """エリアの放送中の番組を取得してキャッシュを差し替え、番組が変わった放送局を通知する"""
+        url = f"{self.progs.getprogramlist()}/program/now/{area}.xml"
+        now = time.time()
+        try:
+            # 切り替わりの時刻に取りに行くので、キャッシュの有効期間内でも再検証する
+            body = httpCache.get_shared_cache().get(url, timeout=10, revalidate=True)
+            stations = parse_now_programs(body)
+        except Exception as e:
+            self.log.warning(f"Failed to fetch now playing programs for {area}: {e}")
+            with self.condition:
+                # 取得済みの番組と最後に取得できた時刻はそのまま残し、再試行の時刻だけを決める
+                entry = self.areas.setdefault(area, {'stations': {}, 'last_success': None})
+                entry['retry_at'] = now + ERROR_RETRY_INTERVAL
+            return
+
+        current = datetime.datetime.fromtimestamp(now)
+        with self.condition:
+            old = self.areas.get(area)
+            old_stations = old['stations'] if old else {}
+            # 終了時刻を過ぎても次の番組が届いていなければ、少し待って取り直す
+            waiting = any(
+                stations.get(station_id) and find_program(stations[station_id], current) is None
+                for station_id in self.watched if self._area_of(station_id) == area
+            )
+            self.areas[area] = {
+                'stations': stations,
+                'last_success': now,
+                'retry_at': now + BOUNDARY_RETRY_INTERVAL if waiting else 0,
+            }
+        changed = {
+            station_id for station_id, programs in stations.items()
+            if find_program(programs, current) != find_program(old_stations.get(station_id), current)
+        }
+        self.log.debug(f"Now playing programs for {area} refreshed: {len(stations)} stations, {len(changed)} changed")
+        if changed:
+            for listener in self.listeners:
+                wx.CallAfter(listener, changed)
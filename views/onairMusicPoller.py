@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# オンエア曲（NOA）フィードの共有ポーリングモジュール
+
+import threading
+import time
+from collections import deque, namedtuple
+from logging import getLogger
+import lxml.etree as ET
+import wx
+import constants
+from views import httpCache
+
+# オンエア曲のフィード
+NOA_FEED_URL = "http://radiko.jp/v3/feed/pc/noa/{station_id}.xml"
+# 1放送局のフィードを取得する間隔（秒）。期限切れ後は条件付きリクエストで確認する
+POLL_INTERVAL = 30
+# 取得に失敗した場合に取り直すまでの秒数（失敗が続くたびに倍にし、ERROR_RETRY_MAX_INTERVALで打ち止めにする）
+ERROR_RETRY_INTERVAL = 5
+ERROR_RETRY_MAX_INTERVAL = 300
+# 放送局ごとに保持する曲の履歴の件数
+HISTORY_SIZE = 50
+
+# オンエア曲1曲分の情報（stampはフィードに記載された放送日時の文字列）
+Track = namedtuple('Track', ['station_id', 'title', 'artist', 'stamp'])
+
+def format_track(track):
+    """表示用の「アーティスト - 曲名」"""
+    if track is None or not track.title:
+        return ""
+    if track.artist:
+        return f"{track.artist} - {track.title}"
+    return track.title
+
+def parse_tracks(station_id, content):
+    """NOAフィードを解析し、放送日時の古い順のTrackのリストを返す（解析エラーはET.XMLSyntaxErrorとして送出する）"""
+    root = ET.fromstring(content)
+    tracks = [
+        Track(station_id, item.get('title', ''), item.get('artist', ''), item.get('stamp', ''))
+        for item in root.iter('item')
+    ]
+    tracks.sort(key=lambda track: track.stamp)
+    return tracks
+
+class OnairMusicPoller:
+    """購読されている放送局のオンエア曲フィードを1つのスレッドでまとめて取得するクラス
+
+    放送局ごとにPOLL_INTERVALに1回だけ取得し、前回の結果との差分（新しく流れた曲）だけを
+    subscribe()で登録した関数に listener(放送局ID, 新しい曲のリスト) の形でGUIスレッドから通知する。
+    取得した曲は放送局ごとにHISTORY_SIZE件まで履歴として保持する。
+    購読者のいなくなった放送局は取得しない。
+    """
+
+    def __init__(self):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.OnairMusicPoller")
+        self.condition = threading.Condition()
+        # 放送局ID -> 通知先のリスト
+        self.subscribers = {}
+        # 放送局ID -> 曲の履歴（古い順）
+        self.histories = {}
+        # 放送局ID -> 次に取得する時刻
+        self.next_poll = {}
+        # 放送局ID -> 続けて取得に失敗した回数
+        self.failures = {}
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        """取得スレッドを開始"""
+        self.thread = threading.Thread(target=self._run, name="OnairMusicPoller", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """取得スレッドを停止"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def subscribe(self, station_id, listener):
+        """放送局のオンエア曲を購読（履歴が無ければすぐに取得する）"""
+        with self.condition:
+            self.subscribers.setdefault(station_id, []).append(listener)
+            self.next_poll.setdefault(station_id, 0)
+            self.condition.notify_all()
+
+    def unsubscribe(self, station_id, listener):
+        """購読をやめる（購読者がいなくなった放送局は取得せず、履歴も破棄する）"""
+        with self.condition:
+            listeners = self.subscribers.get(station_id, [])
+            if listener in listeners:
+                listeners.remove(listener)
+            if not listeners:
+                self.subscribers.pop(station_id, None)
+                self.next_poll.pop(station_id, None)
+                self.histories.pop(station_id, None)
+                self.failures.pop(station_id, None)
+
+    def get_current(self, station_id):
+        """放送局で最後に流れた曲（まだ取得していない場合はNone）"""
+        with self.condition:
+            history = self.histories.get(station_id)
+            return history[-1] if history else None
+
+    def get_history(self, station_id):
+        """放送局の曲の履歴（古い順）"""
+        with self.condition:
+            return list(self.histories.get(station_id, ()))
+
+    def _run(self):
+        """取得スレッドの本体: 取得時刻になった放送局のフィードを取得する"""
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                now = time.time()
+                due = [station_id for station_id, poll_at in self.next_poll.items() if poll_at <= now]
+                if not due:
+                    wait = min(self.next_poll.values(), default=now + POLL_INTERVAL) - now
+                    self.condition.wait(wait)
+                    continue
+                for station_id in due:
+                    self.next_poll[station_id] = now + POLL_INTERVAL
+            for station_id in due:
+                self._poll(station_id)
+
+    def _poll(self, station_id):
+        """1放送局のフィードを取得し、新しい曲を履歴に加えて通知する"""
+        url = NOA_FEED_URL.format(station_id=station_id)
+        try:
+            tracks = parse_tracks(station_id, httpCache.get_shared_cache().get(url, timeout=10))
+        except Exception as e:
+            with self.condition:
+                if station_id in self.next_poll:
+                    failures = self.failures.get(station_id, 0) + 1
+                    self.failures[station_id] = failures
+                    delay = min(ERROR_RETRY_INTERVAL * 2 ** (failures - 1), ERROR_RETRY_MAX_INTERVAL)
+                    self.next_poll[station_id] = time.time() + delay
+                    self.log.warning(f"Failed to fetch on-air music for {station_id}, retrying in {delay}s: {e}")
+            return
+
+        with self.condition:
+            self.failures.pop(station_id, None)
+            if station_id not in self.subscribers:
+                # 取得中に購読をやめた放送局の履歴は残さない
+                return
+            history = self.histories.setdefault(station_id, deque(maxlen=HISTORY_SIZE))
+            # 履歴の最後の曲より後に流れた曲だけを新しい曲とする（履歴から押し出された古い曲を再び加えない）
+            latest = history[-1] if history else None
+            seen = set(history)
+            added = [
+                track for track in tracks
+                if track not in seen and (latest is None or track.stamp >= latest.stamp)
+            ]
+            history.extend(added)
+            listeners = list(self.subscribers.get(station_id, ()))
+        if added:
+            self.log.debug(f"{len(added)} new tracks on {station_id}")
+            for listener in listeners:
+                wx.CallAfter(listener, station_id, added)
+
+_shared_poller = None
+_shared_lock = threading.Lock()
+
+def get_shared_poller():
+    """プロセス全体で共有するポーラーを取得（最初の呼び出しで取得スレッドを開始する）"""
+    global _shared_poller
+    with _shared_lock:
+        if _shared_poller is None:
+            _shared_poller = OnairMusicPoller()
+            _shared_poller.start()
+        return _shared_poller
+
+def stop_shared_poller():
+    """共有ポーラーを停止する（まだ作られていない場合は何もしない）"""
+    global _shared_poller
+    with _shared_lock:
+        poller, _shared_poller = _shared_poller, None
+    if poller is not None:
+        poller.stop()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# 番組キャッシュDB接続管理モジュール
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from logging import getLogger
+import constants
+
+# 他の接続がロックを保持している場合に待機する最大秒数
+BUSY_TIMEOUT = 30
+
+class ProgramCacheConnectionManager:
+    """番組キャッシュDBの接続管理クラス
+
+    WALモードで運用し、書き込みは排他制御された1本の接続に集約する。
+    読み取りはスレッドごとの専用接続で行うため、書き込み中でも待たずに検索できる。
+    """
+
+    def __init__(self, db_path, on_connect=None):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramCacheConnectionManager")
+        self.db_path = db_path
+        self.on_connect = on_connect  # 接続ごとの初期化処理（SQL関数の登録など）
+        self._write_lock = threading.RLock()
+        self._readers_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = {}  # スレッドID -> (スレッド, 接続)
+        self._writer = self._connect()
+        self._enable_wal(self._writer)
+
+    def _connect(self, read_only=False):
+        """接続を作成"""
+        # 読み取り接続は作成したスレッドでのみ使うが、close()は別スレッドから呼ばれるため同一スレッド制約を外す
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # 辞書形式でアクセス可能に
+        if self.on_connect:
+            self.on_connect(conn)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _enable_wal(self, conn):
+        """WALモードを有効化（読み取りと書き込みが互いを待たなくなる）"""
+        try:
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != 'wal':
+                self.log.warning(f"WAL mode not available, journal mode is {mode}")
+            # WALではコミットごとのfsyncを省いても破損はしない（直近のコミットが失われ得るのみ）
+            conn.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.Error as e:
+            self.log.warning(f"Failed to enable WAL mode: {e}")
+
+    @property
+    def writer(self):
+        """書き込み用接続（write()の中でのみ使用すること）"""
+        return self._writer
+
+    @contextmanager
+    def write(self):
+        """書き込み用接続を排他的に取得する（正常終了でコミット、例外でロールバック）"""
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def reader(self):
+        """呼び出し元スレッド専用の読み取り接続を取得"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        conn = self._connect(read_only=True)
+        self._local.conn = conn
+        current = threading.current_thread()
+        with self._readers_lock:
+            self._prune_readers()
+            self._readers[current.ident] = (current, conn)
+        self.log.debug(f"Created reader connection for thread {current.name} ({len(self._readers)} readers)")
+        return conn
+
+    def _prune_readers(self):
+        """終了したスレッドの読み取り接続を閉じる（_readers_lockを保持して呼ぶ）"""
+        for ident, (thread, conn) in list(self._readers.items()):
+            if not thread.is_alive():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                del self._readers[ident]
+
+    def close(self):
+        """すべての接続を閉じる"""
+        with self._readers_lock:
+            for thread, conn in self._readers.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._readers.clear()
+        self._local = threading.local()
+        with self._write_lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
@@ -4,20 +4,83 @@
 import os
 import datetime
 import threading
-import sqlite3
 from logging import getLogger
 import constants
 import globalVars
+import tcutil
 from views.programCacheManager import ProgramCacheManager
-from views.programDataCollector import ProgramDataCollector
+from views.programDataCollector import ProgramDataCollector, weekly_date_list
+from views.refreshPlanner import RefreshPlanner
 from views.programSearchEngine import ProgramSearchEngine
 
+# SQLiteデータベースファイルの先頭16バイト
+SQLITE_HEADER = b"SQLite format 3\x00"
+# 起動してから全体の整合性検査を行うまでの待ち時間（秒）
+INTEGRITY_CHECK_DELAY = 300
+# データベース本体とあわせて削除するファイルの接尾辞（WALモードのログと共有メモリ）
+DATABASE_FILE_SUFFIXES = ('', '-wal', '-shm')
+
+class BackgroundRefresh:
+    """バックグラウンドで実行する週間データの更新（進捗の通知と取り消し）
+    
+    通知先は更新処理のスレッドから呼ばれる。GUIを操作する場合は呼び出し側でGUIスレッドに移すこと。
+    """
+    
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.progress_listeners = []
+        self.finished_listeners = []
+        self.done = 0
+        self.total = 0
+        # 完了後は (成功したか, 取り消されたか)
+        self.result = None
+    
+    def add_listener(self, on_progress=None, on_finished=None):
+        """通知先を追加（すでに終わっている場合はon_finishedをすぐに呼ぶ）"""
+        with self.lock:
+            result = self.result
+            if result is None:
+                if on_progress:
+                    self.progress_listeners.append(on_progress)
+                if on_finished:
+                    self.finished_listeners.append(on_finished)
+        if result is not None and on_finished:
+            on_finished(*result)
+    
+    def cancel(self):
+        """更新を取り消す（取得済みの分は保存され、残りは次回の更新で取得する）"""
+        self.cancel_event.set()
+    
+    def is_running(self):
+        return self.result is None
+    
+    def notify_progress(self, done, total):
+        self.done, self.total = done, total
+        with self.lock:
+            listeners = list(self.progress_listeners)
+        for listener in listeners:
+            listener(done, total)
+    
+    def finish(self, success):
+        with self.lock:
+            self.result = (success, self.cancel_event.is_set())
+            listeners = list(self.finished_listeners)
+            self.progress_listeners = []
+            self.finished_listeners = []
+        for listener in listeners:
+            listener(*self.result)
+
 class ProgramCacheController:
     """番組キャッシュの制御クラス（起動時チェック・例外処理）"""
     
-    def __init__(self, radio_manager=None):
+    def __init__(self, radio_manager=None, defer_update=False):
+        """defer_updateがTrueの場合、起動時の週間データの収集は行わず、start_pending_update()で開始する"""
         self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramCacheController")
         self.radio_manager = radio_manager
+        self.defer_update = defer_update
+        # 起動時に必要と判定され、まだ開始していない週間データの更新があるか
+        self.update_pending = False
         
         # キャッシュ関連の初期化
         self.cache_manager = None
@@ -30,6 +93,12 @@ class ProgramCacheController:
         
         # データベースファイルのパス
         self.db_path = constants.PROGRAM_CACHE_DB_NAME
+        # 整合性検査で破損が見つかった場合に作成し、次回起動時に作り直す目印
+        self.corrupt_marker_path = f"{self.db_path}.corrupt"
+        self.integrity_timer = None
+        # 検索画面などから要求されたバックグラウンド更新（同時に1つだけ実行する）
+        self.background_refresh = None
+        self.refresh_lock = threading.Lock()
         
         # 初期化を実行
         self._initialize_cache_system()
@@ -88,9 +157,19 @@ class ProgramCacheController:
         return (
             self.last_update_date is None or
             self.last_update_date != today_date or
-            not is_weekly_complete
+            not is_weekly_complete or
+            self._is_refresh_due()
         )
     
+    def _is_refresh_due(self):
+        """更新計画上、取り直しが必要な放送局・放送日があるかチェック"""
+        if not self.radio_manager or not getattr(self.radio_manager, 'stid', None):
+            return False
+        date_list = weekly_date_list()
+        targets = [(station_id, date_str) for date_str in date_list for station_id in self.radio_manager.stid]
+        fetched_at = self.cache_manager.get_station_day_fetch_times(date_list)
+        return bool(RefreshPlanner().plan(targets, fetched_at, tcutil.CalendarUtil().get_radio_date()))
+    
     def _perform_database_update(self):
         """データベース更新を実行"""
         today_date = datetime.datetime.now().strftime('%Y%m%d')
@@ -103,9 +182,11 @@ class ProgramCacheController:
             reasons.append(f"基準日変更 ({self.last_update_date} → {today_date})")
         if not is_weekly_complete:
             reasons.append("週間データ不完全")
+        if self._is_refresh_due():
+            reasons.append("再取得間隔の経過")
         
         self.log.info(f"Database update needed: {', '.join(reasons)}")
-        self._update_database()
+        self._request_database_update()
     
     def _create_fresh_database(self):
         """新しいデータベースを作成"""
@@ -113,18 +194,33 @@ class ProgramCacheController:
             self.log.info("Creating fresh database")
             
             # 既存のデータベースファイルを削除（存在する場合）
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
+            self._close_cache_manager()
+            if self._remove_database_files(self.db_path):
                 self.log.info("Removed existing database file")
             
             # 新しいデータベースを作成
             self.cache_manager = ProgramCacheManager(self.db_path)
-            self._update_database()
+            self._request_database_update()
             
         except Exception as e:
             self.log.error(f"Failed to create fresh database: {e}")
             self._handle_database_error(e)
     
+    def _request_database_update(self):
+        """起動時の週間データの更新（defer_updateの場合はサービスの準備だけ行い、収集は後で開始する）"""
+        if self.defer_update:
+            self.update_pending = True
+            self._initialize_services()
+            return
+        self._update_database()
+    
+    def start_pending_update(self, on_progress=None, on_finished=None):
+        """起動時に必要と判定された週間データの更新をバックグラウンドで開始（不要な場合はNoneを返す）"""
+        if not self.update_pending:
+            return None
+        self.update_pending = False
+        return self.start_background_refresh(on_progress=on_progress, on_finished=on_finished)
+    
     def _update_database(self):
         """データベースを更新（1週間分のデータを取得）"""
         try:
@@ -152,8 +248,8 @@ class ProgramCacheController:
             
             self.log.info(f"Starting weekly data collection from {today.strftime('%Y%m%d')}")
             
-            # 週間データ収集を実行
-            success = self.data_collector.collect_weekly_data(today, force_refresh=True)
+            # 週間データ収集を実行（更新計画に従い、新しく範囲に入った日付と期限切れの日付だけを取得）
+            success = self.data_collector.collect_weekly_data(today)
             
             if success:
                 self.log.info("Weekly database update completed successfully")
@@ -220,6 +316,7 @@ class ProgramCacheController:
                     self.data_collector.set_radio_manager(self.radio_manager)
             
             self.log.info("Cache services initialized successfully")
+            self._schedule_integrity_check()
             
         except Exception as e:
             self.log.error(f"Failed to initialize services: {e}")
@@ -245,14 +342,66 @@ class ProgramCacheController:
             self.log.error(f"Failed to ensure weekly data: {e}")
             return False
     
+    def start_background_refresh(self, force=False, on_progress=None, on_finished=None):
+        """週間データの更新をバックグラウンドで開始し、BackgroundRefreshを返す
+        
+        すでに更新中の場合は新しく開始せず、実行中の更新に通知先を追加する。
+        forceがFalseの場合は更新計画で取り直しが必要な放送局・放送日だけを取得する。
+        on_progress(保存済み, 対象)・on_finished(成功したか, 取り消されたか) は更新処理のスレッドから呼ばれる。
+        """
+        with self.refresh_lock:
+            refresh = self.background_refresh
+            start = refresh is None or not refresh.is_running()
+            if start:
+                refresh = self.background_refresh = BackgroundRefresh()
+        refresh.add_listener(on_progress, on_finished)
+        if start:
+            threading.Thread(target=self._run_background_refresh, args=(refresh, force), daemon=True).start()
+        return refresh
+    
+    def _run_background_refresh(self, refresh, force):
+        """バックグラウンド更新の本体"""
+        success = False
+        try:
+            if not self.radio_manager or not getattr(self.radio_manager, 'stid', None):
+                self.log.warning("Station list not available for background refresh")
+                return
+            if not self.data_collector:
+                self.data_collector = ProgramDataCollector(self.cache_manager)
+                self.data_collector.set_radio_manager(self.radio_manager)
+            
+            self.log.info(f"Starting background weekly refresh (force={force})")
+            success = self.data_collector.collect_weekly_data(
+                force_refresh=force,
+                cancel_event=refresh.cancel_event,
+                on_progress=refresh.notify_progress
+            )
+            if success:
+                self.last_update_date = self.startup_date
+            if not refresh.cancel_event.is_set():
+                # 古いデータをクリーンアップ（14日以上古いデータを削除）
+                self.cache_manager.cleanup_old_data(days=14)
+        except Exception as e:
+            self.log.error(f"Background refresh failed: {e}")
+        finally:
+            refresh.finish(success)
+    
+    def record_station_usage(self, station_id, kind):
+        """放送局の再生・録音を記録（番組表を収集する優先度に使う）"""
+        try:
+            if self.cache_manager:
+                self.cache_manager.record_station_usage(station_id, kind)
+        except Exception as e:
+            self.log.error(f"Failed to record station usage: {e}")
+    
     def _handle_database_error(self, error):
         """データベースエラーの処理"""
         self.log.error(f"Handling database error: {error}")
         
         try:
             # データベースファイルを完全に削除
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
+            self._close_cache_manager()
+            if self._remove_database_files(self.db_path):
                 self.log.info("Database file removed due to error")
             
             # 新しいデータベースを作成
@@ -279,15 +428,14 @@ class ProgramCacheController:
         
         try:
             # データベースファイルを削除
-            if os.path.exists(self.db_path):
-                os.remove(self.db_path)
+            self._close_cache_manager()
+            if self._remove_database_files(self.db_path):
                 self.log.info("Database file removed due to critical error")
             
             # 関連ファイルも削除
             backup_files = [f"{self.db_path}.backup", f"{self.db_path}.old"]
             for backup_file in backup_files:
-                if os.path.exists(backup_file):
-                    os.remove(backup_file)
+                if self._remove_database_files(backup_file):
                     self.log.info(f"Removed backup file: {backup_file}")
             
             # 新しいデータベースを作成
@@ -307,67 +455,90 @@ class ProgramCacheController:
             self.search_engine = None
             self.data_collector = None
     
+    def _close_cache_manager(self):
+        """キャッシュマネージャーの書き込み・読み取り接続をすべて閉じる（ファイルを削除する前に呼ぶ）"""
+        if not self.cache_manager:
+            return
+        try:
+            self.cache_manager.close()
+        except Exception as e:
+            self.log.warning(f"Failed to close database connections: {e}")
+        self.cache_manager = None
+    
+    def _remove_database_files(self, path):
+        """データベースファイルをWALのログ・共有メモリのファイルとあわせて削除（削除したかどうかを返す）
+        
+        古いWALのファイルが残ると、SQLiteが新しいデータベースと組み合わせて再生してしまうため必ず一緒に削除する。
+        """
+        removed = False
+        for suffix in DATABASE_FILE_SUFFIXES:
+            file_path = path + suffix
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                removed = True
+        return removed
+    
     def _validate_database_integrity(self):
-        """データベースの整合性を検証（削除・改変・接続失敗の検出）"""
+        """データベースの簡易検証（削除・改変の検出）
+        
+        起動時間がデータベースの大きさに左右されないよう、ここではファイルヘッダーだけを確認する。
+        スキーマの違いはProgramCacheManagerが移行し、全体の整合性検査は起動後にバックグラウンドで行う。
+        """
         try:
             # データベースファイルの存在チェック
             if not os.path.exists(self.db_path):
                 self.log.warning("Database file does not exist")
                 return False
             
+            # 前回の整合性検査で破損が見つかっている場合は作り直す
+            if os.path.exists(self.corrupt_marker_path):
+                self.log.warning("Database was marked as corrupt by the previous integrity check")
+                os.remove(self.corrupt_marker_path)
+                return False
+            
             # ファイルサイズチェック（空ファイルや破損ファイルの検出）
             file_size = os.path.getsize(self.db_path)
             if file_size == 0:
                 self.log.warning("Database file is empty")
                 return False
             
-            # SQLiteデータベースとして開けるかチェック
-            try:
-                test_conn = sqlite3.connect(self.db_path, check_same_thread=False)
-                cursor = test_conn.cursor()
-                
-                # 基本的なテーブル構造の存在チェック
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                tables = [row[0] for row in cursor.fetchall()]
-                
-                required_tables = ['programs', 'cache_metadata']
-                missing_tables = [table for table in required_tables if table not in tables]
-                
-                if missing_tables:
-                    self.log.warning(f"Missing required tables: {missing_tables}")
-                    test_conn.close()
-                    return False
-                
-                # テーブル構造の整合性チェック
-                cursor.execute("PRAGMA table_info(programs)")
-                programs_columns = [row[1] for row in cursor.fetchall()]
-                required_columns = ['station_id', 'station_name', 'title', 'performer', 'start_time', 'end_time', 'description', 'date']
-                missing_columns = [col for col in required_columns if col not in programs_columns]
-                
-                if missing_columns:
-                    self.log.warning(f"Missing required columns in programs table: {missing_columns}")
-                    test_conn.close()
-                    return False
-                
-                # データベースの整合性チェック
-                cursor.execute("PRAGMA integrity_check")
-                integrity_result = cursor.fetchone()
-                if integrity_result and integrity_result[0] != 'ok':
-                    self.log.warning(f"Database integrity check failed: {integrity_result[0]}")
-                    test_conn.close()
-                    return False
-                
-                test_conn.close()
-                self.log.info("Database integrity validation passed")
-                return True
-                
-            except sqlite3.Error as e:
-                self.log.warning(f"Database connection/validation failed: {e}")
+            # SQLiteデータベースのヘッダーを持つかチェック
+            with open(self.db_path, 'rb') as f:
+                header = f.read(len(SQLITE_HEADER))
+            if header != SQLITE_HEADER:
+                self.log.warning("Database file does not have a valid SQLite header")
                 return False
+            
+            self.log.info("Database header validation passed")
+            return True
                 
         except Exception as e:
             self.log.warning(f"Database integrity check failed with exception: {e}")
             return False
+    
+    def _schedule_integrity_check(self):
+        """起動処理が落ち着いてからバックグラウンドで全体の整合性検査を行う"""
+        if self.integrity_timer is not None:
+            return
+        self.integrity_timer = threading.Timer(INTEGRITY_CHECK_DELAY, self._run_integrity_check)
+        self.integrity_timer.daemon = True
+        self.integrity_timer.start()
+    
+    def _run_integrity_check(self):
+        """全体の整合性検査を実行（破損していれば次回起動時に作り直すよう目印を残す）"""
+        try:
+            cache_manager = self.cache_manager
+            if not cache_manager:
+                return
+            if cache_manager.check_integrity():
+                self.log.info("Background database integrity check passed")
+                return
+            # 使用中のファイルは削除できないため、次回起動時に作り直す
+            with open(self.corrupt_marker_path, 'w', encoding='utf-8') as f:
+                f.write(datetime.datetime.now().isoformat())
+            self.log.warning("Database marked as corrupt, it will be recreated on next startup")
+        except Exception as e:
+            self.log.error(f"Background integrity check failed: {e}")
 
     def _create_empty_services(self):
         """空のサービスを作成（最後の手段）"""
@@ -432,7 +603,7 @@ class ProgramCacheController:
                     today = datetime.datetime.now()
                     today = today.replace(hour=0, minute=0, second=0, microsecond=0)
                     self.log.info(f"Starting deferred weekly data collection from {today.strftime('%Y%m%d')}")
-                    ok = self.data_collector.collect_weekly_data(today, force_refresh=True)
+                    ok = self.data_collector.collect_weekly_data(today)
                     if ok:
                         self.log.info("Deferred weekly database update completed successfully")
                         self.last_update_date = self.startup_date
@@ -501,6 +672,12 @@ class ProgramCacheController:
     def cleanup(self):
         """リソースのクリーンアップ"""
         try:
+            if self.integrity_timer:
+                self.integrity_timer.cancel()
+            
+            if self.background_refresh:
+                self.background_refresh.cancel()
+            
             if self.data_collector:
                 self.data_collector.cleanup()
             
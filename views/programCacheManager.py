@@ -4,11 +4,61 @@
 import sqlite3
 import os
 import datetime
+import hashlib
+import json
+import re
 import threading
+import time
+import zlib
 from logging import getLogger
 import constants
 import globalVars
+import tcutil
 from views import programmanager
+from views.programCacheConnection import ProgramCacheConnectionManager
+from views.programIntervalIndex import IntervalProgram, ProgramIntervalIndex
+
+# 全文検索の対象列
+FULLTEXT_FIELDS = ('title', 'performer', 'description')
+# trigramトークナイザは3文字未満の語を索引で引けないため、それより短い語はLIKEで検索する
+FTS_MIN_TERM_LENGTH = 3
+# bm25の列ごとの重み（title, performer, descriptionの順）
+FTS_BM25_WEIGHTS = (10.0, 5.0, 1.0)
+# スキーマのバージョン（PRAGMA user_versionに記録し、起動時に差分だけ移行する）
+#   1: 放送開始・終了のUNIX時刻列
+#   2: 放送局・出演者・説明の正規化
+#   3: 放送日・放送局・タイトルごとの集計テーブル
+#   4: 放送日ごとのパーティション
+SCHEMA_VERSION = 4
+# 検索結果を1ページとして取得する件数
+SEARCH_PAGE_SIZE = 100
+# この長さ（UTF-8のバイト数）以上の番組説明はzlibで圧縮して保存する
+DESCRIPTION_COMPRESS_THRESHOLD = 256
+# 放送日パーティションのテーブル名に使う放送日（YYYYMMDD）
+PARTITION_DATE_PATTERN = re.compile(r'\d{8}')
+# 番組IDは「放送日 × この値 + 連番」とし、IDから放送日のパーティションを求められるようにする
+PARTITION_ID_SPAN = 10 ** 6
+# パーティションの削除で空いたページのうち、ファイル全体に対してこの割合までは次のパーティション用に残す
+FREE_PAGE_RESERVE_RATIO = 0.25
+# 収集計画で取得に失敗した単位を再試行する回数の上限
+CRAWL_MAX_ATTEMPTS = 3
+
+def encode_description(text):
+    """番組説明を保存形式に変換する（戻り値: (本文, 圧縮済みなら1)）"""
+    data = text.encode('utf-8')
+    if len(data) >= DESCRIPTION_COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return compressed, 1
+    return text, 0
+
+def decode_description(body, compressed):
+    """保存形式の番組説明を文字列に戻す"""
+    if body is None:
+        return ''
+    if compressed:
+        return zlib.decompress(body).decode('utf-8')
+    return body
 
 class ProgramCacheManager:
     """番組表データのSQLite3キャッシュ管理クラス"""
@@ -16,40 +66,192 @@ class ProgramCacheManager:
     def __init__(self, db_path=None):
         self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramCacheManager")
         self.db_path = db_path or constants.PROGRAM_CACHE_DB_NAME
-        self.lock = threading.Lock()
-        self.conn = None
+        self.connections = None
+        self.fts_enabled = False
+        self.partition_dates = []  # 放送日パーティションの一覧（昇順、書き込み接続でのみ更新する）
+        # 番組データが変わるたびに増える世代番号（検索結果キャッシュの無効化に使う）
+        self.generation = 0
+        # 放送時間帯のメモリ内インデックス（最初に使われたときに作り、以後は取り込みのたびに差し替える）
+        self.interval_index = None
+        # インデックスへの変更はコミットと同じ順に反映する。作成中の変更は作り終えた時点で反映するため保留する
+        self._index_lock = threading.Lock()
+        self._index_build_lock = threading.Lock()
+        self._index_pending = None
         self._init_database()
     
     def _init_database(self):
         """データベースの初期化"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row  # 辞書形式でアクセス可能に
-            self._create_tables()
-            self._create_indexes()
+            self.connections = ProgramCacheConnectionManager(self.db_path, on_connect=self._register_functions)
+            with self.connections.write() as conn:
+                # 空きページを少しずつ解放できるようにする（設定は次のVACUUMで反映される）
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                self.fts_enabled = self._check_fulltext_support(conn)
+                # 移行処理もprogramsビューを参照するため、移行の前後でパーティションの一覧を読む
+                self.partition_dates = self._list_partitions(conn.cursor())
+                migrated = self._migrate_schema(conn)
+                self.partition_dates = self._list_partitions(conn.cursor())
+                self._create_tables(conn)
+                self._create_missing_fulltext_indexes(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                needs_vacuum = migrated or conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+            if needs_vacuum:
+                # 移行で空いたページを解放し、auto_vacuumの設定を反映する（新規作成時はほぼ空のため一瞬で終わる）
+                with self.connections.write() as conn:
+                    conn.execute("VACUUM")
             self.log.info(f"Database initialized: {self.db_path}")
         except sqlite3.Error as e:
             self.log.error(f"Database initialization failed: {e}")
             raise
     
-    def _create_tables(self):
+    def _migrate_schema(self, conn):
+        """user_versionに記録されたバージョンから現在のスキーマまで順に移行する（データは保持する）
+        
+        戻り値: 既存データを書き換える移行を行った場合はTrue
+        """
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise sqlite3.DatabaseError(
+                f"Database schema version {version} is newer than supported version {SCHEMA_VERSION}"
+            )
+        if version == SCHEMA_VERSION:
+            return False
+        
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name IN ('programs', 'programs_legacy')")
+        if cursor.fetchone() is None:
+            # 新規作成（テーブルは_create_tablesで現在のスキーマのまま作る）
+            return False
+        
+        # バージョンごとの移行処理（バージョン管理前のデータベースは0から順に適用する）
+        migrations = [
+            (1, self._add_broadcast_epoch_columns),
+            (2, self._migrate_denormalized_programs),
+            (3, self._rebuild_statistics),
+            (4, self._partition_programs),
+        ]
+        migrated = False
+        for target_version, migration in migrations:
+            if version < target_version:
+                self.log.info(f"Migrating program cache schema to version {target_version}")
+                migrated = bool(migration(conn)) or migrated
+                conn.execute(f"PRAGMA user_version = {target_version}")
+                conn.commit()
+        return migrated
+    
+    @staticmethod
+    def _register_functions(conn):
+        """接続ごとにSQL関数を登録する（program_detailsビューが使用する）"""
+        conn.create_function('decode_description', 2, decode_description, deterministic=True)
+    
+    def _create_tables(self, conn):
         """テーブル作成"""
-        cursor = self.conn.cursor()
+        cursor = conn.cursor()
         
-        # 番組データテーブル
+        # 放送局テーブル（番組からは整数キーで参照する）
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS programs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                station_id TEXT NOT NULL,
-                station_name TEXT NOT NULL,
+            CREATE TABLE IF NOT EXISTS stations (
+                id INTEGER PRIMARY KEY,
+                station_id TEXT NOT NULL UNIQUE,
+                station_name TEXT NOT NULL
+            )
+        ''')
+        
+        # 出演者テーブル（同じ出演者の文字列を番組間で共有する）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS performers (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        
+        # 番組説明テーブル（帯番組などで同一の説明を共有し、長い説明は圧縮して保持する）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS descriptions (
+                id INTEGER PRIMARY KEY,
+                hash TEXT NOT NULL UNIQUE,
+                body BLOB NOT NULL,
+                compressed INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # 番組データは放送日ごとのパーティション（programs_YYYYMMDD）に保持し、programsビューでまとめて参照する
+        # パーティション導入前のprogramsテーブルが残っている間（移行の途中）はビューを作らない
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = 'programs'")
+        row = cursor.fetchone()
+        if row is None or row[0] == 'view':
+            self._refresh_partition_view(cursor, self.partition_dates)
+        
+        # 放送日・放送局ごとの番組数（各パーティションへのトリガーで維持する）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS program_day_stats (
+                date TEXT NOT NULL,
+                station_key INTEGER NOT NULL,
+                program_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (date, station_key)
+            )
+        ''')
+        
+        # 放送局・タイトルごとの放送回数（各パーティションへのトリガーで維持する）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS title_stats (
+                station_key INTEGER NOT NULL,
                 title TEXT NOT NULL,
-                performer TEXT,
-                start_time DATETIME NOT NULL,
-                end_time DATETIME NOT NULL,
-                description TEXT,
+                program_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (station_key, title)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_title_stats_count ON title_stats(program_count)")
+        
+        # 検索用の番組ビュー（放送局名・出演者・説明を展開した形で参照する）
+        # descriptionは参照された場合にのみ展開される
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS program_details AS
+            SELECT p.id, s.station_id, s.station_name, p.title,
+                   COALESCE(pf.name, '') AS performer,
+                   p.start_time, p.end_time, p.start_epoch, p.end_epoch, p.date,
+                   p.description_id, decode_description(d.body, d.compressed) AS description,
+                   p.created_at, p.updated_at
+            FROM programs p
+            JOIN stations s ON s.id = p.station_key
+            LEFT JOIN performers pf ON pf.id = p.performer_id
+            LEFT JOIN descriptions d ON d.id = p.description_id
+        ''')
+        
+        # 放送局・放送日ごとの取得状況テーブル（内容ハッシュで差分取り込みを判定する）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS station_days (
+                station_id TEXT NOT NULL,
                 date TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                content_hash TEXT NOT NULL,
+                program_count INTEGER NOT NULL DEFAULT 0,
+                fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (station_id, date)
+            )
+        ''')
+        
+        # 週間収集の計画（放送局・放送日ごとの完了状態。中断しても次回はpendingから再開する）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_plan (
+                station_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (station_id, date)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_plan_priority ON crawl_plan(status, priority)")
+        
+        # 放送局ごとの再生・録音回数（収集の優先度に使う）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS station_usage (
+                station_id TEXT PRIMARY KEY,
+                play_count INTEGER NOT NULL DEFAULT 0,
+                record_count INTEGER NOT NULL DEFAULT 0,
+                last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
@@ -62,290 +264,1143 @@ class ProgramCacheManager:
             )
         ''')
         
-        self.conn.commit()
+        conn.commit()
+    
+    def _add_broadcast_epoch_columns(self, conn):
+        """放送開始・終了のUNIX時刻列を追加し、既存の番組に値を埋める（旧スキーマからの移行）"""
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(programs)")
+        columns = [row[1] for row in cursor.fetchall()]
+        for column in ('start_epoch', 'end_epoch'):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE programs ADD COLUMN {column} INTEGER")
+        
+        cursor.execute("SELECT id, date, start_time, end_time FROM programs WHERE start_epoch IS NULL")
+        rows = cursor.fetchall()
+        if rows:
+            calendar_util = tcutil.CalendarUtil()
+            updates = []
+            for row in rows:
+                start_epoch, end_epoch = calendar_util.get_broadcast_epochs(row['date'], row['start_time'], row['end_time'])
+                updates.append((start_epoch, end_epoch, row['id']))
+            cursor.executemany("UPDATE programs SET start_epoch = ?, end_epoch = ? WHERE id = ?", updates)
+            self.log.info(f"Filled broadcast epochs for {len(updates)} existing programs")
+        
+        conn.commit()
+        return bool(rows)
+    
+    def _create_statistics_triggers(self, cursor, date):
+        """パーティションの番組の追加・更新・削除に合わせて集計テーブルを更新するトリガーを作成"""
+        table = self._partition_table(date)
+        increment = f'''
+            INSERT INTO program_day_stats (date, station_key, program_count) VALUES ('{date}', new.station_key, 1)
+            ON CONFLICT(date, station_key) DO UPDATE SET program_count = program_count + 1;
+            INSERT INTO title_stats (station_key, title, program_count) VALUES (new.station_key, new.title, 1)
+            ON CONFLICT(station_key, title) DO UPDATE SET program_count = program_count + 1;
+        '''
+        decrement = f'''
+            UPDATE program_day_stats SET program_count = program_count - 1
+            WHERE date = '{date}' AND station_key = old.station_key;
+            DELETE FROM program_day_stats
+            WHERE date = '{date}' AND station_key = old.station_key AND program_count <= 0;
+            UPDATE title_stats SET program_count = program_count - 1
+            WHERE station_key = old.station_key AND title = old.title;
+            DELETE FROM title_stats
+            WHERE station_key = old.station_key AND title = old.title AND program_count <= 0;
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table}
+            BEGIN {increment} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table}
+            BEGIN {decrement} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE OF title, station_key ON {table}
+            WHEN old.title IS NOT new.title OR old.station_key IS NOT new.station_key
+            BEGIN {decrement} {increment} END
+        ''')
+    
+    def _rebuild_statistics(self, conn):
+        """集計テーブルを現在の番組から作り直す（集計テーブル導入前のデータベースの移行）"""
+        self._create_tables(conn)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM program_day_stats")
+        cursor.execute("DELETE FROM title_stats")
+        cursor.execute('''
+            INSERT INTO program_day_stats (date, station_key, program_count)
+            SELECT date, station_key, COUNT(*) FROM programs GROUP BY date, station_key
+        ''')
+        cursor.execute('''
+            INSERT INTO title_stats (station_key, title, program_count)
+            SELECT station_key, title, COUNT(*) FROM programs GROUP BY station_key, title
+        ''')
+        conn.commit()
+        return False
     
-    def _create_indexes(self):
-        """検索用インデックス作成"""
-        cursor = self.conn.cursor()
+    def _migrate_denormalized_programs(self, conn):
+        """旧スキーマ（番組ごとに放送局名・出演者・説明を保持）から正規化スキーマへ移行する
+        
+        戻り値: 移行を行った場合はTrue
+        """
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(programs)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'station_name' in columns:
+            # 旧来の全文検索索引はprogramsを外部コンテンツとしているため作り直す
+            cursor.execute("DROP TABLE IF EXISTS programs_fts")
+            cursor.execute("ALTER TABLE programs RENAME TO programs_legacy")
+            conn.commit()
         
-        # 検索用インデックス
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='programs_legacy'")
+        if cursor.fetchone() is None:
+            return False
+        
+        # 正規化した番組は一旦単一のテーブルに移す（放送日ごとのパーティションへの分割は後続の移行で行う）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS programs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                station_key INTEGER NOT NULL REFERENCES stations(id),
+                title TEXT NOT NULL,
+                performer_id INTEGER REFERENCES performers(id),
+                start_time DATETIME NOT NULL,
+                end_time DATETIME NOT NULL,
+                start_epoch INTEGER,
+                end_epoch INTEGER,
+                description_id INTEGER REFERENCES descriptions(id),
+                date TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._create_tables(conn)
+        cursor.execute('''
+            INSERT OR IGNORE INTO stations (station_id, station_name)
+            SELECT station_id, MAX(station_name) FROM programs_legacy GROUP BY station_id
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO performers (name)
+            SELECT DISTINCT performer FROM programs_legacy WHERE performer IS NOT NULL AND performer != ''
+        ''')
+        cursor.execute("SELECT station_id, id FROM stations")
+        station_keys = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute("SELECT name, id FROM performers")
+        performer_ids = {row[0]: row[1] for row in cursor.fetchall()}
+        
+        cursor.execute('''
+            SELECT id, station_id, title, performer, start_time, end_time,
+                   start_epoch, end_epoch, description, date, created_at, updated_at
+            FROM programs_legacy
+        ''')
+        description_ids = {}
+        rows = []
+        for row in cursor.fetchall():
+            description = row['description'] or ''
+            if description not in description_ids:
+                description_ids[description] = self._intern_description(cursor, description)
+            rows.append((
+                row['id'], station_keys[row['station_id']], row['title'], performer_ids.get(row['performer']),
+                row['start_time'], row['end_time'], row['start_epoch'], row['end_epoch'],
+                description_ids[description], row['date'], row['created_at'], row['updated_at']
+            ))
+        cursor.executemany('''
+            INSERT INTO programs
+            (id, station_key, title, performer_id, start_time, end_time,
+             start_epoch, end_epoch, description_id, date, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.execute("DROP TABLE programs_legacy")
+        conn.commit()
+        
+        self.log.info(
+            f"Migrated {len(rows)} programs to normalized schema "
+            f"({len(station_keys)} stations, {len(performer_ids)} performers, {len(description_ids)} descriptions)"
+        )
+        return True
+    
+    def _partition_programs(self, conn):
+        """単一のprogramsテーブルを放送日ごとのパーティションに分割する（パーティション導入前のデータベースの移行）
+        
+        番組IDは放送日を含む形に振り直す。全文検索索引と集計テーブルもパーティション単位で作り直す。
+        戻り値: 移行を行った場合はTrue
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='programs'")
+        if cursor.fetchone() is None:
+            return False
+        
+        # 旧来の全文検索索引・ビューは単一のテーブルを参照しているため作り直す
+        cursor.execute("DROP TABLE IF EXISTS programs_fts")
+        cursor.execute("DROP VIEW IF EXISTS program_details")
+        # 集計テーブルはパーティションへの挿入時のトリガーで数え直す
+        cursor.execute("DELETE FROM program_day_stats")
+        cursor.execute("DELETE FROM title_stats")
+        
+        cursor.execute("SELECT DISTINCT date FROM programs ORDER BY date")
+        dates = [row[0] for row in cursor.fetchall() if row[0] and PARTITION_DATE_PATTERN.fullmatch(row[0])]
+        migrated_count = 0
+        for date in dates:
+            table = self._create_partition(cursor, date)
+            # 旧来の全削除・全挿入で重複が残っている場合は最新の行だけを移す
+            cursor.execute(f'''
+                INSERT INTO {table}
+                (id, station_key, title, performer_id, start_time, end_time,
+                 start_epoch, end_epoch, description_id, created_at, updated_at)
+                SELECT ? + ROW_NUMBER() OVER (ORDER BY id), station_key, title, performer_id, start_time, end_time,
+                       start_epoch, end_epoch, description_id, created_at, updated_at
+                FROM programs
+                WHERE id IN (
+                    SELECT MAX(id) FROM programs WHERE date = ? GROUP BY station_key, start_time, end_time
+                )
+            ''', (int(date) * PARTITION_ID_SPAN, date))
+            migrated_count += cursor.rowcount
+            self._build_partition_fulltext(cursor, date)
+        
+        cursor.execute("DROP TABLE programs")
+        self._refresh_partition_view(cursor, dates)
+        conn.commit()
+        
+        self.log.info(f"Partitioned {migrated_count} programs into {len(dates)} broadcast days")
+        return True
+    
+    @staticmethod
+    def _partition_table(date):
+        """放送日パーティションのテーブル名（放送日はテーブル名に埋め込むため形式を検査する）"""
+        if not isinstance(date, str) or not PARTITION_DATE_PATTERN.fullmatch(date):
+            raise ValueError(f"Invalid broadcast date: {date!r}")
+        return f"programs_{date}"
+    
+    @classmethod
+    def _fulltext_table(cls, date):
+        """放送日パーティションの全文検索索引のテーブル名"""
+        cls._partition_table(date)
+        return f"programs_fts_{date}"
+    
+    @staticmethod
+    def _list_partitions(cursor):
+        """データベースにある放送日パーティションの放送日を昇順で返す"""
+        cursor.execute('''
+            SELECT name FROM sqlite_master
+            WHERE type='table' AND name GLOB 'programs_[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'
+            ORDER BY name
+        ''')
+        return [row[0][len('programs_'):] for row in cursor.fetchall()]
+    
+    def _create_partition(self, cursor, date):
+        """放送日パーティション（番組テーブル・インデックス・集計トリガー・全文検索索引）を作成し、テーブル名を返す"""
+        table = self._partition_table(date)
+        # 放送日はテーブルで決まるため列には持たない（programsビューで補う）
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                station_key INTEGER NOT NULL REFERENCES stations(id),
+                title TEXT NOT NULL,
+                performer_id INTEGER REFERENCES performers(id),
+                start_time DATETIME NOT NULL,
+                end_time DATETIME NOT NULL,
+                start_epoch INTEGER,
+                end_epoch INTEGER,
+                description_id INTEGER REFERENCES descriptions(id),
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 番組の同一性（放送局・開始・終了時刻）の一意インデックスと検索用インデックス
+        # 出演者・放送局名は正規化したテーブル側で一意になっているためパーティションには持たない
         indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_title ON programs(title)",
-            "CREATE INDEX IF NOT EXISTS idx_performer ON programs(performer)",
-            "CREATE INDEX IF NOT EXISTS idx_time_range ON programs(start_time, end_time)",
-            "CREATE INDEX IF NOT EXISTS idx_station_date ON programs(station_id, date)",
-            "CREATE INDEX IF NOT EXISTS idx_station_name ON programs(station_name)",
-            "CREATE INDEX IF NOT EXISTS idx_fulltext ON programs(title, performer, description)"
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_identity ON {table}(station_key, start_time, end_time)",
+            f"CREATE INDEX IF NOT EXISTS {table}_title ON {table}(title)",
+            f"CREATE INDEX IF NOT EXISTS {table}_time_range ON {table}(start_time, end_time)",
+            f"CREATE INDEX IF NOT EXISTS {table}_epoch_range ON {table}(start_epoch, end_epoch)"
         ]
-        
         for index_sql in indexes:
             cursor.execute(index_sql)
         
-        self.conn.commit()
+        self._create_statistics_triggers(cursor, date)
+        self._create_partition_fulltext(cursor, date)
+        return table
+    
+    def _create_partition_fulltext(self, cursor, date):
+        """パーティションの番組タイトル・出演者・説明のFTS5全文検索索引を作成"""
+        if not self.fts_enabled:
+            return
+        # 本文を持たないcontentless索引（本文は正規化したテーブルにのみ保持する）
+        # 日本語の部分一致に対応するためtrigramトークナイザを使用
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {self._fulltext_table(date)} USING fts5(
+                title, performer, description,
+                content='',
+                tokenize='trigram'
+            )
+        ''')
+    
+    def _fulltext_source(self, date):
+        """パーティションの番組を全文検索索引の値（id, title, performer, description）に展開するSELECT文"""
+        return f'''
+            SELECT p.id AS id, p.title AS title, COALESCE(pf.name, '') AS performer,
+                   decode_description(d.body, d.compressed) AS description
+            FROM {self._partition_table(date)} p
+            LEFT JOIN performers pf ON pf.id = p.performer_id
+            LEFT JOIN descriptions d ON d.id = p.description_id
+        '''
+    
+    def _build_partition_fulltext(self, cursor, date):
+        """パーティションの既存の番組から全文検索索引を構築する"""
+        if not self.fts_enabled:
+            return
+        cursor.execute(f'''
+            INSERT INTO {self._fulltext_table(date)}(rowid, title, performer, description)
+            SELECT id, title, performer, description FROM ({self._fulltext_source(date)})
+        ''')
+    
+    def _check_fulltext_support(self, conn):
+        """FTS5のtrigramトークナイザが使えるかを確認する"""
+        try:
+            conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(body, tokenize='trigram')")
+            conn.execute("DROP TABLE temp.fts_probe")
+            return True
+        except sqlite3.Error as e:
+            # FTS5/trigram非対応のSQLiteではLIKE検索にフォールバックする
+            self.log.warning(f"Full-text index unavailable, falling back to LIKE search: {e}")
+            return False
+    
+    def _create_missing_fulltext_indexes(self, conn):
+        """全文検索索引のないパーティションに索引を作成する（FTS5が使えるSQLiteに更新された場合など）"""
+        if not self.fts_enabled:
+            return
+        cursor = conn.cursor()
+        for date in self.partition_dates:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (self._fulltext_table(date),))
+            if cursor.fetchone() is None:
+                self.log.info(f"Building full-text index for partition {date}")
+                self._create_partition_fulltext(cursor, date)
+                self._build_partition_fulltext(cursor, date)
+        conn.commit()
+    
+    def _refresh_partition_view(self, cursor, dates):
+        """programsビューを指定した放送日パーティションの和として作り直す
+        
+        ビューに対する放送日などの条件は各パーティションへ押し下げられるため、該当しない放送日は読まれない。
+        """
+        columns = "id, station_key, title, performer_id, start_time, end_time, start_epoch, end_epoch, description_id"
+        if dates:
+            body = "\nUNION ALL\n".join(
+                f"SELECT {columns}, '{date}' AS date, created_at, updated_at FROM {self._partition_table(date)}"
+                for date in dates
+            )
+        else:
+            body = "SELECT " + ", ".join(
+                f"NULL AS {column}" for column in columns.split(", ") + ['date', 'created_at', 'updated_at']
+            ) + " WHERE 0"
+        cursor.execute("DROP VIEW IF EXISTS programs")
+        cursor.execute(f"CREATE VIEW programs AS {body}")
+    
+    def _ensure_partition(self, cursor, date):
+        """放送日パーティションがなければ作成する"""
+        if date in self.partition_dates:
+            return
+        self._create_partition(cursor, date)
+        dates = sorted(self.partition_dates + [date])
+        self._refresh_partition_view(cursor, dates)
+        # 一覧と実際のテーブルが食い違わないよう、パーティションの作成は取り込みの成否によらず確定させる
+        cursor.connection.commit()
+        self.partition_dates = dates
+        self.log.info(f"Created program partition for {date}")
+    
+    def _drop_partition(self, cursor, date):
+        """放送日パーティションを削除し、削除した番組数を返す（行ごとの削除ではなくテーブルごと削除する）"""
+        table = self._partition_table(date)
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        program_count = cursor.fetchone()[0]
+        # 行ごとの削除トリガーを通さず、集計テーブルから放送日分をまとめて差し引く
+        cursor.execute(f'''
+            UPDATE title_stats SET program_count = title_stats.program_count - d.program_count
+            FROM (SELECT station_key, title, COUNT(*) AS program_count FROM {table} GROUP BY station_key, title) AS d
+            WHERE title_stats.station_key = d.station_key AND title_stats.title = d.title
+        ''')
+        cursor.execute("DELETE FROM title_stats WHERE program_count <= 0")
+        cursor.execute("DELETE FROM program_day_stats WHERE date = ?", (date,))
+        cursor.execute(f"DROP TABLE IF EXISTS {self._fulltext_table(date)}")
+        cursor.execute(f"DROP TABLE {table}")
+        return program_count
+    
+    def _reclaim_free_pages(self):
+        """空きページのうち、次の放送日のパーティションが再利用する分を超えた分だけファイルから解放する
+        
+        削除したパーティションの空きページは通常そのまま新しいパーティションに再利用されるため、
+        VACUUMで全体を書き直さなくてもファイルサイズは一定に保たれる。
+        """
+        try:
+            with self.connections.write() as conn:
+                page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                excess = free_pages - int(page_count * FREE_PAGE_RESERVE_RATIO)
+                if excess > 0:
+                    conn.execute(f"PRAGMA incremental_vacuum({excess})").fetchall()
+                    self.log.info(f"Reclaimed {excess} free pages")
+        except sqlite3.Error as e:
+            self.log.warning(f"Failed to reclaim free pages: {e}")
+    
+    def _remove_fulltext_ids(self, cursor, date, program_ids):
+        """パーティションの指定した番組IDを全文検索索引から取り除く（削除・更新前に呼ぶ）
+        
+        contentless索引は登録時と同じ値を渡さないと削除できないため、現在の値を展開して渡す。
+        """
+        if not self.fts_enabled or not program_ids:
+            return
+        fts_table = self._fulltext_table(date)
+        cursor.executemany(f'''
+            INSERT INTO {fts_table}({fts_table}, rowid, title, performer, description)
+            SELECT 'delete', id, title, performer, description
+            FROM ({self._fulltext_source(date)}) WHERE id = ?
+        ''', [(program_id,) for program_id in program_ids])
+    
+    def _add_fulltext_entries(self, cursor, date, entries):
+        """(id, title, performer, description)の組をパーティションの全文検索索引に登録する"""
+        if not self.fts_enabled or not entries:
+            return
+        cursor.executemany(f'''
+            INSERT INTO {self._fulltext_table(date)}(rowid, title, performer, description)
+            VALUES (?, ?, ?, ?)
+        ''', entries)
+    
+    def _fulltext_subquery(self, date):
+        """パーティションの全文検索索引をMATCH式（?1）で絞り込み、IDとbm25の関連度を返すSELECT文"""
+        weights = ", ".join(str(w) for w in FTS_BM25_WEIGHTS)
+        fts_table = self._fulltext_table(date)
+        return (
+            f"SELECT rowid AS fts_rowid, bm25({fts_table}, {weights}) AS fts_rank "
+            f"FROM {fts_table} WHERE {fts_table} MATCH ?1"
+        )
+    
+    def _partition_details_source(self, date):
+        """1つの放送日パーティションをprogram_detailsビューと同じ列で参照するSELECT文"""
+        return f'''
+            SELECT p.id, s.station_id, s.station_name, p.title,
+                   COALESCE(pf.name, '') AS performer,
+                   p.start_time, p.end_time, p.start_epoch, p.end_epoch, '{date}' AS date,
+                   p.description_id, decode_description(d.body, d.compressed) AS description
+            FROM {self._partition_table(date)} p
+            JOIN stations s ON s.id = p.station_key
+            LEFT JOIN performers pf ON pf.id = p.performer_id
+            LEFT JOIN descriptions d ON d.id = p.description_id
+        '''
+    
+    @staticmethod
+    def quote_fulltext_term(term):
+        """検索語をFTS5のフレーズとして扱えるよう引用符で囲む"""
+        return '"' + term.replace('"', '""') + '"'
+    
+    def build_fulltext_filter(self, terms, operator='AND'):
+        """(列名, 検索語)の組から全文検索条件を組み立てる
+        
+        索引で引ける語はFTS5のMATCH式に、短すぎる語はLIKE条件に振り分ける。
+        戻り値: (MATCH式またはNone, LIKE条件のリスト, LIKE条件のパラメータ)
+        """
+        match_terms = []
+        like_conditions = []
+        like_params = []
+        for field, term in terms:
+            if not term:
+                continue
+            if self.fts_enabled and len(term) >= FTS_MIN_TERM_LENGTH:
+                match_terms.append(f"{field} : {self.quote_fulltext_term(term)}")
+            else:
+                like_conditions.append(f"p.{field} LIKE ?")
+                like_params.append(f"%{term}%")
+        match_expr = f" {operator} ".join(match_terms) if match_terms else None
+        return match_expr, like_conditions, like_params
+    
+    def fulltext_join_clause(self, outer=False):
+        """MATCH式（パラメータ1個）で絞り込んだ全文検索結果をprogramsに結合するJOIN句
+        
+        索引は放送日パーティションごとにあるため、各索引の検索結果をUNION ALLでまとめる。
+        MATCH式はすべての索引で同じ値を?1で参照するため、パラメータの先頭に置くこと（JOIN句より前に他のパラメータを置かない）。
+        結合後はfts.fts_rankでbm25の関連度順に並べ替えられる（小さいほど関連度が高い。放送日ごとに計算した値を比べる）。
+        副問い合わせが外側に平坦化されると集約・DISTINCTと組み合わせた際にbm25が使えなくなるため、
+        LIMIT -1で平坦化を抑止している。
+        """
+        join = "LEFT JOIN" if outer else "JOIN"
+        if self.partition_dates:
+            union = "\nUNION ALL\n".join(self._fulltext_subquery(date) for date in self.partition_dates)
+        else:
+            union = "SELECT NULL AS fts_rowid, NULL AS fts_rank WHERE ?1 IS NULL AND 0"
+        return f'''
+            {join} (
+                {union}
+                LIMIT -1
+            ) AS fts ON fts.fts_rowid = p.id
+        '''
     
     def update_programs_data(self, programs_data, date):
-        """番組データの一括更新"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-                
-                # 既存データを削除（指定日付のデータのみ）
-                cursor.execute("DELETE FROM programs WHERE date = ?", (date,))
+        """番組データの差分更新
+        
+        放送局ごとに内容ハッシュを比較し、変化のない放送局はスキップする。
+        変化した放送局は番組の同一性（開始・終了時刻）をキーに行単位で追加・更新・削除する。
+        programs_dataに含まれない放送局の既存データはそのまま残す。
+        
+        戻り値: 追加・更新・削除件数などの集計（dict）
+        """
+        try:
+            with self.connections.write() as conn:
+                cursor = conn.cursor()
+                self._ensure_partition(cursor, date)
+                stats = {
+                    'inserted': 0,
+                    'updated': 0,
+                    'deleted': 0,
+                    'unchanged_stations': 0,
+                    'changed_stations': 0
+                }
+                changed_stations = {}
                 
-                # 新しいデータを挿入
-                insert_data = []
                 for station_id, station_data in programs_data.items():
                     station_name = station_data.get('name', '')
-                    for program in station_data.get('programs', []):
-                        insert_data.append((
-                            station_id,
-                            station_name,
-                            program.get('title', ''),
-                            program.get('performer', ''),
-                            program.get('start_time', ''),
-                            program.get('end_time', ''),
-                            program.get('description', ''),
-                            date
-                        ))
+                    programs = station_data.get('programs', [])
+                    content_hash = self._compute_station_day_hash(station_name, programs)
+                
+                    cursor.execute(
+                        "SELECT content_hash FROM station_days WHERE station_id = ? AND date = ?",
+                        (station_id, date)
+                    )
+                    row = cursor.fetchone()
+                    if row and row['content_hash'] == content_hash:
+                        # 内容に変化がなければ取得日時だけを記録する
+                        cursor.execute(
+                            "UPDATE station_days SET fetched_at = CURRENT_TIMESTAMP WHERE station_id = ? AND date = ?",
+                            (station_id, date)
+                        )
+                        stats['unchanged_stations'] += 1
+                        continue
                 
-                cursor.executemany('''
-                    INSERT INTO programs 
-                    (station_id, station_name, title, performer, start_time, end_time, description, date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', insert_data)
+                    inserted, updated, deleted = self._apply_station_day_diff(cursor, station_id, station_name, programs, date)
+                    stats['inserted'] += inserted
+                    stats['updated'] += updated
+                    stats['deleted'] += deleted
+                    stats['changed_stations'] += 1
+                    changed_stations[station_id] = (station_name, programs)
+                
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO station_days
+                        (station_id, date, content_hash, program_count, fetched_at, updated_at)
+                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                    ''', (station_id, date, content_hash, len(programs)))
+                
+                # 収集計画の完了状態は番組データと同じトランザクションで記録する（中断しても食い違わない）
+                cursor.executemany(
+                    "UPDATE crawl_plan SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE station_id = ? AND date = ?",
+                    [(station_id, date) for station_id in programs_data]
+                )
+                # 同時に取り込まれても古い内容で上書きしないよう、インデックスもコミットと同じ順に反映する
+                self._update_interval_index(changed_stations, date)
                 
                 # メタデータを更新
                 cursor.execute('''
                     INSERT OR REPLACE INTO cache_metadata (key, value, updated_at)
                     VALUES (?, ?, CURRENT_TIMESTAMP)
                 ''', ('last_update', datetime.datetime.now().strftime('%Y%m%d')))
-                
-                self.conn.commit()
-                self.log.info(f"Updated {len(insert_data)} programs for date {date}")
-                
-            except sqlite3.Error as e:
-                self.log.error(f"Failed to update programs data: {e}")
-                self.conn.rollback()
-                raise
+            
+            # コミット後に世代を進める（コミット前だと古い結果が新しい世代でキャッシュされ得る）
+            if stats['inserted'] or stats['updated'] or stats['deleted']:
+                self.generation += 1
+            
+            self.log.info(
+                f"Updated programs for date {date}: inserted={stats['inserted']}, updated={stats['updated']}, "
+                f"deleted={stats['deleted']}, changed_stations={stats['changed_stations']}, "
+                f"unchanged_stations={stats['unchanged_stations']}"
+            )
+            return stats
+            
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to update programs data: {e}")
+            raise
     
-    def search_programs(self, search_criteria):
-        """番組検索実行"""
-        with self.lock:
+    def _update_interval_index(self, changed_stations, date):
+        """取り込んだ放送局・放送日の番組を放送時間帯のインデックスに反映（書き込み接続を持った状態で呼ぶ）"""
+        with self._index_lock:
+            if self.interval_index is None and self._index_pending is None:
+                return
+            for station_id, (station_name, programs) in changed_stations.items():
+                entries = []
+                for program in programs:
+                    start_epoch, end_epoch = self._get_program_epochs(program, date)
+                    if start_epoch is None or end_epoch is None:
+                        continue
+                    entries.append(IntervalProgram(
+                        station_id, station_name, program.get('title', ''), program.get('performer', ''),
+                        start_epoch, end_epoch, date
+                    ))
+                self._apply_index_change(
+                    lambda index, station_id=station_id, entries=entries: index.replace_station_day(station_id, date, entries)
+                )
+    
+    def _apply_index_change(self, change):
+        """インデックスに変更を反映する（作成中なら保留し、作り終えた時点で反映する。_index_lockを保持して呼ぶ）"""
+        if self.interval_index is not None:
+            change(self.interval_index)
+        elif self._index_pending is not None:
+            self._index_pending.append(change)
+    
+    def get_interval_index(self, build=True):
+        """放送時間帯のメモリ内インデックスを取得（最初の呼び出しでデータベースから作る）
+        
+        読み取り接続で作るため取り込みを待たせないが、番組数に応じて時間がかかる。
+        GUIスレッドからはbuild=Falseで呼び、まだ作られていなければNoneを受け取ること。
+        """
+        if self.interval_index is not None or not build:
+            return self.interval_index
+        with self._index_build_lock:
+            if self.interval_index is not None:
+                return self.interval_index
+            # 読み込みを始める前から変更を保留し、読み込み後の取り込みが反映漏れにならないようにする
+            with self._index_lock:
+                self._index_pending = []
+            index = ProgramIntervalIndex()
             try:
-                cursor = self.conn.cursor()
-                
-                # 検索条件の構築
-                where_conditions = []
-                params = []
-                
-                if search_criteria.get('title'):
-                    where_conditions.append("title LIKE ?")
-                    params.append(f"%{search_criteria['title']}%")
-                
-                if search_criteria.get('performer'):
-                    where_conditions.append("performer LIKE ?")
-                    params.append(f"%{search_criteria['performer']}%")
-                
-                if search_criteria.get('start_time'):
-                    where_conditions.append("start_time >= ?")
-                    params.append(search_criteria['start_time'])
-                
-                if search_criteria.get('end_time'):
-                    where_conditions.append("end_time <= ?")
-                    params.append(search_criteria['end_time'])
-                
-                if search_criteria.get('station_name'):
-                    where_conditions.append("station_name LIKE ?")
-                    params.append(f"%{search_criteria['station_name']}%")
-                
-                if search_criteria.get('date'):
-                    where_conditions.append("date = ?")
-                    params.append(search_criteria['date'])
-                # 日付が指定されていない場合は、日付条件を追加しない
-                # _filter_past_programsで過去の番組を除外するため、すべての日付を検索対象にする
-                
-                # 検索クエリの構築
-                where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-                # 日付が指定されていない場合は、LIMITを大幅に増やして
-                # _filter_past_programsで過去の番組を除外した後も十分な結果が得られるようにする
-                requested_limit = search_criteria.get('limit', 100)
-                if search_criteria.get('date'):
-                    # 日付指定時は通常のLIMITを使用
-                    query_limit = requested_limit
-                else:
-                    # 日付未指定時は、未来の番組を十分に取得できるようにLIMITを増やす
-                    # 過去の番組を除外した後も十分な結果が得られるようにする
-                    query_limit = max(requested_limit * 50, 10000)
-                
-                query = f'''
-                    SELECT station_id, station_name, title, performer, 
-                           start_time, end_time, description, date
-                    FROM programs 
-                    WHERE {where_clause}
-                    ORDER BY date, start_time
-                    LIMIT ?
-                '''
-                params.append(query_limit)
-                
-                cursor.execute(query, params)
-                results = cursor.fetchall()
-                
-                # 辞書形式に変換
-                programs = []
-                for row in results:
-                    programs.append({
-                        'station_id': row['station_id'],
-                        'station_name': row['station_name'],
-                        'title': row['title'],
-                        'performer': row['performer'],
-                        'start_time': row['start_time'],
-                        'end_time': row['end_time'],
-                        'description': row['description'],
-                        'date': row['date']
-                    })
-                
-                # 過去の番組を除外（日付と時間を組み合わせて現在時刻と比較）
-                programs = self._filter_past_programs(programs)
-                
-                # 過去の番組を除外した後、要求されたLIMITを適用
-                # ただし、日付未指定の場合はLIMITを適用しない（すべての結果を返す）
-                if search_criteria.get('date'):
-                    # 日付指定時のみLIMITを適用
-                    if len(programs) > requested_limit:
-                        programs = programs[:requested_limit]
-                # 日付未指定時はLIMITを適用しない（すべての未来の番組を返す）
-                
-                self.log.info(f"Search completed: {len(programs)} results found (requested limit: {requested_limit}, date specified: {bool(search_criteria.get('date'))})")
-                return programs
-                
+                cursor = self.reader_connection().cursor()
+                cursor.execute('''
+                    SELECT s.station_id, s.station_name, p.title, COALESCE(pf.name, '') AS performer,
+                           p.start_epoch, p.end_epoch, p.date
+                    FROM programs p
+                    JOIN stations s ON s.id = p.station_key
+                    LEFT JOIN performers pf ON pf.id = p.performer_id
+                    WHERE p.start_epoch IS NOT NULL AND p.end_epoch IS NOT NULL
+                ''')
+                index.load(IntervalProgram(*row) for row in cursor.fetchall())
             except sqlite3.Error as e:
-                self.log.error(f"Search failed: {e}")
-                return []
+                self.log.error(f"Failed to build interval index: {e}")
+                with self._index_lock:
+                    self._index_pending = None
+                return None
+            with self._index_lock:
+                for change in self._index_pending:
+                    change(index)
+                self._index_pending = None
+                self.interval_index = index
+        return self.interval_index
+    
+    def _compute_station_day_hash(self, station_name, programs):
+        """放送局・放送日単位の番組内容のハッシュを計算"""
+        canonical = [station_name] + [
+            [
+                program.get('start_time', ''),
+                program.get('end_time', ''),
+                program.get('title', ''),
+                program.get('performer', ''),
+                program.get('description', '')
+            ]
+            for program in programs
+        ]
+        return hashlib.sha1(json.dumps(canonical, ensure_ascii=False).encode('utf-8')).hexdigest()
     
-    def _filter_past_programs(self, programs):
-        """過去の番組を除外（ラジオの日付ルールに従う：5時未満は前日として扱う）"""
-        import datetime
+    def _apply_station_day_diff(self, cursor, station_id, station_name, programs, date):
+        """1放送局・1放送日分の番組を既存の行と突き合わせて反映する
         
-        if not programs:
-            return programs
+        戻り値: (追加件数, 更新件数, 削除件数)
+        """
+        table = self._partition_table(date)
+        station_key = self._intern_station(cursor, station_id, station_name)
+        cursor.execute(f'''
+            SELECT id, title, performer_id, start_time, end_time,
+                   start_epoch, end_epoch, description_id
+            FROM {table} WHERE station_key = ?
+        ''', (station_key,))
+        existing = {(row['start_time'], row['end_time']): row for row in cursor.fetchall()}
+        # 新しい番組のIDはパーティション内の連番（放送日 × PARTITION_ID_SPAN を起点とする）
+        cursor.execute(f"SELECT COALESCE(MAX(id), ?) FROM {table}", (int(date) * PARTITION_ID_SPAN,))
+        last_id = cursor.fetchone()[0]
         
-        # ラジオの日付ルールに従った現在時刻を取得
-        # 5時未満の場合は前日の日付として扱う
-        current = datetime.datetime.now()
-        if current.hour < 5:
-            # 5時未満の場合は、前日の日付として扱う（時刻はそのまま）
-            # 例：現在が1月2日3:00の場合、1月1日3:00として扱う
-            current = current - datetime.timedelta(days=1)
-        # 秒とマイクロ秒を0に設定して比較の精度を統一
-        current = current.replace(second=0, microsecond=0)
-        
-        filtered_programs = []
+        fts_added = []
+        updates = []
+        inserted = 0
+        seen = set()
         for program in programs:
-            try:
-                date_str = program.get('date', '')
-                start_time_str = program.get('start_time', '')
-                
-                if not date_str or not start_time_str:
-                    # 日付または時間が不明な場合は除外
-                    continue
-                
-                # 日付をパース
-                if len(date_str) == 8:
-                    year = int(date_str[:4])
-                    month = int(date_str[4:6])
-                    day = int(date_str[6:8])
-                    program_date = datetime.date(year, month, day)
-                else:
-                    continue
-                
-                # 時間をパース（HH:MM:SS形式またはHH:MM形式）
-                start_parts = start_time_str.split(':')
-                if len(start_parts) >= 2:
-                    start_hour = int(start_parts[0])
-                    start_minute = int(start_parts[1])
-                    # 秒の処理（秒が指定されている場合は取得、されていない場合は0）
-                    start_second = int(start_parts[2]) if len(start_parts) >= 3 else 0
-                else:
-                    continue
-                
-                # 24時以降の時間を処理（例：25:00 → 翌日1:00、28:00 → 翌日4:00）
-                days_offset = 0
-                is_24h_over = False
-                original_hour = start_hour
-                if start_hour >= 24:
-                    is_24h_over = True
-                    days_offset = start_hour // 24
-                    start_hour = start_hour % 24
-                
-                # datetimeオブジェクトを作成
-                program_datetime = datetime.datetime.combine(
-                    program_date,
-                    datetime.time(start_hour, start_minute, start_second)
-                )
-                
-                # 24時以降の時間の場合は日付を進める
-                if days_offset > 0:
-                    program_datetime += datetime.timedelta(days=days_offset)
-                
-                # 深夜番組の処理（ラジオの日付ルール：5時未満は前日として扱う）
-                # ただし、24時以降の時間（28時など）は既に日付を進めているので、このチェックをスキップ
-                # 例：1月1日の28:00（1月2日の4:00）は、そのまま1月2日の4:00として扱う
-                # 例：1月2日の3:00開始の番組は、1月1日の3:00として扱う
-                if not is_24h_over and program_datetime.time() < datetime.time(5, 0, 0):
-                    # 前日の日付として扱う（時刻はそのまま）
-                    program_datetime = program_datetime - datetime.timedelta(days=1)
-                
-                # 現在時刻より後の番組のみを含める
-                if program_datetime >= current:
-                    filtered_programs.append(program)
-                    
-            except (ValueError, TypeError) as e:
-                # パースエラーの場合は除外
-                self.log.debug(f"Failed to parse program date/time, excluding: {e}")
+            key = (program.get('start_time', ''), program.get('end_time', ''))
+            if key in seen:
+                # 同じ時刻の番組が重複している場合は最初のものを採用する
                 continue
+            seen.add(key)
+            
+            start_epoch, end_epoch = self._get_program_epochs(program, date)
+            title = program.get('title', '')
+            performer = program.get('performer', '')
+            description = program.get('description', '')
+            values = (
+                title,
+                self._intern_performer(cursor, performer),
+                start_epoch,
+                end_epoch,
+                self._intern_description(cursor, description)
+            )
+            row = existing.pop(key, None)
+            if row is None:
+                last_id += 1
+                cursor.execute(f'''
+                    INSERT INTO {table} 
+                    (id, station_key, title, performer_id, start_time, end_time,
+                     start_epoch, end_epoch, description_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (last_id, station_key, values[0], values[1], key[0], key[1],
+                      values[2], values[3], values[4]))
+                fts_added.append((last_id, title, performer, description))
+                inserted += 1
+            elif (row['title'], row['performer_id'], row['start_epoch'],
+                  row['end_epoch'], row['description_id']) != values:
+                updates.append(values + (row['id'],))
+                fts_added.append((row['id'], title, performer, description))
+        
+        # 全文検索索引からは書き換え前の値で取り除く必要があるため、先に索引を更新する
+        deleted_ids = [row['id'] for row in existing.values()]
+        self._remove_fulltext_ids(cursor, date, [update[-1] for update in updates] + deleted_ids)
+        cursor.executemany(f'''
+            UPDATE {table}
+            SET title = ?, performer_id = ?, start_epoch = ?, end_epoch = ?,
+                description_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', updates)
+        # 番組表から消えた番組を削除
+        cursor.executemany(f"DELETE FROM {table} WHERE id = ?", [(program_id,) for program_id in deleted_ids])
+        
+        self._add_fulltext_entries(cursor, date, fts_added)
+        return inserted, len(updates), len(deleted_ids)
+    
+    def _intern_station(self, cursor, station_id, station_name):
+        """放送局を登録し、整数キーを返す（放送局名が変わっていれば更新する）"""
+        cursor.execute('''
+            INSERT INTO stations (station_id, station_name) VALUES (?, ?)
+            ON CONFLICT(station_id) DO UPDATE SET station_name = excluded.station_name
+            WHERE station_name != excluded.station_name
+        ''', (station_id, station_name))
+        cursor.execute("SELECT id FROM stations WHERE station_id = ?", (station_id,))
+        return cursor.fetchone()[0]
+    
+    def _intern_performer(self, cursor, performer):
+        """出演者を登録し、IDを返す（出演者なしはNone）"""
+        if not performer:
+            return None
+        cursor.execute("INSERT OR IGNORE INTO performers (name) VALUES (?)", (performer,))
+        cursor.execute("SELECT id FROM performers WHERE name = ?", (performer,))
+        return cursor.fetchone()[0]
+    
+    def _intern_description(self, cursor, description):
+        """番組説明を登録し、IDを返す（説明なしはNone）"""
+        if not description:
+            return None
+        digest = hashlib.sha1(description.encode('utf-8')).hexdigest()
+        cursor.execute("SELECT id FROM descriptions WHERE hash = ?", (digest,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        body, compressed = encode_description(description)
+        cursor.execute(
+            "INSERT INTO descriptions (hash, body, compressed) VALUES (?, ?, ?)",
+            (digest, body, compressed)
+        )
+        return cursor.lastrowid
+    
+    def _get_program_epochs(self, program, date):
+        """番組の放送開始・終了UNIX時刻を返す（収集時に計算済みでなければここで計算する）"""
+        if program.get('start_epoch') is not None and program.get('end_epoch') is not None:
+            return program['start_epoch'], program['end_epoch']
+        return tcutil.CalendarUtil().get_broadcast_epochs(date, program.get('start_time', ''), program.get('end_time', ''))
+    
+    def search_programs(self, search_criteria):
+        """番組検索実行（これから放送される番組のみ、放送開始順）
+        
+        search_criteria['limit']件までを1ページとして返す。続きが必要な場合はopen_search_cursorを使う。
+        """
+        try:
+            requested_limit = search_criteria.get('limit', SEARCH_PAGE_SIZE)
+            rows = self._fetch_search_page(search_criteria, None, requested_limit)
+            programs = [self._row_to_program(row) for row in rows]
+            self.log.info(f"Search completed: {len(programs)} results found (requested limit: {requested_limit}, date specified: {bool(search_criteria.get('date'))})")
+            return programs
+            
+        except sqlite3.Error as e:
+            self.log.error(f"Search failed: {e}")
+            return []
+    
+    def open_search_cursor(self, search_criteria, page_size=SEARCH_PAGE_SIZE):
+        """検索結果をページ単位で取得するカーソルを返す"""
+        return ProgramSearchCursor(self, search_criteria, page_size)
+    
+    def _build_search_query(self, search_criteria):
+        """検索条件から全文検索のMATCH式・WHERE条件・パラメータ・並び順の列を組み立てる
+        
+        WHERE条件と並び順の列は放送日パーティションごとの問い合わせ（_fetch_search_page）の中で使う。
+        並び順の列は行を一意に定める組で、キーセットページングのキーとしても使う。
+        戻り値: (MATCH式またはNone, WHERE条件のリスト, パラメータ, 並び順の列のリスト)
+        """
+        where_conditions = []
+        params = []
+        
+        # タイトル・出演者・説明は全文検索索引で絞り込む
+        match_expr, like_conditions, like_params = self.build_fulltext_filter(
+            [(field, search_criteria.get(field)) for field in FULLTEXT_FIELDS]
+        )
+        where_conditions.extend(like_conditions)
+        params.extend(like_params)
+        
+        start_time = search_criteria.get('start_time')
+        end_time = search_criteria.get('end_time')
+        if search_criteria.get('time_overlap') and start_time and end_time:
+            # 番組の開始時間が検索終了時間より前 かつ 番組の終了時間が検索開始時間より後
+            # （例：7:00-9:30の検索で6:00-9:00の番組も含める）
+            where_conditions.append("p.start_time < ? AND p.end_time > ?")
+            params.extend([end_time, start_time])
+        else:
+            if start_time:
+                where_conditions.append("p.start_time >= ?")
+                params.append(start_time)
+            
+            if end_time:
+                where_conditions.append("p.end_time <= ?")
+                params.append(end_time)
+        
+        if search_criteria.get('station_name'):
+            where_conditions.append("p.station_name LIKE ?")
+            params.append(f"%{search_criteria['station_name']}%")
+        
+        if search_criteria.get('station_id'):
+            where_conditions.append("p.station_id = ?")
+            params.append(search_criteria['station_id'])
+        
+        # 放送日はパーティションの選択で絞り込む（_fetch_search_page）
+        
+        # 放送開始が現在時刻以降の番組のみ（日付規則は収集時にUNIX時刻へ変換済み）
+        where_conditions.append("p.start_epoch >= ?")
+        params.append(int(time.time()))
+        
+        # sort='relevance'の場合は全文検索のbm25スコア順、それ以外は放送日時順
+        # bm25は放送日ごとの全文検索索引の統計（文書数・平均長）で計算されるため、
+        # 日付をまたぐ検索ではスコアの尺度が日ごとに少しずれる（同じ日の中の順位は正確）
+        order_columns = ["p.start_epoch", "p.station_id", "p.id"]
+        if match_expr and search_criteria.get('sort') == 'relevance':
+            order_columns = ["fts.fts_rank", "p.start_epoch", "p.id"]
+        
+        return match_expr, where_conditions, params, order_columns
+    
+    def _fetch_search_page(self, search_criteria, after_key, limit):
+        """検索結果の1ページ分を取得する（after_keyより後ろの行のみ）
+        
+        放送日パーティションごとに番組と全文検索索引を結合して絞り込み、その結果をUNION ALLでまとめて並べる。
+        各行の末尾のsort_key_0, sort_key_1, ...が並び順のキーになる。
+        """
+        match_expr, where_conditions, params, order_columns = self._build_search_query(search_criteria)
+        if after_key is not None:
+            placeholders = ", ".join("?" for _ in order_columns)
+            where_conditions.append(f"({', '.join(order_columns)}) > ({placeholders})")
+            params.extend(after_key)
+        
+        dates = self.partition_dates
+        if search_criteria.get('date'):
+            dates = [date for date in dates if date == search_criteria['date']]
+        if not dates:
+            return []
+        
+        key_columns = ", ".join(f"{column} AS sort_key_{i}" for i, column in enumerate(order_columns))
+        partition_queries = []
+        for date in dates:
+            # MATCH式はすべてのパーティションで?1を参照するため、最初のパーティションのJOIN句が最初のパラメータになる
+            join_clause = ""
+            if match_expr:
+                join_clause = f"JOIN ({self._fulltext_subquery(date)}) AS fts ON fts.fts_rowid = p.id"
+            partition_queries.append(f'''
+                SELECT p.station_id, p.station_name, p.title, p.performer, 
+                       p.start_time, p.end_time, p.start_epoch, p.end_epoch, p.description_id, p.date,
+                       {key_columns}
+                FROM ({self._partition_details_source(date)}) p
+                {join_clause}
+                WHERE {" AND ".join(where_conditions)}
+            ''')
+        query = f'''
+            SELECT * FROM ({" UNION ALL ".join(partition_queries)})
+            ORDER BY {", ".join(f"sort_key_{i}" for i in range(len(order_columns)))}
+            LIMIT ?
+        '''
+        query_params = ([match_expr] if match_expr else []) + params * len(dates) + [limit]
+        
+        cursor = self.reader_connection().cursor()
+        cursor.execute(query, query_params)
+        return cursor.fetchall()
+    
+    @staticmethod
+    def _row_to_program(row):
+        """検索結果の行を辞書形式に変換"""
+        return {
+            'station_id': row['station_id'],
+            'station_name': row['station_name'],
+            'title': row['title'],
+            'performer': row['performer'],
+            'start_time': row['start_time'],
+            'end_time': row['end_time'],
+            'start_epoch': row['start_epoch'],
+            'end_epoch': row['end_epoch'],
+            'description_id': row['description_id'],
+            'date': row['date']
+        }
+    
+    def get_programs_on_air(self, at_epoch=None, station_id=None):
+        """指定時刻（省略時は現在）に放送中の番組を取得（放送局順）"""
+        if at_epoch is None:
+            at_epoch = int(time.time())
+        try:
+            where_conditions = ["p.start_epoch <= ?", "p.end_epoch > ?"]
+            params = [at_epoch, at_epoch]
+            if station_id:
+                where_conditions.append("p.station_id = ?")
+                params.append(station_id)
+            cursor = self.reader_connection().cursor()
+            cursor.execute(f'''
+                SELECT p.station_id, p.station_name, p.title, p.performer,
+                       p.start_time, p.end_time, p.start_epoch, p.end_epoch, p.description_id, p.date
+                FROM program_details p
+                WHERE {" AND ".join(where_conditions)}
+                ORDER BY p.station_id, p.start_epoch
+            ''', params)
+            return [self._row_to_program(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get programs on air: {e}")
+            return []
+    
+    def get_now_program(self, station_id, at_epoch=None):
+        """放送局で指定時刻（省略時は現在）に放送中の番組を、説明と放送局・放送日の最終取得時刻（fetched_at）つきで取得
+        
+        放送開始・終了のUNIX時刻で判定するため、深夜の番組も前日の放送日の行から見つかる。
+        該当する番組が無い場合はNone。
+        """
+        programs = self.get_programs_on_air(at_epoch, station_id)
+        if not programs:
+            return None
+        program = dict(programs[0])
+        program['description'] = self.get_program_description(program)
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute(
+                "SELECT CAST(strftime('%s', fetched_at) AS INTEGER) FROM station_days WHERE station_id = ? AND date = ?",
+                (station_id, program['date'])
+            )
+            row = cursor.fetchone()
+            program['fetched_at'] = row[0] if row else None
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get fetch time of {station_id} on {program['date']}: {e}")
+            program['fetched_at'] = None
+        return program
+    
+    def get_popular_titles(self, limit=20):
+        """放送回数の多い番組を集計テーブルから取得（放送局・タイトルごと）"""
+        try:
+            cursor = self.reader_connection().cursor()
+            # 上位の行だけを先に確定させ、放送時間帯はその行についてのみ求める
+            cursor.execute('''
+                WITH top AS (
+                    SELECT station_key, title, program_count FROM title_stats
+                    ORDER BY program_count DESC, title
+                    LIMIT ?
+                )
+                SELECT top.title, s.station_name, top.program_count AS count,
+                       (SELECT MIN(start_time) FROM programs p
+                        WHERE p.title = top.title AND p.station_key = top.station_key) AS first_start_time,
+                       (SELECT MAX(end_time) FROM programs p
+                        WHERE p.title = top.title AND p.station_key = top.station_key) AS last_end_time
+                FROM top JOIN stations s ON s.id = top.station_key
+                ORDER BY count DESC, top.title
+            ''', (limit,))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get popular titles: {e}")
+            return []
+    
+    def get_program_description(self, program):
+        """番組の説明を取得する
         
-        return filtered_programs
+        検索結果には説明のIDだけを含め、本文は詳細表示などで必要になった時点で展開する。
+        """
+        if program.get('description') is not None:
+            return program['description']
+        description_id = program.get('description_id')
+        if not description_id:
+            return ''
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute("SELECT body, compressed FROM descriptions WHERE id = ?", (description_id,))
+            row = cursor.fetchone()
+            return decode_description(row['body'], row['compressed']) if row else ''
+        except (sqlite3.Error, zlib.error) as e:
+            self.log.error(f"Failed to get program description: {e}")
+            return ''
     
     def get_program_count(self, date=None):
         """キャッシュされた番組数を取得"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-                if date:
-                    cursor.execute("SELECT COUNT(*) FROM programs WHERE date = ?", (date,))
-                else:
-                    cursor.execute("SELECT COUNT(*) FROM programs")
-                return cursor.fetchone()[0]
-            except sqlite3.Error as e:
-                self.log.error(f"Failed to get program count: {e}")
-                return 0
+        try:
+            cursor = self.reader_connection().cursor()
+            if date:
+                cursor.execute("SELECT COALESCE(SUM(program_count), 0) FROM program_day_stats WHERE date = ?", (date,))
+            else:
+                cursor.execute("SELECT COALESCE(SUM(program_count), 0) FROM program_day_stats")
+            return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get program count: {e}")
+            return 0
     
     def get_last_update_time(self):
         """最終更新時刻を取得"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT value FROM cache_metadata WHERE key = 'last_update'")
-                result = cursor.fetchone()
-                return result[0] if result else None
-            except sqlite3.Error as e:
-                self.log.error(f"Failed to get last update time: {e}")
-                return None
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute("SELECT value FROM cache_metadata WHERE key = 'last_update'")
+            result = cursor.fetchone()
+            return result[0] if result else None
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get last update time: {e}")
+            return None
+    
+    def get_station_day_fetch_times(self, dates):
+        """指定した日付の (放送局ID, 日付) -> 最終取得時刻（UNIX時刻）の辞書を取得"""
+        if not dates:
+            return {}
+        try:
+            cursor = self.reader_connection().cursor()
+            placeholders = ", ".join("?" for _ in dates)
+            # CURRENT_TIMESTAMPはUTCで記録されているので、UNIX時刻に直して比較する
+            cursor.execute(f'''
+                SELECT station_id, date, CAST(strftime('%s', fetched_at) AS INTEGER)
+                FROM station_days WHERE date IN ({placeholders})
+            ''', list(dates))
+            return {(row[0], row[1]): row[2] for row in cursor.fetchall() if row[2] is not None}
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get station day fetch times: {e}")
+            return {}
     
     def cleanup_old_data(self, days=7):
-        """古いデータの削除"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-                cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime('%Y%m%d')
-                cursor.execute("DELETE FROM programs WHERE date < ?", (cutoff_date,))
-                deleted_count = cursor.rowcount
-                self.conn.commit()
-                self.log.info(f"Cleaned up {deleted_count} old program records")
-                return deleted_count
-            except sqlite3.Error as e:
-                self.log.error(f"Failed to cleanup old data: {e}")
-                return 0
+        """古いデータの削除（期限切れの放送日はパーティションごと削除する）"""
+        try:
+            cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime('%Y%m%d')
+            deleted_count = 0
+            with self.connections.write() as conn:
+                cursor = conn.cursor()
+                # パーティションの一覧は書き込み接続を持つ間だけ変わるため、ここで振り分ける
+                expired_dates = [date for date in self.partition_dates if date < cutoff_date]
+                remaining_dates = [date for date in self.partition_dates if date >= cutoff_date]
+                for date in expired_dates:
+                    deleted_count += self._drop_partition(cursor, date)
+                if expired_dates:
+                    self._refresh_partition_view(cursor, remaining_dates)
+                cursor.execute("DELETE FROM station_days WHERE date < ?", (cutoff_date,))
+                cursor.execute("DELETE FROM crawl_plan WHERE date < ?", (cutoff_date,))
+                # どの番組からも参照されなくなった出演者・説明を削除
+                cursor.execute('''
+                    DELETE FROM performers WHERE id NOT IN (
+                        SELECT performer_id FROM programs WHERE performer_id IS NOT NULL
+                    )
+                ''')
+                cursor.execute('''
+                    DELETE FROM descriptions WHERE id NOT IN (
+                        SELECT description_id FROM programs WHERE description_id IS NOT NULL
+                    )
+                ''')
+                self.partition_dates = remaining_dates
+                if expired_dates:
+                    with self._index_lock:
+                        self._apply_index_change(lambda index: index.drop_dates(expired_dates))
+            if expired_dates:
+                self.generation += 1
+                self._reclaim_free_pages()
+            self.log.info(f"Cleaned up {deleted_count} old program records ({len(expired_dates)} partitions dropped)")
+            return deleted_count
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to cleanup old data: {e}")
+            return 0
+    
+    def start_crawl_plan(self, targets):
+        """新しい収集計画を作成する（targetsは優先度の高い順の (放送局ID, 日付)）"""
+        try:
+            with self.connections.write() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM crawl_plan")
+                cursor.executemany(
+                    "INSERT INTO crawl_plan (station_id, date, priority) VALUES (?, ?, ?)",
+                    [(station_id, date, priority) for priority, (station_id, date) in enumerate(targets)]
+                )
+                cursor.execute('''
+                    INSERT OR REPLACE INTO cache_metadata (key, value, updated_at)
+                    VALUES ('crawl_plan_created', ?, CURRENT_TIMESTAMP)
+                ''', (datetime.datetime.now().isoformat(timespec='seconds'),))
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to start crawl plan: {e}")
+    
+    def get_crawl_plan_info(self):
+        """収集計画の概要（作成日時・対象日付・状態ごとの件数）を取得（計画が無い場合はNone）"""
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute("SELECT value FROM cache_metadata WHERE key = 'crawl_plan_created'")
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute("SELECT DISTINCT date FROM crawl_plan ORDER BY date")
+            dates = [r[0] for r in cursor.fetchall()]
+            cursor.execute("SELECT status, COUNT(*) FROM crawl_plan GROUP BY status")
+            counts = {status: count for status, count in cursor.fetchall()}
+            return {
+                'created_at': datetime.datetime.fromisoformat(row[0]),
+                'dates': dates,
+                'pending': counts.get('pending', 0),
+                'failed': counts.get('failed', 0),
+                'done': counts.get('done', 0),
+            }
+        except (sqlite3.Error, ValueError) as e:
+            self.log.error(f"Failed to get crawl plan info: {e}")
+            return None
+    
+    def get_pending_crawl_tasks(self):
+        """未完了の (放送局ID, 日付) を優先度順に取得（失敗回数が上限に達したものは除く）"""
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute('''
+                SELECT station_id, date FROM crawl_plan
+                WHERE status = 'pending' OR (status = 'failed' AND attempts < ?)
+                ORDER BY priority
+            ''', (CRAWL_MAX_ATTEMPTS,))
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get pending crawl tasks: {e}")
+            return []
+    
+    def mark_crawl_tasks_failed(self, targets):
+        """取得に失敗した (放送局ID, 日付) を記録"""
+        try:
+            with self.connections.write() as conn:
+                conn.executemany('''
+                    UPDATE crawl_plan SET status = 'failed', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE station_id = ? AND date = ? AND status != 'done'
+                ''', list(targets))
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to mark crawl tasks failed: {e}")
+    
+    def record_station_usage(self, station_id, kind):
+        """放送局の再生（kind='play'）・録音（kind='record'）を記録"""
+        column = {'play': 'play_count', 'record': 'record_count'}.get(kind)
+        if column is None:
+            raise ValueError(f"Unknown station usage kind: {kind}")
+        try:
+            with self.connections.write() as conn:
+                conn.execute(f'''
+                    INSERT INTO station_usage (station_id, {column}) VALUES (?, 1)
+                    ON CONFLICT(station_id) DO UPDATE SET {column} = {column} + 1, last_used_at = CURRENT_TIMESTAMP
+                ''', (station_id,))
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to record station usage: {e}")
+    
+    def get_station_usage(self):
+        """放送局IDをキー、(再生回数, 録音回数) を値に持つ辞書を取得"""
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute("SELECT station_id, play_count, record_count FROM station_usage")
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get station usage: {e}")
+            return {}
     
     def is_cache_valid(self, date, max_age_hours=1):
         """キャッシュの有効性をチェック"""
@@ -379,42 +1434,38 @@ class ProgramCacheManager:
     
     def get_weekly_data_summary(self):
         """1週間分のデータサマリーを取得"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-                
-                # 今日から1週間分の日付範囲を計算
-                today = datetime.datetime.now()
-                week_dates = []
-                for i in range(7):
-                    target_date = today + datetime.timedelta(days=i)
-                    week_dates.append(target_date.strftime('%Y%m%d'))
-                
-                # 各日付のデータ数を取得
-                summary = {}
-                for date_str in week_dates:
-                    cursor.execute("SELECT COUNT(*) FROM programs WHERE date = ?", (date_str,))
-                    count = cursor.fetchone()[0]
-                    summary[date_str] = count
-                
-                # 総データ数
-                cursor.execute("SELECT COUNT(*) FROM programs")
-                total_count = cursor.fetchone()[0]
-                
-                # 放送局数
-                cursor.execute("SELECT COUNT(DISTINCT station_id) FROM programs")
-                station_count = cursor.fetchone()[0]
-                
-                return {
-                    'weekly_summary': summary,
-                    'total_programs': total_count,
-                    'total_stations': station_count,
-                    'date_range': week_dates
-                }
-                
-            except sqlite3.Error as e:
-                self.log.error(f"Failed to get weekly data summary: {e}")
-                return None
+        try:
+            cursor = self.reader_connection().cursor()
+            
+            # 今日から1週間分の日付範囲を計算
+            today = datetime.datetime.now()
+            week_dates = []
+            for i in range(7):
+                target_date = today + datetime.timedelta(days=i)
+                week_dates.append(target_date.strftime('%Y%m%d'))
+            
+            # 各日付のデータ数を取得（集計テーブルから）
+            cursor.execute('''
+                SELECT date, SUM(program_count) FROM program_day_stats
+                WHERE date BETWEEN ? AND ? GROUP BY date
+            ''', (week_dates[0], week_dates[-1]))
+            counts = {row[0]: row[1] for row in cursor.fetchall()}
+            summary = {date_str: counts.get(date_str, 0) for date_str in week_dates}
+            
+            # 総データ数・放送局数
+            cursor.execute("SELECT COALESCE(SUM(program_count), 0), COUNT(DISTINCT station_key) FROM program_day_stats")
+            total_count, station_count = cursor.fetchone()
+            
+            return {
+                'weekly_summary': summary,
+                'total_programs': total_count,
+                'total_stations': station_count,
+                'date_range': week_dates
+            }
+            
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get weekly data summary: {e}")
+            return None
     
     def is_weekly_cache_complete(self):
         """1週間分のキャッシュが完全かチェック"""
@@ -439,32 +1490,106 @@ class ProgramCacheManager:
     
     def get_available_date_range(self):
         """利用可能な日付範囲を取得"""
-        with self.lock:
-            try:
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT MIN(date), MAX(date) FROM programs")
-                result = cursor.fetchone()
-                
-                if result and result[0] and result[1]:
-                    return {
-                        'start_date': result[0],
-                        'end_date': result[1],
-                        'days_available': (datetime.datetime.strptime(result[1], '%Y%m%d') - 
-                                         datetime.datetime.strptime(result[0], '%Y%m%d')).days + 1
-                    }
-                else:
-                    return None
-                    
-            except sqlite3.Error as e:
-                self.log.error(f"Failed to get available date range: {e}")
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute("SELECT MIN(date), MAX(date) FROM program_day_stats")
+            result = cursor.fetchone()
+            
+            if result and result[0] and result[1]:
+                return {
+                    'start_date': result[0],
+                    'end_date': result[1],
+                    'days_available': (datetime.datetime.strptime(result[1], '%Y%m%d') - 
+                                     datetime.datetime.strptime(result[0], '%Y%m%d')).days + 1
+                }
+            else:
                 return None
+                
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to get available date range: {e}")
+            return None
+    
+    def check_integrity(self):
+        """データベース全体の整合性を検査する（データベースの大きさに比例して時間がかかるためアイドル時に呼ぶ）"""
+        try:
+            cursor = self.reader_connection().cursor()
+            cursor.execute("PRAGMA integrity_check")
+            results = [row[0] for row in cursor.fetchall()]
+            if results == ['ok']:
+                return True
+            self.log.warning(f"Database integrity check failed: {results[:5]}")
+            return False
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to check database integrity: {e}")
+            return False
+    
+    def reader_connection(self):
+        """呼び出し元スレッド専用の読み取り接続を取得（書き込み中でも待たずに読める）"""
+        return self.connections.reader()
     
     def close(self):
         """データベース接続を閉じる"""
-        if self.conn:
-            self.conn.close()
+        if self.connections:
+            self.connections.close()
+            self.connections = None
             self.log.info("Database connection closed")
     
     def __del__(self):
         """デストラクタ"""
         self.close()
+
+
+class ProgramSearchCursor:
+    """番組検索の結果をページ単位で取得するカーソル
+    
+    前のページの最後の行の並び順キー（放送開始時刻・放送局・ID）より後ろだけを検索するキーセットページングのため、
+    何ページ目でも同じ速さで取得でき、取得済みの結果を保持し続ける必要もない。
+    """
+    
+    def __init__(self, cache_manager, search_criteria, page_size=SEARCH_PAGE_SIZE):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramSearchCursor")
+        self.cache_manager = cache_manager
+        self.search_criteria = dict(search_criteria)
+        self.page_size = page_size
+        self.last_key = None
+        self.has_more = True
+        self.fetched_count = 0
+        self._preloaded_page = None
+    
+    def preload_first_page(self, page, last_key, has_more):
+        """取得済みの最初のページ（検索結果キャッシュなど）を設定し、次のfetch_pageでそれを返す"""
+        self._preloaded_page = list(page)
+        self.last_key = last_key
+        self.has_more = has_more
+        self.fetched_count = len(page)
+    
+    def fetch_page(self):
+        """次のページを取得（続きがなければ空のリスト）"""
+        if self._preloaded_page is not None:
+            page, self._preloaded_page = self._preloaded_page, None
+            return page
+        if not self.has_more:
+            return []
+        try:
+            rows = self.cache_manager._fetch_search_page(self.search_criteria, self.last_key, self.page_size)
+        except sqlite3.Error as e:
+            self.log.error(f"Failed to fetch search page: {e}")
+            self.has_more = False
+            return []
+        
+        if len(rows) < self.page_size:
+            self.has_more = False
+        if rows:
+            last = rows[-1]
+            self.last_key = tuple(last[key] for key in last.keys() if key.startswith('sort_key_'))
+        self.fetched_count += len(rows)
+        self.log.debug(f"Fetched search page: {len(rows)} rows (total {self.fetched_count}, more={self.has_more})")
+        return [self.cache_manager._row_to_program(row) for row in rows]
+    
+    def __iter__(self):
+        """ページ（番組の辞書のリスト）を順に返す"""
+        while self.has_more or self._preloaded_page is not None:
+            page = self.fetch_page()
+            if not page:
+                return
+            yield page
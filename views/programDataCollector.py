@@ -5,29 +5,73 @@ import threading
 import datetime
 import time
 from logging import getLogger
+from urllib.parse import urlparse
 import constants
+import globalVars
+import tcutil
 from views import programmanager
+from views import httpCache
+from views.collectorPipeline import CollectorPipeline
+from views.concurrentFetcher import ConcurrentFetcher, FetchCancelled, HostRateLimiter, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND
 from views import radioManager
 from views.programCacheManager import ProgramCacheManager
+from views.refreshPlanner import RefreshPlanner
+
+# 中断した週間収集の計画を再開する期限（これより古い計画は作り直す）
+CRAWL_PLAN_RESUME_HOURS = 12
+# 優先度の計算で、録音1回を再生何回分とみなすか
+RECORD_USAGE_WEIGHT = 2
+
+def weekly_date_list(start_date=None):
+    """start_date（省略時は今日の0:00:00）から1週間分の日付（YYYYMMDD）のリスト"""
+    if start_date is None:
+        start_date = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [(start_date + datetime.timedelta(days=i)).strftime('%Y%m%d') for i in range(7)]
 
 class ProgramDataCollector:
     """全放送局の番組データを収集・管理するクラス"""
     
-    def __init__(self, cache_manager=None):
+    def __init__(self, cache_manager=None, max_workers=None, requests_per_second=None):
         self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramDataCollector")
         self.cache_manager = cache_manager or ProgramCacheManager()
         self.program_manager = programmanager.ProgramManager()
+        self.calendar_util = tcutil.CalendarUtil()
+        self.max_workers = max_workers or self._get_config_int("fetch_concurrency", DEFAULT_MAX_WORKERS)
+        # レート制限は収集処理をまたいで共有し、連続した収集でも上限を超えないようにする
+        self.rate_limiter = HostRateLimiter(
+            requests_per_second or self._get_config_int("fetch_requests_per_second", DEFAULT_REQUESTS_PER_SECOND)
+        )
+        self.fetch_host = urlparse(self.program_manager.getprogramlist()).netloc
+        # エリア単位で番組表を一括取得する（取得できなかった放送局のみ個別に取得）
+        self.bulk_fetch = self._get_config_bool("bulk_fetch", True)
+        self.refresh_planner = RefreshPlanner()
+        # 番組表XMLの解析に使うプロセス数（0の場合は解析段のスレッドで解析する）
+        self.parse_processes = self._get_config_int("parse_processes", 0, 0)
         self.radio_manager = None  # 後で設定
         self.collection_thread = None
         self.is_collecting = False
         self.collection_interval = 3600  # 1時間ごと
     
+    def _get_config_int(self, key, default, minimum=1):
+        """設定値（programCacheセクション）を取得"""
+        app = globalVars.app
+        if app is None or not hasattr(app, 'config'):
+            return default
+        return app.config.getint("programCache", key, default, minimum, 32)
+    
+    def _get_config_bool(self, key, default):
+        """設定値（programCacheセクション）を真偽値で取得"""
+        app = globalVars.app
+        if app is None or not hasattr(app, 'config'):
+            return default
+        return app.config.getboolean("programCache", key, default)
+    
     def set_radio_manager(self, radio_manager):
         """RadioManagerを設定"""
         self.radio_manager = radio_manager
     
-    def collect_all_stations_data(self, date=None, force_refresh=False):
-        """全放送局の番組データを収集"""
+    def collect_all_stations_data(self, date=None, force_refresh=False, max_workers=None):
+        """全放送局の番組データを収集（max_workersで並列数を指定）"""
         if not self.radio_manager:
             self.log.error("RadioManager not set")
             return False
@@ -54,24 +98,9 @@ class ProgramDataCollector:
             station_ids = list(self.radio_manager.stid.keys())
             self.log.info(f"Found {len(station_ids)} stations to collect: {station_ids[:5]}...")  # 最初の5つを表示
             
-            # 各放送局のデータを収集
-            collected_data = {}
-            success_count = 0
-            
-            for station_id in station_ids:
-                try:
-                    station_data = self._collect_station_data(station_id, date)
-                    if station_data:
-                        collected_data[station_id] = station_data
-                        success_count += 1
-                        self.log.debug(f"Collected data for station {station_id}")
-                    
-                    # API制限を考慮して少し待機
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    self.log.warning(f"Failed to collect data for station {station_id}: {e}")
-                    continue
+            # 各放送局のデータを並列に収集
+            collected_data = self._collect_stations([(station_id, date) for station_id in station_ids], max_workers).get(date, {})
+            success_count = len(collected_data)
             
             # データをキャッシュに保存
             if collected_data:
@@ -86,22 +115,18 @@ class ProgramDataCollector:
             self.log.error(f"Data collection failed: {e}")
             return False
     
-    def collect_weekly_data(self, start_date=None, force_refresh=False):
-        """1週間分のデータを効率的に収集"""
+    def collect_weekly_data(self, start_date=None, force_refresh=False, max_workers=None, cancel_event=None, on_progress=None):
+        """1週間分のデータを効率的に収集（全日付・全放送局を1つのワーカープールで並列取得）
+        
+        force_refreshがFalseの場合は、更新計画で取り直しが必要と判断した放送局・放送日だけを取得する。
+        cancel_eventがセットされると未取得の分を残して終わる（収集計画に残り、次回再開する）。
+        on_progress(保存済み, 対象) は放送局・放送日を保存するたびに書き込み段のスレッドで呼ばれる。
+        """
         if not self.radio_manager:
             self.log.error("RadioManager not set")
             return False
         
-        if start_date is None:
-            # 今日（0:00:00）を基準にする
-            today = datetime.datetime.now()
-            start_date = today.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # 1週間分の日付リストを生成
-        date_list = []
-        for i in range(7):
-            target_date = start_date + datetime.timedelta(days=i)
-            date_list.append(target_date.strftime('%Y%m%d'))
+        date_list = weekly_date_list(start_date)
         
         self.log.info(f"Starting weekly data collection from {date_list[0]} to {date_list[-1]}")
         
@@ -113,134 +138,272 @@ class ProgramDataCollector:
         station_ids = list(self.radio_manager.stid.keys())
         self.log.info(f"Collecting data for {len(station_ids)} stations across 7 days")
         
-        success_count = 0
-        total_days = len(date_list)
+        targets = self._resume_crawl_plan(date_list, station_ids)
+        if targets is None:
+            targets = [(station_id, date_str) for date_str in date_list for station_id in station_ids]
+            if not force_refresh:
+                # 取得済みで再取得間隔を過ぎていない放送局・放送日は取り直さない
+                targets = self.refresh_planner.plan(
+                    targets,
+                    self.cache_manager.get_station_day_fetch_times(date_list),
+                    self.calendar_util.get_radio_date()
+                )
+                if not targets:
+                    self.log.info("Weekly data is up to date, nothing to refresh")
+                    return True
+            targets = self._prioritize_targets(targets)
+            self.cache_manager.start_crawl_plan(targets)
         
-        for date_str in date_list:
+        totals = {'inserted': 0, 'updated': 0, 'deleted': 0}
+        collected_counts = {}
+        
+        def on_collected(date_str, collected_data):
+            # 書き込み段がまとめた単位ごとに保存し、計画の完了状態も同じトランザクションで記録する（書き込み段のスレッドで呼ばれる）
             try:
-                self.log.info(f"Collecting data for date: {date_str}")
-                
-                # 各日付のデータを収集
-                collected_data = {}
-                day_success_count = 0
-                
-                for station_id in station_ids:
-                    try:
-                        station_data = self._collect_station_data(station_id, date_str)
-                        if station_data:
-                            collected_data[station_id] = station_data
-                            day_success_count += 1
-                        
-                        # API制限を考慮して少し待機
-                        time.sleep(0.05)  # 週間収集では少し短縮
-                        
-                    except Exception as e:
-                        self.log.warning(f"Failed to collect data for station {station_id} on {date_str}: {e}")
-                        continue
-                
-                # データをキャッシュに保存
-                if collected_data:
-                    self.cache_manager.update_programs_data(collected_data, date_str)
-                    self.log.info(f"Successfully collected data for {day_success_count}/{len(station_ids)} stations on {date_str}")
-                    success_count += 1
-                else:
-                    self.log.warning(f"No data collected for date {date_str}")
-                
+                stats = self.cache_manager.update_programs_data(collected_data, date_str)
             except Exception as e:
-                self.log.error(f"Error collecting data for date {date_str}: {e}")
-                continue
+                self.log.error(f"Error saving data for date {date_str}: {e}")
+                return
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+            collected_counts[date_str] = collected_counts.get(date_str, 0) + len(collected_data)
+        
+        # 取得は日付をまたいで優先度順に並列で行い、所要時間が応答待ちではなくレート制限で決まるようにする
+        self._collect_stations(targets, max_workers, on_collected, cancel_event, on_progress)
+        
+        if cancel_event is not None and cancel_event.is_set():
+            self.log.info(f"Weekly data collection cancelled: {sum(collected_counts.values())}/{len(targets)} station-days saved")
+            return False
+        
+        attempted = set(targets)
+        failed = [target for target in self.cache_manager.get_pending_crawl_tasks() if target in attempted]
+        if failed:
+            self.cache_manager.mark_crawl_tasks_failed(failed)
+            self.log.warning(f"{len(failed)} station-days could not be collected and will be retried next time")
+        
+        success_count = 0
+        # 再開した場合は、今回取得した日付だけを集計する
+        total_days = len({date_str for _, date_str in targets})
+        for date_str in sorted({date_str for _, date_str in targets}):
+            day_success_count = collected_counts.get(date_str, 0)
+            if day_success_count:
+                self.log.info(f"Successfully collected data for {day_success_count}/{len(station_ids)} stations on {date_str}")
+                success_count += 1
+            else:
+                self.log.warning(f"No data collected for date {date_str}")
         
         if success_count > 0:
-            self.log.info(f"Weekly data collection completed: {success_count}/{total_days} days successful")
+            self.log.info(
+                f"Weekly data collection completed: {success_count}/{total_days} days successful "
+                f"(inserted={totals['inserted']}, updated={totals['updated']}, deleted={totals['deleted']})"
+            )
+            http_stats = httpCache.get_shared_cache().get_stats()
+            self.log.info(
+                f"HTTP cache: hit ratio={http_stats['hit_ratio']:.0%}, "
+                f"received={http_stats['bytes_received']} bytes, saved={http_stats['bytes_saved']} bytes"
+            )
             return True
         else:
             self.log.error("Weekly data collection failed for all dates")
             return False
     
-    def _collect_station_data(self, station_id, date):
-        """単一放送局のデータを収集"""
-        try:
-            # 既存のProgramManagerを使用して番組データを取得
-            self.program_manager.retrieveRadioListings(station_id, date)
-            
-            # 番組情報を取得（安全に取得）
-            try:
-                titles = self.program_manager.gettitle() or []
-            except Exception as e:
-                self.log.warning(f"Failed to get titles for station {station_id}: {e}")
-                titles = []
+    def _collect_stations(self, targets, max_workers=None, on_collected=None, cancel_event=None, on_progress=None):
+        """(放送局ID, 日付) の組を並列に収集し、日付 -> {放送局ID: データ} の辞書を返す
+        
+        取得・解析・書き込みは段ごとのスレッドで重ねて行う（CollectorPipeline）。
+        targetsは優先度の高い順に並べておく（その順に取得を始める）。
+        on_collectedを指定した場合は、書き込み段のスレッドで日付ごとにまとめて on_collected(日付, {放送局ID: データ}) を呼び、
+        戻り値には結果を貯めない。
+        cancel_event・on_progressはcollect_weekly_data()と同じ。
+        """
+        fetcher = ConcurrentFetcher(max_workers or self.max_workers, self.rate_limiter)
+        collected = {}
+        progress = {'done': 0, 'total': len(targets)}
+        
+        def write(date, stations):
+            if on_collected is not None:
+                on_collected(date, stations)
+            else:
+                collected.setdefault(date, {}).update(stations)
+            if on_progress is not None:
+                progress['done'] += len(stations)
+                on_progress(progress['done'], progress['total'])
+        
+        with CollectorPipeline(write, parse_processes=self.parse_processes) as pipeline:
+            # エリア単位の一括取得で得られなかった放送局だけを個別に取得する
+            if self.bulk_fetch:
+                targets = self._collect_areas(fetcher, pipeline, targets, cancel_event)
             
-            try:
-                performers = self.program_manager.getpfm() or []
-            except Exception as e:
-                self.log.warning(f"Failed to get performers for station {station_id}: {e}")
-                performers = []
+            def on_station(key, body, error):
+                station_id, date = key
+                if isinstance(error, FetchCancelled):
+                    return
+                if error is not None:
+                    self.log.warning(f"Failed to collect data for station {station_id} on {date}: {error}")
+                    return
+                if body is None:
+                    return
+                
+                def handle(stations, parse_error):
+                    if parse_error is not None:
+                        self.log.warning(f"Failed to parse listings for station {station_id} on {date}: {parse_error}")
+                        return []
+                    return [(date, {station_id: self._build_station_data(station_id, date, stations.get(station_id, []))})]
+                
+                pipeline.submit(body, handle)
             
-            try:
-                start_times = self.program_manager.get_ftl() or []
-            except Exception as e:
-                self.log.warning(f"Failed to get start times for station {station_id}: {e}")
-                start_times = []
+            tasks = [
+                ((station_id, date), self.fetch_host,
+                 lambda station_id=station_id, date=date: pipeline.fetch(self.program_manager.fetchStationProgramsXml, station_id, date))
+                for station_id, date in targets
+            ]
+            fetcher.run(tasks, on_station, cancel_event)
+        return collected
+    
+    def _collect_areas(self, fetcher, pipeline, targets, cancel_event=None):
+        """エリア・日付ごとに番組表を一括取得してpipelineに渡し、取得できなかった (放送局ID, 日付) を優先度順に返す"""
+        area_codes = getattr(self.program_manager, 'values', {}) or {}
+        order = {target: index for index, target in enumerate(targets)}
+        # 各エリアの取得順は、そのエリアで最も優先度の高い放送局の順位になる
+        grouped = {}
+        remaining = []
+        remaining_lock = threading.Lock()
+        for station_id, date in targets:
+            area = area_codes.get(station_id)
+            if area:
+                grouped.setdefault((area, date), []).append(station_id)
+            else:
+                remaining.append((station_id, date))
+        
+        def on_area(key, body, error):
+            area, date = key
+            station_ids = grouped[key]
+            if error is not None or body is None:
+                if error is not None and not isinstance(error, FetchCancelled):
+                    self.log.warning(f"Failed to collect area listings for {area} on {date}, falling back to per-station requests: {error}")
+                with remaining_lock:
+                    remaining.extend((station_id, date) for station_id in station_ids)
+                return
             
-            try:
-                end_times = self.program_manager.get_tol() or []
-            except Exception as e:
-                self.log.warning(f"Failed to get end times for station {station_id}: {e}")
-                end_times = []
+            def handle(stations, parse_error):
+                if parse_error is not None:
+                    self.log.warning(f"Failed to parse area listings for {area} on {date}, falling back to per-station requests: {parse_error}")
+                    stations = {}
+                found = {}
+                missing = []
+                for station_id in station_ids:
+                    records = stations.get(station_id)
+                    station_data = self._build_station_data(station_id, date, records) if records is not None else None
+                    if station_data:
+                        found[station_id] = station_data
+                    else:
+                        missing.append((station_id, date))
+                with remaining_lock:
+                    remaining.extend(missing)
+                return [(date, found)] if found else []
             
+            pipeline.submit(body, handle)
+        
+        tasks = [
+            ((area, date), self.fetch_host,
+             lambda area=area, date=date: pipeline.fetch(self.program_manager.fetchAreaListingsXml, area, date))
+            for area, date in grouped
+        ]
+        fetcher.run(tasks, on_area, cancel_event)
+        # 取得できなかった放送局は解析が終わるまで確定しない
+        pipeline.join_parsing()
+        
+        remaining.sort(key=order.get)
+        self.log.info(f"Area bulk fetch: {len(tasks)} requests, {len(remaining)} station-days left for per-station requests")
+        return remaining
+    
+    def _resume_crawl_plan(self, date_list, station_ids):
+        """中断した週間収集の計画があれば、未完了の (放送局ID, 日付) を優先度順に返す（無ければNone）"""
+        info = self.cache_manager.get_crawl_plan_info()
+        if info is None or info['pending'] + info['failed'] == 0:
+            return None
+        if datetime.datetime.now() - info['created_at'] > datetime.timedelta(hours=CRAWL_PLAN_RESUME_HOURS):
+            return None
+        
+        # 計画は更新計画で選んだ一部の日付だけのこともあるため、日付の一覧ではなく今回の対象に含まれる単位で照合する
+        current_stations = set(station_ids)
+        current_dates = set(date_list)
+        targets = [
+            (station_id, date) for station_id, date in self.cache_manager.get_pending_crawl_tasks()
+            if station_id in current_stations and date in current_dates
+        ]
+        if not targets:
+            return None
+        self.log.info(f"Resuming interrupted weekly collection: {len(targets)} station-days left (done={info['done']})")
+        return targets
+    
+    def _get_station_usage(self):
+        """放送局ごとの利用度（再生回数 + 録音回数×重み + 有効な録音予約数×重み）"""
+        usage = {}
+        for station_id, (play_count, record_count) in self.cache_manager.get_station_usage().items():
+            usage[station_id] = play_count + record_count * RECORD_USAGE_WEIGHT
+        try:
+            from recorder import schedule_manager
+            for schedule in schedule_manager.get_schedules():
+                if schedule.enabled:
+                    usage[schedule.station_id] = usage.get(schedule.station_id, 0) + RECORD_USAGE_WEIGHT
+        except Exception as e:
+            self.log.debug(f"Failed to read recording schedules for prioritization: {e}")
+        return usage
+    
+    def _prioritize_targets(self, targets):
+        """(放送局ID, 日付) を取得する順に並べる
+        
+        今日の放送日を最優先し、次によく再生・録音する放送局、その後は今日から近い日付の順にする。
+        """
+        today = self.calendar_util.get_radio_date()
+        today_date = datetime.datetime.strptime(today, '%Y%m%d')
+        usage = self._get_station_usage()
+        
+        def priority(target):
+            station_id, date = target
+            used = usage.get(station_id, 0)
+            distance = abs((datetime.datetime.strptime(date, '%Y%m%d') - today_date).days)
+            return (date != today, used == 0, distance, -used, station_id)
+        
+        return sorted(targets, key=priority)
+    
+    def _build_station_data(self, station_id, date, records):
+        """番組レコード（ProgramRecordのリスト）から放送局データを作成"""
+        programs = []
+        for record in records:
+            # タイトルが存在する場合のみ番組として追加
+            if not record.title:
+                continue
             try:
-                descriptions = self.program_manager.getDescriptions() or []
+                formatted_start = self._format_time(record.start_time) if record.start_time else ''
+                formatted_end = self._format_time(record.end_time) if record.end_time else ''
+                # 検索時に日付規則を解釈しなくて済むよう、実際の放送日時をここで確定させる
+                start_epoch, end_epoch = self.calendar_util.get_broadcast_epochs(date, formatted_start, formatted_end)
+                programs.append({
+                    'title': record.title,
+                    'performer': record.performer,
+                    'start_time': formatted_start,
+                    'end_time': formatted_end,
+                    'start_epoch': start_epoch,
+                    'end_epoch': end_epoch,
+                    'description': record.description
+                })
             except Exception as e:
-                self.log.warning(f"Failed to get descriptions for station {station_id}: {e}")
-                descriptions = []
-            
-            # データの長さを確認
-            max_length = max(len(titles), len(performers), len(start_times), len(end_times), len(descriptions))
-            self.log.debug(f"Station {station_id}: titles={len(titles)}, performers={len(performers)}, start_times={len(start_times)}, end_times={len(end_times)}, descriptions={len(descriptions)}, max_length={max_length}")
-            
-            # データを整理（安全にアクセス）
-            programs = []
-            for i in range(max_length):
-                try:
-                    # 各配列から安全に値を取得
-                    title = titles[i] if i < len(titles) and titles[i] else ''
-                    performer = performers[i] if i < len(performers) and performers[i] else ''
-                    start_time = start_times[i] if i < len(start_times) and start_times[i] else ''
-                    end_time = end_times[i] if i < len(end_times) and end_times[i] else ''
-                    description = descriptions[i] if i < len(descriptions) and descriptions[i] else ''
-                    
-                    # タイトルが存在する場合のみ番組として追加
-                    if title and title.strip():
-                        program = {
-                            'title': title.strip(),
-                            'performer': performer.strip() if performer else '',
-                            'start_time': self._format_time(start_time) if start_time else '',
-                            'end_time': self._format_time(end_time) if end_time else '',
-                            'description': description.strip() if description else ''
-                        }
-                        programs.append(program)
-                        
-                except Exception as e:
-                    self.log.warning(f"Failed to process program data at index {i} for station {station_id}: {e}")
-                    continue
-            
-            # 放送局情報を取得
-            station_name = ''
-            if self.radio_manager and hasattr(self.radio_manager, 'stid'):
-                station_name = self.radio_manager.stid.get(station_id, '')
-            
-            self.log.debug(f"Collected {len(programs)} programs for station {station_id}")
-            
-            return {
-                'name': station_name,
-                'programs': programs
-            }
-            
-        except Exception as e:
-            self.log.error(f"Failed to collect data for station {station_id}: {e}")
-            import traceback
-            self.log.error(f"Traceback: {traceback.format_exc()}")
-            return None
+                self.log.warning(f"Failed to process program '{record.title}' for station {station_id}: {e}")
+                continue
+        
+        # 放送局情報を取得
+        station_name = ''
+        if self.radio_manager and hasattr(self.radio_manager, 'stid'):
+            station_name = self.radio_manager.stid.get(station_id, '')
+        
+        self.log.debug(f"Collected {len(programs)} programs for station {station_id}")
+        
+        return {
+            'name': station_name,
+            'programs': programs
+        }
     
     def _format_time(self, time_str):
         """時間文字列をフォーマット"""
@@ -298,8 +461,8 @@ class ProgramDataCollector:
     def get_available_dates(self):
         """利用可能な日付のリストを取得"""
         try:
-            cursor = self.cache_manager.conn.cursor()
-            cursor.execute("SELECT DISTINCT date FROM programs ORDER BY date DESC")
+            cursor = self.cache_manager.reader_connection().cursor()
+            cursor.execute("SELECT DISTINCT date FROM program_day_stats ORDER BY date DESC")
             dates = [row[0] for row in cursor.fetchall()]
             return dates
         except Exception as e:
@@ -309,8 +472,12 @@ class ProgramDataCollector:
     def get_station_list(self):
         """収集済みの放送局リストを取得"""
         try:
-            cursor = self.cache_manager.conn.cursor()
-            cursor.execute("SELECT DISTINCT station_id, station_name FROM programs ORDER BY station_name")
+            cursor = self.cache_manager.reader_connection().cursor()
+            cursor.execute('''
+                SELECT station_id, station_name FROM stations
+                WHERE id IN (SELECT station_key FROM program_day_stats)
+                ORDER BY station_name
+            ''')
             stations = [(row[0], row[1]) for row in cursor.fetchall()]
             return stations
         except Exception as e:
@@ -3,6 +3,7 @@
 
 import wx
 from views import recordingWizzard
+from views import onairMusicPoller
 from simpleDialog import *
 
 
@@ -49,9 +50,10 @@ class ProgramInfoHandler:
         if not self.events.displaying:
             return
         
-        if self.parent.progs.getNowProgramDsc(station_id):
+        program = self._get_now_program(station_id)
+        if program and program['description']:
             self.DSCBOX.Enable()
-            self.DSCBOX.SetValue(self.parent.progs.getNowProgramDsc(station_id))
+            self.DSCBOX.SetValue(program['description'])
         else:
             self.DSCBOX.SetValue("")
 
@@ -62,8 +64,10 @@ class ProgramInfoHandler:
             return
         
         self.nplist.Enable()
-        program_title = self.parent.progs.getNowProgram(station_id)
-        program_pfm = self.parent.progs.getnowProgramPfm(station_id)
+        # 取得がまだの場合は空欄にしておき、取得できた時点でonNowPlayingChangedから表示し直す
+        program = self._get_now_program(station_id)
+        program_title = program['title'] if program else ""
+        program_pfm = program['performer'] if program else ""
         station_name = self.parent.radio_manager.stid.get(station_id, station_id)
 
         # リストビューにアペンド
@@ -71,6 +75,16 @@ class ProgramInfoHandler:
         self.nplist.Append(("番組名", program_title))
         self.nplist.Append(("出演者", program_pfm))
 
+    def _get_now_program(self, station_id):
+        """放送中の番組をキャッシュから取得（通信しない）
+        
+        番組の切り替わりに合わせて取得している情報を優先し、まだ無い場合は番組キャッシュから探す。
+        """
+        program = self.parent.radio_manager.now_playing.get(station_id)
+        if program is not None:
+            return program._asdict()
+        return self.parent.progs.get_cached_now_program(station_id)
+
     def show_onair_music(self, station_id):
         """オンエア曲情報を表示"""
         # 番組情報が非表示の場合は何もしない
@@ -84,9 +98,9 @@ class ProgramInfoHandler:
             self.nplist.Append(("オンエア曲", ""))
 
     def _get_onair_music_safely(self, station_id):
-        """オンエア曲情報を取得"""
+        """オンエア曲情報を取得（ポーラーが取得済みの曲を返し、通信しない）"""
         try:
-            return self.parent.progs.get_onair_music(station_id)
+            return onairMusicPoller.format_track(onairMusicPoller.get_shared_poller().get_current(station_id))
         except Exception as e:
             self.log.warning(f"Failed to get online music: {e}")
             return None
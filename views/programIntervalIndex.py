@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# 放送時間帯のメモリ内インデックスモジュール
+
+import bisect
+import threading
+from collections import namedtuple
+from logging import getLogger
+import constants
+
+# インデックスに載せる番組1つ分の情報（start_epoch/end_epochは放送開始・終了のUNIX時刻）
+IntervalProgram = namedtuple('IntervalProgram', [
+    'station_id', 'station_name', 'title', 'performer', 'start_epoch', 'end_epoch', 'date'
+])
+
+class StationIntervals:
+    """1放送局分の番組を放送開始順に並べた配列（作成後は変更しない）
+
+    ends_maxは先頭からその番組までの終了時刻の最大値で、単調に増えるため二分探索できる。
+    番組の時間帯が重なっていても正しく答えられる。
+    """
+
+    def __init__(self, programs):
+        self.programs = sorted(programs, key=lambda program: (program.start_epoch, program.end_epoch))
+        self.starts = [program.start_epoch for program in self.programs]
+        self.ends_max = []
+        latest = None
+        for program in self.programs:
+            latest = program.end_epoch if latest is None else max(latest, program.end_epoch)
+            self.ends_max.append(latest)
+
+    def at(self, epoch):
+        """epochの時点で放送中の番組（無い場合はNone）"""
+        index = bisect.bisect_right(self.starts, epoch) - 1
+        # 開始時刻がepoch以前の番組のうち、終了時刻がepochより後のものを後ろから探す（重なりが無ければ1件目で決まる）
+        while index >= 0 and self.ends_max[index] > epoch:
+            if self.programs[index].end_epoch > epoch:
+                return self.programs[index]
+            index -= 1
+        return None
+
+    def overlapping(self, start_epoch, end_epoch):
+        """[start_epoch, end_epoch) と放送時間帯が重なる番組（放送開始順）"""
+        low = bisect.bisect_right(self.ends_max, start_epoch)
+        high = bisect.bisect_left(self.starts, end_epoch)
+        return [program for program in self.programs[low:high] if program.end_epoch > start_epoch]
+
+    def next_start(self, epoch):
+        """epochより後に始まる最初の番組の開始時刻（無い場合はNone）"""
+        index = bisect.bisect_right(self.starts, epoch)
+        return self.starts[index] if index < len(self.starts) else None
+
+class ProgramIntervalIndex:
+    """全放送局の番組の放送時間帯をメモリに持ち、ある時刻・時間帯に放送される番組に答えるインデックス
+
+    番組キャッシュへの取り込み時に放送局・放送日単位で差し替える。
+    問い合わせは1放送局あたりO(log n)で、通信もデータベースへの問い合わせも行わない。
+    """
+
+    def __init__(self):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramIntervalIndex")
+        self.lock = threading.Lock()
+        # 放送局ID -> {放送日: [IntervalProgram]}（差し替えの単位）
+        self.station_days = {}
+        # 放送局ID -> StationIntervals（問い合わせ用。差し替え時に作り直す）
+        self.stations = {}
+
+    def load(self, programs):
+        """番組の一覧からインデックスを作り直す"""
+        station_days = {}
+        for program in programs:
+            station_days.setdefault(program.station_id, {}).setdefault(program.date, []).append(program)
+        stations = {station_id: self._build(days) for station_id, days in station_days.items()}
+        with self.lock:
+            self.station_days = station_days
+            self.stations = stations
+        self.log.info(f"Interval index loaded: {sum(len(s.programs) for s in stations.values())} programs, {len(stations)} stations")
+
+    def replace_station_day(self, station_id, date, programs):
+        """放送局・放送日の番組を差し替える"""
+        with self.lock:
+            days = dict(self.station_days.get(station_id, {}))
+            days[date] = list(programs)
+            self.station_days[station_id] = days
+            self.stations[station_id] = self._build(days)
+
+    def drop_dates(self, dates):
+        """放送日の番組を取り除く（古いデータの削除に合わせて呼ぶ）"""
+        dates = set(dates)
+        with self.lock:
+            for station_id, days in list(self.station_days.items()):
+                if not dates & days.keys():
+                    continue
+                days = {date: programs for date, programs in days.items() if date not in dates}
+                self.station_days[station_id] = days
+                self.stations[station_id] = self._build(days)
+
+    @staticmethod
+    def _build(days):
+        # 放送日をまたぐ番組は両方の日に載ることがあるため、同じ時間帯の番組は1つにまとめる
+        unique = {}
+        for programs in days.values():
+            for program in programs:
+                unique.setdefault((program.start_epoch, program.end_epoch), program)
+        return StationIntervals(unique.values())
+
+    def _snapshot(self, station_id=None):
+        with self.lock:
+            if station_id is not None:
+                intervals = self.stations.get(station_id)
+                return {station_id: intervals} if intervals else {}
+            return dict(self.stations)
+
+    def program_at(self, station_id, epoch):
+        """放送局でepochの時点に放送中の番組（無い場合はNone）"""
+        intervals = self._snapshot(station_id).get(station_id)
+        return intervals.at(epoch) if intervals else None
+
+    def programs_at(self, epoch):
+        """epochの時点に放送中の番組を放送局IDをキーにした辞書で返す（放送中の番組が無い放送局は含まない）"""
+        result = {}
+        for station_id, intervals in self._snapshot().items():
+            program = intervals.at(epoch)
+            if program is not None:
+                result[station_id] = program
+        return result
+
+    def programs_between(self, start_epoch, end_epoch, station_id=None):
+        """[start_epoch, end_epoch) と放送時間帯が重なる番組を放送局IDをキーにした辞書で返す"""
+        result = {}
+        for key, intervals in self._snapshot(station_id).items():
+            programs = intervals.overlapping(start_epoch, end_epoch)
+            if programs:
+                result[key] = programs
+        return result
+
+    def next_change(self, epoch, station_ids=None):
+        """epochより後で、いずれかの放送局の放送中の番組が変わる最初の時刻（無い場合はNone）"""
+        changes = []
+        for station_id, intervals in self._snapshot().items():
+            if station_ids is not None and station_id not in station_ids:
+                continue
+            program = intervals.at(epoch)
+            if program is not None:
+                changes.append(program.end_epoch)
+            next_start = intervals.next_start(epoch)
+            if next_start is not None:
+                changes.append(next_start)
+        return min(changes) if changes else None
@@ -5,6 +5,7 @@ import globalVars
 import wx
 import datetime
 import os
+import time
 from logging import getLogger
 import constants
 import simpleDialog
@@ -17,6 +18,11 @@ from searchHistoryManager import SearchHistoryManager
 from recorder import schedule_manager, RecordingSchedule
 from notification_util import notify as notification_notify
 
+# 残りがこの件数になるまでフォーカスが進んだら次のページを読み込む
+RESULT_PREFETCH_MARGIN = 20
+# データ更新中に検索結果を新しいデータで差し替える最短の間隔（秒）
+LIVE_RESULT_REFRESH_INTERVAL = 2.0
+
 class ProgramSearchDialog(BaseDialog):
     """番組検索ダイアログ"""
     
@@ -49,12 +55,20 @@ class ProgramSearchDialog(BaseDialog):
         if self.search_engine is None:
             self.search_engine = ProgramSearchEngine(self.cache_manager)
 
-        # データ収集器は必要時にのみ生成（更新フォールバック用）
-        # radio_manager がある場合は設定する
-        # 実際の生成は _perform_data_refresh のフォールバックで行う
+        # データの収集は起動時コントローラのバックグラウンド更新で行う（_start_revalidation）
         
-        # 検索結果
+        # 検索結果（読み込み済みのページ）と続きを取得するカーソル
         self.search_results = []
+        self.search_cursor = None
+        # データ更新中に結果を差し替えるため、最後の検索条件と検索時のキャッシュの世代を覚えておく
+        self.last_search_criteria = None
+        self.results_generation = None
+        self.last_results_reload = 0.0
+        
+        # バックグラウンドのデータ更新
+        self.refresh_task = None
+        self.refresh_requested_by_user = False
+        self.closed = False
         
         # 検索履歴管理
         self.history_manager = SearchHistoryManager()
@@ -65,6 +79,8 @@ class ProgramSearchDialog(BaseDialog):
         self.log.debug("Initializing ProgramSearchDialog")
         super().Initialize(globalVars.app.hMainView.hFrame, _("番組検索"))
         self.InstallControls()
+        # キャッシュ済みのデータですぐに検索できるようにし、更新はバックグラウンドで行う
+        self._start_revalidation(force=False)
         return True
     
     def InstallControls(self):
@@ -108,6 +124,9 @@ class ProgramSearchDialog(BaseDialog):
         self.station_combo, station_label = creator.combobox(_("放送局"), [])
         self.station_combo.Bind(wx.EVT_COMBOBOX, self.onStationChanged)
         
+        # 並び順（関連度順はタイトル・出演者を指定した検索でのみ有効）
+        self.sort_combo, sort_label = creator.combobox(_("並び順"), [_("放送日時順"), _("関連度順")], state=0)
+        
         # 開始日時（コンボボックス・スピンコントロール）
         creator.staticText(_("開始日時"))
         date_creator = views.ViewCreator.ViewCreator(
@@ -144,6 +163,7 @@ class ProgramSearchDialog(BaseDialog):
         self.result_list.AppendColumn(_("開始"),0,120)
         self.result_list.AppendColumn(_("終了"),0,120)
         self.result_list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.onItemActivated)
+        self.result_list.Bind(wx.EVT_LIST_ITEM_FOCUSED, self.onResultFocused)
 
     def create_buttons(self):
         """ボタンエリアを作成"""
@@ -169,6 +189,8 @@ class ProgramSearchDialog(BaseDialog):
         
         # データ更新ボタン
         self.refresh_btn = button_area_creator.button(_("データ更新"), event=self.onRefresh)
+        self.refresh_cancel_btn = button_area_creator.button(_("更新を中止"), event=self.onRefreshCancel)
+        self.refresh_cancel_btn.Enable(False)
 
         # 見た目の調整
         button_area_creator.AddSpace(-1)
@@ -176,6 +198,9 @@ class ProgramSearchDialog(BaseDialog):
         # 閉じるボタン
         self.close_btn = button_area_creator.cancelbutton(_("閉じる"), event=self.onClose)
         
+        # データ更新の進捗
+        self.refresh_gauge, self.refresh_status = self.creator.gauge(_("データ更新"), max=1, x=600, margin=5)
+        
         # 検索結果リストの選択変更イベントをバインド
         self.result_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.onItemSelected)
         self.result_list.Bind(wx.EVT_LIST_ITEM_DESELECTED, self.onItemDeselected)
@@ -247,45 +272,17 @@ class ProgramSearchDialog(BaseDialog):
                 self.log.error(f"Fallback date setup also failed: {e2}")
     
     def collect_initial_data(self):
-        """初期データの収集"""
+        """初期データの収集（キャッシュ済みのデータで表示し、更新はバックグラウンドで行う）"""
         try:
-            # 放送局リストを更新
             self.update_station_list()
-            
-            # データベースの状態を確認
-            if hasattr(self, 'cache_manager') and self.cache_manager:
-                summary = self.cache_manager.get_weekly_data_summary()
-                if summary:
-                    self.log.info(f"Database status: {summary['total_programs']} programs across {summary['total_stations']} stations")
-                    self.log.info(f"Date range: {summary['date_range']}")
-                    for date_str, count in summary['weekly_summary'].items():
-                        self.log.debug(f"Date {date_str}: {count} programs")
-                    
-                    # 1週間分のデータが不完全な場合は強制更新
-                    if not self.cache_manager.is_weekly_cache_complete():
-                        self.log.info("Weekly cache is incomplete, forcing weekly data update")
-                        try:
-                            if hasattr(globalVars.app.hMainView, 'program_cache_controller'):
-                                success = globalVars.app.hMainView.program_cache_controller.ensure_weekly_data()
-                                if success:
-                                    self.log.info("Weekly data update completed successfully")
-                                else:
-                                    self.log.warning("Weekly data update failed")
-                        except (AttributeError, NameError) as e:
-                            self.log.warning(f"Failed to access program_cache_controller: {e}")
-                else:
-                    self.log.warning("No database summary available")
-            
-            # 今日のデータを収集（フォールバック）
-            self.data_collector.collect_all_stations_data()
-            
+            self._start_revalidation(force=False)
         except Exception as e:
             self.log.error(f"Failed to collect initial data: {e}")
     
     def _debug_date_in_database(self, search_date):
         """データベースの日付形式をデバッグ"""
         try:
-            cursor = self.cache_manager.conn.cursor()
+            cursor = self.cache_manager.reader_connection().cursor()
             
             # 指定された日付のデータを確認
             cursor.execute("SELECT DISTINCT date FROM programs WHERE date = ? LIMIT 5", (search_date,))
@@ -348,17 +345,20 @@ class ProgramSearchDialog(BaseDialog):
         
         # デバッグ情報をログ出力
         self.log.info(f"Search criteria: {search_criteria}")
+        self.last_search_criteria = dict(search_criteria)
+        self.results_generation = getattr(self.cache_manager, 'generation', None)
         
         # データベースの日付形式を確認
         if hasattr(self, 'cache_manager') and self.cache_manager and 'date' in search_criteria:
             self._debug_date_in_database(search_criteria['date'])
         
-        # 検索実行
+        # 検索実行（最初のページだけを取得し、続きはスクロールに合わせて読み込む）
         use_time_range = search_criteria.pop('use_time_range_search', False)
-        self.search_results = self.search_engine.search_combined(
+        self.search_cursor = self.search_engine.open_combined_search(
             use_time_range_search=use_time_range,
             **search_criteria
         )
+        self.search_results = self.search_cursor.fetch_page()
         
         # 検索結果のデバッグ情報
         self.log.info(f"Search completed: {len(self.search_results)} results found")
@@ -394,6 +394,10 @@ class ProgramSearchDialog(BaseDialog):
         if station_name and station_name != _("指定なし"):
             criteria['station_name'] = station_name
         
+        # 並び順
+        if self.sort_combo.GetSelection() == 1 and ('title' in criteria or 'performer' in criteria):
+            criteria['sort'] = 'relevance'
+        
         # 日付（コンボボックスから取得）
         date_selection = self.date_combo.GetSelection()
         if date_selection >= 0:
@@ -452,43 +456,11 @@ class ProgramSearchDialog(BaseDialog):
                 pass
             return
         
-        for program in self.search_results:
-            # 時間の表示を整形
-            start_time = program.get('start_time', '')
-            end_time = program.get('end_time', '')
-            
-            # HH:MM:SS形式からHH:MM形式に変換
-            if start_time and len(start_time) >= 5:
-                start_time = start_time[:5]
-            if end_time and len(end_time) >= 5:
-                end_time = end_time[:5]
-            
-            # 日付情報を追加
-            date = program.get('date', '')
-            self.log.debug(f"Program date: '{date}' (type: {type(date)})")
-            
-            if date and len(date) == 8:
-                # YYYYMMDD形式をMM/DD形式に変換
-                formatted_date = f"{date[4:6]}/{date[6:8]}"
-            else:
-                formatted_date = date
-            
-            # 放送局名に日付を追加
-            station_name = program.get('station_name', '')
-            if formatted_date:
-                station_name = f"[{formatted_date}] {station_name}"
-            
-            self.result_list.Append((
-                station_name,
-                program.get('title', ''),
-                program.get('performer', ''),
-                start_time,
-                end_time
-            ))
+        self.result_list.extend([self._format_result_row(program) for program in self.search_results])
         
         # 結果数を更新
         count = len(self.search_results)
-        self.result_count_label.SetLabel(_(f"検索結果: {count}件"))
+        self._update_result_count_label()
         
         if count > 0:
             self.result_list.Focus(0)
@@ -496,12 +468,77 @@ class ProgramSearchDialog(BaseDialog):
                 self.result_list.Select(0)
                 # 最初のアイテムが選択されたので予約録音ボタンを有効化
                 self.schedule_btn.Enable(True)
-                globalVars.app.say(_(f"結果 {count}件"), interrupt=True)
+                if self.search_cursor and self.search_cursor.has_more:
+                    globalVars.app.say(_("結果 {count}件以上").format(count=count), interrupt=True)
+                else:
+                    globalVars.app.say(_("結果 {count}件").format(count=count), interrupt=True)
             except Exception:
                 pass
             # 結果数をログ出力
             self.log.info(f"Displayed {count} search results")
-        
+    
+    def _format_result_row(self, program):
+        """検索結果の1件をリストの行に整形"""
+        # 時間の表示を整形
+        start_time = program.get('start_time', '')
+        end_time = program.get('end_time', '')
+        
+        # HH:MM:SS形式からHH:MM形式に変換
+        if start_time and len(start_time) >= 5:
+            start_time = start_time[:5]
+        if end_time and len(end_time) >= 5:
+            end_time = end_time[:5]
+        
+        # 日付情報を追加
+        date = program.get('date', '')
+        
+        if date and len(date) == 8:
+            # YYYYMMDD形式をMM/DD形式に変換
+            formatted_date = f"{date[4:6]}/{date[6:8]}"
+        else:
+            formatted_date = date
+        
+        # 放送局名に日付を追加
+        station_name = program.get('station_name', '')
+        if formatted_date:
+            station_name = f"[{formatted_date}] {station_name}"
+        
+        return (
+            station_name,
+            program.get('title', ''),
+            program.get('performer', ''),
+            start_time,
+            end_time
+        )
+    
+    def _update_result_count_label(self):
+        """結果数の表示を更新（続きがある場合は読み込み済みの件数以上と表示）"""
+        count = len(self.search_results)
+        if self.search_cursor and self.search_cursor.has_more:
+            self.result_count_label.SetLabel(_("検索結果: {count}件以上").format(count=count))
+        else:
+            self.result_count_label.SetLabel(_("検索結果: {count}件").format(count=count))
+    
+    def onResultFocused(self, event):
+        """結果リストのフォーカス移動時に、末尾が近ければ次のページを読み込む"""
+        try:
+            index = event.GetIndex()
+            if index >= len(self.search_results) - RESULT_PREFETCH_MARGIN:
+                self._load_more_results()
+        except Exception as e:
+            self.log.error(f"Failed to load more results: {e}")
+        event.Skip()
+    
+    def _load_more_results(self):
+        """検索結果の次のページを読み込んでリストに追加"""
+        if not self.search_cursor or not self.search_cursor.has_more or not self.search_results:
+            return
+        page = self.search_cursor.fetch_page()
+        if page:
+            self.search_results.extend(page)
+            self.result_list.extend([self._format_result_row(program) for program in page])
+            self.log.debug(f"Loaded {len(page)} more search results (total {len(self.search_results)})")
+        self._update_result_count_label()
     
     def onItemActivated(self, event):
         """リストアイテムがダブルクリックされた時の処理"""
@@ -543,7 +580,7 @@ class ProgramSearchDialog(BaseDialog):
             pd.show_pfm([program.get('performer', '')], 0)
             pd.show_starttime([program.get('start_time', '')], 0)
             pd.show_endtime([program.get('end_time', '')], 0)
-            pd.show_dsc([program.get('description', '')], 0)
+            pd.show_dsc([self.cache_manager.get_program_description(program)], 0)
             
             pd.Initialize()
             pd.Show()
@@ -558,6 +595,7 @@ class ProgramSearchDialog(BaseDialog):
         self.performer_combo.SetValue("")
         self.station_combo.SetSelection(0)  # 「指定なし」を選択
         self.date_combo.SetSelection(0)  # 「指定なし（全日付）」を選択
+        self.sort_combo.SetSelection(0)  # 「放送日時順」を選択
         
         # スピンコントロールをリセット（ラジオ形式：5-29時、分は0分から）
         self.start_hour_spin.SetValue(5)
@@ -565,6 +603,8 @@ class ProgramSearchDialog(BaseDialog):
         self.end_hour_spin.SetValue(28)
         self.end_minute_spin.SetValue(59)
         
+        self.search_results = []
+        self.search_cursor = None
         self.result_list.clear()
         self.result_count_label.SetLabel(_("検索結果: 0件"))
     
@@ -647,34 +687,127 @@ class ProgramSearchDialog(BaseDialog):
             simpleDialog.errorDialog(_("操作中にエラーが発生しました。"))
     
     def _perform_data_refresh(self):
-        """データ更新の実際の処理"""
-        # 起動時コントローラに更新を委譲
-        success = False
-        try:
-            controller = getattr(globalVars.app.hMainView, 'program_cache_controller', None)
-            if controller and hasattr(controller, 'force_weekly_update'):
-                self.log.info("Requesting ProgramCacheController to force weekly update")
-                success = controller.force_weekly_update()
-        except Exception as e:
-            self.log.warning(f"Controller update failed: {e}")
-
-        # フォールバック: 最低限の当日データを収集（必要時のみ）
-        if not success:
-            try:
-                if self.data_collector is None:
-                    self.data_collector = ProgramDataCollector(self.cache_manager)
-                    if self.radio_manager:
-                        self.data_collector.set_radio_manager(self.radio_manager)
-                self.log.warning("Falling back to today's data collection")
-                success = self.data_collector.collect_all_stations_data(force_refresh=True)
-            except Exception as e:
-                self.log.error(f"Fallback data collection failed: {e}")
+        """データ更新の実際の処理（ダイアログは操作できるまま、バックグラウンドで更新する）"""
+        if not self._start_revalidation(force=True):
+            simpleDialog.dialog(_("準備中"), _("起動処理が完了していません。しばらくしてから再度お試しください。"))
+    
+    def _start_revalidation(self, force=False):
+        """起動時コントローラにバックグラウンド更新を依頼（コントローラの準備ができていない場合はFalse）"""
+        controller = getattr(globalVars.app.hMainView, 'program_cache_controller', None)
+        if controller is None or not hasattr(controller, 'start_background_refresh'):
+            self.log.info("ProgramCacheController is not ready, skipping revalidation")
+            return False
+        
+        self.refresh_requested_by_user = self.refresh_requested_by_user or force
+        self.refresh_btn.Enable(False)
+        self.refresh_cancel_btn.Enable(True)
+        self.refresh_gauge.SetValue(0)
+        self.refresh_status.SetLabel(_("データ更新中"))
+        # 通知は更新処理のスレッドから届くので、GUIスレッドに移して処理する
+        self.refresh_task = controller.start_background_refresh(
+            force,
+            on_progress=lambda done, total: wx.CallAfter(self._on_refresh_progress, done, total),
+            on_finished=lambda success, cancelled: wx.CallAfter(self._on_refresh_finished, success, cancelled)
+        )
+        return True
+    
+    def onRefreshCancel(self, event):
+        """データ更新を中止（取得済みの分は保存され、残りは次回の更新で取得する）"""
+        if self.refresh_task:
+            self.refresh_task.cancel()
+            self.refresh_cancel_btn.Enable(False)
+            self.refresh_status.SetLabel(_("データ更新を中止しています"))
+    
+    def _on_refresh_progress(self, done, total):
+        """データ更新の進捗（GUIスレッド）"""
+        if self.closed:
+            return
+        self.refresh_gauge.SetRange(max(total, 1))
+        self.refresh_gauge.SetValue(min(done, total))
+        self.refresh_status.SetLabel(_("データ更新中: {done}/{total}").format(done=done, total=total))
         
-        if success:
-            simpleDialog.dialog(_("完了"), _("データの更新が完了しました。"))
-            self.update_station_list()
+        # 新しいデータが保存されていれば、間隔を空けて検索結果を差し替える
+        if time.monotonic() - self.last_results_reload >= LIVE_RESULT_REFRESH_INTERVAL:
+            self._reload_results_if_changed()
+    
+    def _on_refresh_finished(self, success, cancelled):
+        """データ更新の完了（GUIスレッド）"""
+        if self.closed:
+            return
+        requested_by_user = self.refresh_requested_by_user
+        self.refresh_requested_by_user = False
+        self.refresh_task = None
+        self.refresh_btn.Enable(True)
+        self.refresh_cancel_btn.Enable(False)
+        
+        if cancelled:
+            self.refresh_status.SetLabel(_("データ更新を中止しました"))
+        elif success:
+            self.refresh_gauge.SetValue(self.refresh_gauge.GetRange())
+            self.refresh_status.SetLabel(_("データは最新です"))
         else:
-            simpleDialog.errorDialog(_("データの更新に失敗しました。"))
+            self.refresh_status.SetLabel(_("データの更新に失敗しました"))
+        
+        self._reload_results_if_changed()
+        self._update_choices()
+        
+        if requested_by_user and not cancelled:
+            if success:
+                simpleDialog.dialog(_("完了"), _("データの更新が完了しました。"))
+            else:
+                simpleDialog.errorDialog(_("データの更新に失敗しました。"))
+    
+    def _update_choices(self):
+        """放送局・日付の選択肢を更新（選択中の項目は保つ）"""
+        station = self.station_combo.GetStringSelection()
+        date = self.date_combo.GetStringSelection()
+        self.update_station_list()
+        self.setup_date_options()
+        if station and self.station_combo.FindString(station) != wx.NOT_FOUND:
+            self.station_combo.SetStringSelection(station)
+        if date and self.date_combo.FindString(date) != wx.NOT_FOUND:
+            self.date_combo.SetStringSelection(date)
+    
+    def _reload_results_if_changed(self):
+        """最後の検索の後に番組データが変わっていれば、同じ条件で検索し直して結果を差し替える
+        
+        読み込み済みの件数とフォーカス位置は保ち、読み上げは行わない。
+        """
+        generation = getattr(self.cache_manager, 'generation', None)
+        if not self.last_search_criteria or generation == self.results_generation:
+            return
+        self.last_results_reload = time.monotonic()
+        self.results_generation = generation
+        try:
+            criteria = dict(self.last_search_criteria)
+            use_time_range = criteria.pop('use_time_range_search', False)
+            loaded = len(self.search_results)
+            focused = self.result_list.GetFocusedItem()
+            
+            cursor = self.search_engine.open_combined_search(use_time_range_search=use_time_range, **criteria)
+            results = cursor.fetch_page()
+            while cursor.has_more and len(results) < loaded:
+                page = cursor.fetch_page()
+                if not page:
+                    break
+                results.extend(page)
+            self.search_cursor = cursor
+            self.search_results = results
+            
+            self.result_list.clear()
+            if not results:
+                self.result_list.Append((_("検索結果がありません"), "", "", "", ""))
+                self.schedule_btn.Enable(False)
+            else:
+                self.result_list.extend([self._format_result_row(program) for program in results])
+                if focused >= 0:
+                    index = min(focused, len(results) - 1)
+                    self.result_list.Focus(index)
+                    self.result_list.Select(index)
+            self._update_result_count_label()
+            self.log.debug(f"Search results refreshed with new data: {len(results)} results")
+        except Exception as e:
+            self.log.error(f"Failed to refresh search results: {e}")
     
     def onScheduleRecording(self, event):
         """選択された番組を予約録音"""
@@ -821,7 +954,8 @@ class ProgramSearchDialog(BaseDialog):
             simpleDialog.errorDialog(f"録音スケジュールに失敗しました: {e}")
     
     def onClose(self, event):
-        """ダイアログを閉じる"""
+        """ダイアログを閉じる（データ更新は取り消さずにバックグラウンドで続ける）"""
+        self.closed = True
         self.Destroy()
     
     def setup_history_initial_state(self):
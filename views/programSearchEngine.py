@@ -3,16 +3,93 @@
 
 import datetime
 import re
+import threading
+import time
+from collections import OrderedDict
 from logging import getLogger
 import constants
-from views.programCacheManager import ProgramCacheManager
+from views.programCacheManager import ProgramCacheManager, SEARCH_PAGE_SIZE
+
+# 検索結果キャッシュに保持する検索条件の数
+RESULT_CACHE_SIZE = 256
+# 放送中の番組がない場合に、その結果をキャッシュから返す秒数
+EMPTY_ON_AIR_CACHE_SECONDS = 60
 
 class ProgramSearchEngine:
-    """番組検索エンジン"""
+    """番組検索エンジン
+    
+    検索結果は検索条件ごとにLRUキャッシュする。キャッシュは番組データの世代（取り込みのたびに増える）が
+    変わるか、結果の番組の放送開始（放送中の番組は放送終了）を過ぎると無効になる。
+    """
     
     def __init__(self, cache_manager=None):
         self.log = getLogger(f"{constants.LOG_PREFIX}.ProgramSearchEngine")
         self.cache_manager = cache_manager or ProgramCacheManager()
+        self.result_cache = OrderedDict()  # キー -> (世代, 有効期限のエポック秒, 結果)
+        self.result_cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def _normalize_criteria(self, criteria):
+        """検索条件をキャッシュのキーに変換（空の条件を除き、文字列の前後の空白を除く）"""
+        items = []
+        for key, value in criteria.items():
+            if isinstance(value, str):
+                value = value.strip()
+            if value is None or value == '':
+                continue
+            items.append((key, value))
+        return tuple(sorted(items))
+    
+    def _get_cached_result(self, key):
+        """キャッシュから結果を取得（ない、または無効な場合はNone）"""
+        with self.result_cache_lock:
+            entry = self.result_cache.get(key)
+            if entry is not None:
+                generation, expires_at, result = entry
+                if generation == self.cache_manager.generation and (expires_at is None or int(time.time()) <= expires_at):
+                    self.result_cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return result
+                del self.result_cache[key]
+            self.cache_misses += 1
+            return None
+    
+    def _put_cached_result(self, key, generation, expires_at, result):
+        """結果をキャッシュに保存（generationは検索を始める前に読んだ世代）"""
+        with self.result_cache_lock:
+            self.result_cache[key] = (generation, expires_at, result)
+            self.result_cache.move_to_end(key)
+            while len(self.result_cache) > RESULT_CACHE_SIZE:
+                self.result_cache.popitem(last=False)
+    
+    def _search_programs_cached(self, search_criteria):
+        """キャッシュを通して番組検索を実行"""
+        key = ('search', self._normalize_criteria(search_criteria))
+        programs = self._get_cached_result(key)
+        if programs is None:
+            # 検索中に取り込みがあっても古い世代で保存されるよう、検索の前に世代を読む
+            generation = self.cache_manager.generation
+            programs = self.cache_manager.search_programs(search_criteria)
+            # 結果はこれから放送される番組のみのため、最も早い番組の放送開始を過ぎると結果が変わる
+            expires_at = min((program['start_epoch'] for program in programs if program['start_epoch'] is not None), default=None)
+            self._put_cached_result(key, generation, expires_at, programs)
+        return list(programs)
+    
+    def get_cache_stats(self):
+        """検索結果キャッシュの統計を取得"""
+        with self.result_cache_lock:
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'size': len(self.result_cache),
+                'generation': self.cache_manager.generation
+            }
+    
+    def clear_result_cache(self):
+        """検索結果キャッシュを空にする"""
+        with self.result_cache_lock:
+            self.result_cache.clear()
     
     def search_by_title(self, query, limit=100, date=None):
         """番組タイトルで検索"""
@@ -39,12 +116,43 @@ class ProgramSearchEngine:
         """検索条件で検索を実行"""
         # Noneの値を除去
         search_criteria = {k: v for k, v in criteria.items() if v is not None}
-        return self.cache_manager.search_programs(search_criteria)
+        return self._search_programs_cached(search_criteria)
     
     def search_combined(self, title=None, performer=None, station_name=None, 
                        start_time=None, end_time=None, date=None, limit=100, 
-                       use_time_range_search=False):
-        """複合検索"""
+                       use_time_range_search=False, sort=None):
+        """複合検索（sort='relevance'で全文検索の関連度順）"""
+        search_criteria = self._build_combined_criteria(
+            title, performer, station_name, start_time, end_time, date, limit, use_time_range_search, sort
+        )
+        return self._search_programs_cached(search_criteria)
+    
+    def open_combined_search(self, title=None, performer=None, station_name=None, 
+                             start_time=None, end_time=None, date=None, 
+                             use_time_range_search=False, sort=None, page_size=SEARCH_PAGE_SIZE):
+        """複合検索の結果をページ単位で取得するカーソルを返す（最初のページから順にfetch_pageで取得する）
+        
+        最初のページは検索結果キャッシュから設定済みの状態で返す。
+        """
+        search_criteria = self._build_combined_criteria(
+            title, performer, station_name, start_time, end_time, date, page_size, use_time_range_search, sort
+        )
+        cursor = self.cache_manager.open_search_cursor(search_criteria, page_size)
+        key = ('first_page', self._normalize_criteria(search_criteria))
+        cached = self._get_cached_result(key)
+        if cached is None:
+            generation = self.cache_manager.generation
+            page = cursor.fetch_page()
+            cached = (page, cursor.last_key, cursor.has_more)
+            expires_at = min((program['start_epoch'] for program in page if program['start_epoch'] is not None), default=None)
+            self._put_cached_result(key, generation, expires_at, cached)
+        page, last_key, has_more = cached
+        cursor.preload_first_page(page, last_key, has_more)
+        return cursor
+    
+    def _build_combined_criteria(self, title, performer, station_name, start_time, end_time, date,
+                                 limit, use_time_range_search, sort):
+        """複合検索の検索条件を組み立てる"""
         search_criteria = {
             'limit': limit
         }
@@ -61,136 +169,32 @@ class ProgramSearchEngine:
             search_criteria['end_time'] = end_time
         if date:
             search_criteria['date'] = date
+        if sort:
+            search_criteria['sort'] = sort
         
-        # 時間範囲検索の場合は特別な処理
+        # 時間範囲検索の場合は時間帯が重なる番組を含める（例：7:00-9:30で6:00-9:00の番組も含む）
         if use_time_range_search and start_time and end_time:
-            return self._search_by_time_range_with_overlap(search_criteria)
+            search_criteria['time_overlap'] = True
         
-        return self.cache_manager.search_programs(search_criteria)
-    
-    def _search_by_time_range_with_overlap(self, search_criteria):
-        """時間範囲で重複する番組を検索（例：7:00-9:30で6:00-9:00の番組も含む）"""
-        try:
-            cursor = self.cache_manager.conn.cursor()
-            
-            # 基本検索条件を構築
-            where_conditions = []
-            params = []
-            
-            if search_criteria.get('title'):
-                where_conditions.append("title LIKE ?")
-                params.append(f"%{search_criteria['title']}%")
-            
-            if search_criteria.get('performer'):
-                where_conditions.append("performer LIKE ?")
-                params.append(f"%{search_criteria['performer']}%")
-            
-            if search_criteria.get('station_name'):
-                where_conditions.append("station_name LIKE ?")
-                params.append(f"%{search_criteria['station_name']}%")
-            
-            if search_criteria.get('date'):
-                where_conditions.append("date = ?")
-                params.append(search_criteria['date'])
-            # 日付が指定されていない場合は、日付条件を追加しない
-            # _filter_past_programsで過去の番組を除外するため、すべての日付を検索対象にする
-            
-            # 時間範囲の重複検索ロジック
-            start_time = search_criteria.get('start_time')
-            end_time = search_criteria.get('end_time')
-            
-            if start_time and end_time:
-                # 番組の開始時間が検索終了時間より前 かつ
-                # 番組の終了時間が検索開始時間より後
-                # つまり、時間的に重複する番組を検索
-                where_conditions.append("start_time < ? AND end_time > ?")
-                params.extend([end_time, start_time])
-            
-            # クエリの構築
-            where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-            # 日付が指定されていない場合は、LIMITを大幅に増やして
-            # _filter_past_programsで過去の番組を除外した後も十分な結果が得られるようにする
-            requested_limit = search_criteria.get('limit', 100)
-            if search_criteria.get('date'):
-                # 日付指定時は通常のLIMITを使用
-                query_limit = requested_limit
-            else:
-                # 日付未指定時は、未来の番組を十分に取得できるようにLIMITを増やす
-                # 過去の番組を除外した後も十分な結果が得られるようにする
-                query_limit = max(requested_limit * 50, 10000)
-            
-            query = f'''
-                SELECT station_id, station_name, title, performer, 
-                       start_time, end_time, description, date
-                FROM programs 
-                WHERE {where_clause}
-                ORDER BY start_time
-                LIMIT ?
-            '''
-            params.append(query_limit)
-            
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            # 辞書形式に変換
-            programs = []
-            for row in results:
-                programs.append({
-                    'station_id': row['station_id'],
-                    'station_name': row['station_name'],
-                    'title': row['title'],
-                    'performer': row['performer'],
-                    'start_time': row['start_time'],
-                    'end_time': row['end_time'],
-                    'description': row['description'],
-                    'date': row['date']
-                })
-            
-            # 過去の番組を除外
-            programs = self.cache_manager._filter_past_programs(programs)
-            
-            # 過去の番組を除外した後、要求されたLIMITを適用
-            # ただし、日付未指定の場合はLIMITを適用しない（すべての結果を返す）
-            if search_criteria.get('date'):
-                # 日付指定時のみLIMITを適用
-                if len(programs) > requested_limit:
-                    programs = programs[:requested_limit]
-            # 日付未指定時はLIMITを適用しない（すべての未来の番組を返す）
-            
-            self.log.info(f"Time range search completed: {len(programs)} results found (requested limit: {requested_limit}, date specified: {bool(search_criteria.get('date'))})")
-            return programs
-            
-        except Exception as e:
-            self.log.error(f"Time range search failed: {e}")
-            return []
+        return search_criteria
     
     def search_now_playing(self, station_id=None):
-        """現在放送中の番組を検索"""
-        now = datetime.datetime.now()
-        current_time = now.strftime('%H:%M:%S')
-        
-        # ラジオの日付ルールに従った日付を取得
-        from tcutil import CalendarUtil
-        calendar_util = CalendarUtil()
-        today = calendar_util.get_radio_date()
-        
-        search_criteria = {
-            'start_time': f"00:00:00",
-            'end_time': current_time,
-            'date': today,
-            'limit': 1
-        }
+        """現在放送中の番組を検索（放送局指定時は番組またはNone、省略時は全放送局のリスト）"""
+        key = ('now_playing', station_id)
+        programs = self._get_cached_result(key)
+        if programs is None:
+            generation = self.cache_manager.generation
+            programs = self.cache_manager.get_programs_on_air(station_id=station_id)
+            if programs:
+                # 放送中の番組のうち最も早く終わるものが終わると結果が変わる
+                expires_at = min(program['end_epoch'] for program in programs) - 1
+            else:
+                expires_at = int(time.time()) + EMPTY_ON_AIR_CACHE_SECONDS
+            self._put_cached_result(key, generation, expires_at, programs)
         
         if station_id:
-            # 特定の放送局の現在放送中番組を検索
-            programs = self.cache_manager.search_programs(search_criteria)
-            for program in programs:
-                if program['station_id'] == station_id:
-                    return program
-            return None
-        else:
-            # 全放送局の現在放送中番組を検索
-            return self.cache_manager.search_programs(search_criteria)
+            return programs[0] if programs else None
+        return list(programs)
     
     def search_upcoming_programs(self, hours=24, station_id=None):
         """今後の番組を検索"""
@@ -230,7 +234,7 @@ class ProgramSearchEngine:
                     'description': keywords,
                     'limit': limit
                 }
-                field_results = self.cache_manager.search_programs(search_criteria)
+                field_results = self._search_programs_cached(search_criteria)
             else:
                 continue
             
@@ -250,25 +254,23 @@ class ProgramSearchEngine:
     def get_popular_programs(self, date=None, limit=20):
         """人気番組を取得（タイトルが重複する番組を集計）"""
         try:
-            cursor = self.cache_manager.conn.cursor()
-            
-            where_clause = "WHERE date = ?" if date else "WHERE 1=1"
-            params = [date] if date else []
-            
-            query = f'''
-                SELECT title, station_name, COUNT(*) as count,
-                       MIN(start_time) as first_start_time,
-                       MAX(end_time) as last_end_time
-                FROM programs 
-                {where_clause}
-                GROUP BY title, station_name
-                ORDER BY count DESC, title
-                LIMIT ?
-            '''
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            results = cursor.fetchall()
+            if date:
+                cursor = self.cache_manager.reader_connection().cursor()
+                query = '''
+                    SELECT title, station_name, COUNT(*) as count,
+                           MIN(start_time) as first_start_time,
+                           MAX(end_time) as last_end_time
+                    FROM program_details 
+                    WHERE date = ?
+                    GROUP BY title, station_name
+                    ORDER BY count DESC, title
+                    LIMIT ?
+                '''
+                cursor.execute(query, (date, limit))
+                results = cursor.fetchall()
+            else:
+                # 全期間の集計は取り込み時に更新される集計テーブルから取得する
+                results = self.cache_manager.get_popular_titles(limit)
             
             popular_programs = []
             for row in results:
@@ -297,35 +299,48 @@ class ProgramSearchEngine:
             'limit': 1000  # 1日の番組数上限
         }
         
-        return self.cache_manager.search_programs(search_criteria)
+        return self._search_programs_cached(search_criteria)
     
     def search_similar_programs(self, program_title, limit=10):
         """類似番組を検索（タイトルが似ている番組）"""
         try:
-            cursor = self.cache_manager.conn.cursor()
+            cursor = self.cache_manager.reader_connection().cursor()
             
             # タイトルからキーワードを抽出
             keywords = self._extract_keywords(program_title)
             if not keywords:
                 return []
             
-            # キーワードを含む番組を検索
-            where_conditions = []
-            params = []
-            
-            for keyword in keywords:
-                where_conditions.append("title LIKE ?")
-                params.append(f"%{keyword}%")
+            # キーワードのいずれかを含む番組を検索（全文検索の関連度順）
+            match_expr, like_conditions, like_params = self.cache_manager.build_fulltext_filter(
+                [('title', keyword) for keyword in keywords], operator='OR'
+            )
             
-            where_clause = " OR ".join(where_conditions)
+            params = []
+            if match_expr and not like_conditions:
+                join_clause = self.cache_manager.fulltext_join_clause()
+                where_clause = "1=1"
+                params.append(match_expr)
+            elif match_expr:
+                # 索引で引けない短いキーワードがある場合はLIKEとのORで絞り込む
+                join_clause = self.cache_manager.fulltext_join_clause(outer=True)
+                where_clause = "(fts.fts_rowid IS NOT NULL OR " + " OR ".join(like_conditions) + ")"
+                params.append(match_expr)
+                params.extend(like_params)
+            else:
+                join_clause = ""
+                where_clause = "(" + " OR ".join(like_conditions) + ")"
+                params.extend(like_params)
+            order_clause = "fts.fts_rank IS NULL, fts.fts_rank, p.start_time DESC" if match_expr else "p.start_time DESC"
             
             query = f'''
-                SELECT DISTINCT station_id, station_name, title, performer, 
-                       start_time, end_time, description, date
-                FROM programs 
+                SELECT DISTINCT p.station_id, p.station_name, p.title, p.performer, 
+                       p.start_time, p.end_time, p.description_id, p.date
+                FROM program_details p
+                {join_clause}
                 WHERE {where_clause}
-                AND title != ?
-                ORDER BY start_time DESC
+                AND p.title != ?
+                ORDER BY {order_clause}
                 LIMIT ?
             '''
             params.extend([program_title, limit])
@@ -342,7 +357,7 @@ class ProgramSearchEngine:
                     'performer': row['performer'],
                     'start_time': row['start_time'],
                     'end_time': row['end_time'],
-                    'description': row['description'],
+                    'description_id': row['description_id'],
                     'date': row['date']
                 })
             
@@ -368,17 +383,34 @@ class ProgramSearchEngine:
     def get_search_suggestions(self, partial_query, limit=10):
         """検索候補を取得"""
         try:
-            cursor = self.cache_manager.conn.cursor()
-            
-            query = '''
-                SELECT DISTINCT title
-                FROM programs 
-                WHERE title LIKE ?
-                ORDER BY title
-                LIMIT ?
-            '''
+            cursor = self.cache_manager.reader_connection().cursor()
+            
+            match_expr, like_conditions, like_params = self.cache_manager.build_fulltext_filter(
+                [('title', partial_query)]
+            )
+            
+            if match_expr:
+                # 関連度の高いタイトルから候補にする
+                query = f'''
+                    SELECT p.title, MIN(fts.fts_rank) AS best_rank
+                    FROM programs p
+                    {self.cache_manager.fulltext_join_clause()}
+                    GROUP BY p.title
+                    ORDER BY best_rank, p.title
+                    LIMIT ?
+                '''
+                params = [match_expr, limit]
+            else:
+                query = f'''
+                    SELECT DISTINCT p.title
+                    FROM programs p
+                    WHERE {" AND ".join(like_conditions) if like_conditions else "1=1"}
+                    ORDER BY p.title
+                    LIMIT ?
+                '''
+                params = like_params + [limit]
             
-            cursor.execute(query, [f"%{partial_query}%", limit])
+            cursor.execute(query, params)
             results = cursor.fetchall()
             
             return [row['title'] for row in results]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# 番組表XMLの逐次解析モジュール
+
+import re
+from collections import namedtuple
+import lxml.etree as ET
+
+# 一度にパーサーへ渡すバイト数（解析済みの要素はこの単位で解放される）
+FEED_CHUNK_SIZE = 64 * 1024
+# 番組説明に含まれるHTMLタグ
+HTML_TAG_PATTERN = re.compile(r'<.*?>', re.DOTALL)
+
+# <prog>要素1つ分の番組情報（start_time/end_timeはHHMM形式のまま）
+ProgramRecord = namedtuple('ProgramRecord', ['title', 'performer', 'start_time', 'end_time', 'description'])
+
+# 解析時にPythonへ通知する要素（これ以外の要素はlibxml2の中で読み飛ばす）
+_EVENT_TAGS = ('station', 'prog', 'title', 'pfm', 'desc')
+
+def strip_html(text):
+    """HTMLタグを除去"""
+    if not text or '<' not in text:
+        return text or ''
+    return HTML_TAG_PATTERN.sub('', text)
+
+def _iter_elements(content):
+    """対象要素を閉じタグを読んだ順に返す（文書全体を一度に木にしない）"""
+    parser = ET.XMLPullParser(events=('end',), tag=_EVENT_TAGS)
+    view = memoryview(content)
+    for offset in range(0, len(content), FEED_CHUNK_SIZE):
+        parser.feed(bytes(view[offset:offset + FEED_CHUNK_SIZE]))
+        for _, elem in parser.read_events():
+            yield elem
+    parser.close()
+    for _, elem in parser.read_events():
+        yield elem
+
+def _free(elem):
+    """処理済みの要素と、それより前の兄弟要素を解放する"""
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+def parse_programs(content):
+    """番組表XML（放送局単位・エリア単位のどちらも可）を1回の走査で解析する
+
+    放送局IDをキー、ProgramRecordのリストを値に持つ辞書を返す。
+    子要素が欠けている番組も、その番組の項目が空になるだけで他の番組とずれることはない。
+    解析済みの番組・放送局は順に解放するため、大きな文書でも木全体を保持しない。
+    解析エラーはET.XMLSyntaxErrorとして送出する。
+    """
+    stations = {}
+    programs = []
+    fields = {}
+    for elem in _iter_elements(content):
+        tag = elem.tag
+        if tag == 'prog':
+            programs.append(ProgramRecord(
+                fields.get('title', '').strip(),
+                fields.get('pfm', '').strip(),
+                elem.get('ftl') or '',
+                elem.get('tol') or '',
+                strip_html(fields.get('desc', '')).strip(),
+            ))
+            fields = {}
+            _free(elem)
+        elif tag == 'station':
+            stations.setdefault(elem.get('id') or '', []).extend(programs)
+            programs = []
+            _free(elem)
+        else:
+            # 番組の項目は<prog>の閉じタグより先に届くので、貯めておいて番組レコードにまとめる
+            fields[tag] = elem.text or ''
+    if programs:
+        # <station>に囲まれていない番組
+        stations.setdefault('', []).extend(programs)
+    return stations
@@ -6,15 +6,51 @@ from logging import getLogger
 import requests
 import constants
 import datetime
+import time
 import tcutil
 from views import token
+from views import httpCache
+from views import programXmlParser
+from views import stationCatalog
+from views.refreshPlanner import RefreshPlanner
 
 class ProgramManager:
-    def __init__(self):
+    def __init__(self, load_area_codes=True):
+        """load_area_codesがFalseの場合は放送局一覧を取得せず、後でjpCode()を呼ぶ（起動を通信で待たせないため）"""
         self.log=getLogger("%s.%s" % (constants.LOG_PREFIX,"ProgramManager"))
         self.log.debug("created!")
-        self.jpCode()
+        self.values = {}
+        if load_area_codes:
+            self.jpCode()
         self.tcutil = tcutil.CalendarUtil()
+        # 現在放送中の番組を答える番組キャッシュ（set_program_cacheで設定されるまでは通信で取得する）
+        self.program_cache = None
+        # この秒数より前に取得した番組キャッシュの行は、番組の差し替えを反映していない可能性があるので使わない
+        self.now_program_max_age = RefreshPlanner().ttl(0)
+
+    def set_program_cache(self, cache_manager):
+        """現在放送中の番組の問い合わせに使う番組キャッシュを設定"""
+        self.program_cache = cache_manager
+
+    def get_cached_now_program(self, id):
+        """現在放送中の番組を番組キャッシュから取得（通信しない）
+        
+        title・performer・descriptionを持つ辞書を返す。
+        キャッシュに該当する番組が無い場合や、取得から時間が経っている場合はNone。
+        """
+        if self.program_cache is None:
+            return None
+        try:
+            program = self.program_cache.get_now_program(id)
+        except Exception as e:
+            self.log.warning(f"Failed to look up now playing program for {id} in cache: {e}")
+            return None
+        if program is None:
+            return None
+        if program['fetched_at'] is None or time.time() - program['fetched_at'] > self.now_program_max_age:
+            self.log.debug(f"Cached program for {id} is stale")
+            return None
+        return program
 
     def getArea(self):
         """エリアを判定する"""
@@ -34,68 +70,126 @@ class ProgramManager:
     def getprogramlist(self):
         return "http://radiko.jp/v3"
 
-    def retrieveRadioListings(self, id, date):
-        try:
-            # 日付の処理を修正
-            if isinstance(date, str):
-                if len(date) == 8 and date.isdigit():  # YYYYMMDD形式
-                    formatted_date = date
-                elif ',' in date:  # カンマ区切り形式
-                    lists = date.split(",")
-                    if len(lists) >= 3:
-                        year = lists[0].strip()
-                        month = lists[1].strip().zfill(2)
-                        day = lists[2].strip().zfill(2)
-                        formatted_date = f"{year}{month}{day}"
-                        self.log.debug(f"Converted comma-separated date '{date}' to '{formatted_date}'")
-                    else:
-                        self.log.error(f"Invalid date format: {date}")
-                        self.root = None
-                        return
-                elif '/' in date:  # スラッシュ区切り形式
-                    lists = date.split("/")
-                    if len(lists) >= 3:
-                        year = lists[0].strip()
-                        month = lists[1].strip().zfill(2)
-                        day = lists[2].strip().zfill(2)
-                        formatted_date = f"{year}{month}{day}"
-                        self.log.debug(f"Converted slash-separated date '{date}' to '{formatted_date}'")
-                    else:
-                        self.log.error(f"Invalid date format: {date}")
-                        self.root = None
-                        return
-                elif '-' in date:  # ハイフン区切り形式
-                    lists = date.split("-")
-                    if len(lists) >= 3:
-                        year = lists[0].strip()
-                        month = lists[1].strip().zfill(2)
-                        day = lists[2].strip().zfill(2)
-                        formatted_date = f"{year}{month}{day}"
-                        self.log.debug(f"Converted hyphen-separated date '{date}' to '{formatted_date}'")
-                    else:
-                        self.log.error(f"Invalid date format: {date}")
-                        self.root = None
-                        return
+    def _format_listing_date(self, date):
+        """番組表APIに渡す日付（YYYYMMDD）に変換する（変換できない場合はNone）"""
+        if isinstance(date, str):
+            if len(date) == 8 and date.isdigit():  # YYYYMMDD形式
+                formatted_date = date
+            elif ',' in date:  # カンマ区切り形式
+                lists = date.split(",")
+                if len(lists) >= 3:
+                    year = lists[0].strip()
+                    month = lists[1].strip().zfill(2)
+                    day = lists[2].strip().zfill(2)
+                    formatted_date = f"{year}{month}{day}"
+                    self.log.debug(f"Converted comma-separated date '{date}' to '{formatted_date}'")
+                else:
+                    self.log.error(f"Invalid date format: {date}")
+                    return None
+            elif '/' in date:  # スラッシュ区切り形式
+                lists = date.split("/")
+                if len(lists) >= 3:
+                    year = lists[0].strip()
+                    month = lists[1].strip().zfill(2)
+                    day = lists[2].strip().zfill(2)
+                    formatted_date = f"{year}{month}{day}"
+                    self.log.debug(f"Converted slash-separated date '{date}' to '{formatted_date}'")
+                else:
+                    self.log.error(f"Invalid date format: {date}")
+                    return None
+            elif '-' in date:  # ハイフン区切り形式
+                lists = date.split("-")
+                if len(lists) >= 3:
+                    year = lists[0].strip()
+                    month = lists[1].strip().zfill(2)
+                    day = lists[2].strip().zfill(2)
+                    formatted_date = f"{year}{month}{day}"
+                    self.log.debug(f"Converted hyphen-separated date '{date}' to '{formatted_date}'")
                 else:
-                    self.log.error(f"Unsupported date format: {date}")
-                    self.root = None
-                    return
+                    self.log.error(f"Invalid date format: {date}")
+                    return None
             else:
-                self.log.error(f"Date must be string, got: {type(date)}")
-                self.root = None
-                return
-            
-            url = f"{self.getprogramlist()}/program/station/date/{formatted_date}/{id}.xml"
-            self.log.debug(f"Requesting URL: {url}")
+                self.log.error(f"Unsupported date format: {date}")
+                return None
+        else:
+            self.log.error(f"Date must be string, got: {type(date)}")
+            return None
+        return formatted_date
 
-            # XMLデータを取得
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            xml_data = response.content
-            
-            # XMLを解析
-            self.root = ET.fromstring(xml_data)
-            self.log.debug(f"Successfully retrieved listings for station {id} on {formatted_date}")
+    def fetchRadioListings(self, id, date):
+        """放送局・日付の番組表XMLを取得し、解析したルート要素を返す
+        
+        self.rootを変更しないため、複数のスレッドから同時に呼び出せる。
+        通信・解析のエラーは呼び出し元に送出する。日付の形式が不正な場合はNoneを返す。
+        """
+        formatted_date = self._format_listing_date(date)
+        if formatted_date is None:
+            return None
+        
+        url = f"{self.getprogramlist()}/program/station/date/{formatted_date}/{id}.xml"
+        self.log.debug(f"Requesting URL: {url}")
+        
+        # XMLデータを取得（変更が無ければキャッシュから）
+        body = httpCache.get_shared_cache().get(url, timeout=30)
+        
+        # XMLを解析
+        root = ET.fromstring(body)
+        self.log.debug(f"Successfully retrieved listings for station {id} on {formatted_date}")
+        return root
+
+    def fetchStationProgramsXml(self, id, date):
+        """放送局・日付の番組表XMLを解析せずに返す
+        
+        通信エラーは呼び出し元に送出する。日付の形式が不正な場合はNoneを返す。
+        """
+        formatted_date = self._format_listing_date(date)
+        if formatted_date is None:
+            return None
+        
+        url = f"{self.getprogramlist()}/program/station/date/{formatted_date}/{id}.xml"
+        self.log.debug(f"Requesting URL: {url}")
+        return httpCache.get_shared_cache().get(url, timeout=30)
+
+    def fetchStationPrograms(self, id, date):
+        """放送局・日付の番組表を取得し、ProgramRecordのリストを返す
+        
+        XMLは木構造を作らずに1回の走査で解析する。
+        通信・解析のエラーは呼び出し元に送出する。日付の形式が不正な場合はNoneを返す。
+        """
+        body = self.fetchStationProgramsXml(id, date)
+        if body is None:
+            return None
+        stations = programXmlParser.parse_programs(body)
+        return stations.get(id, [])
+
+    def fetchAreaListingsXml(self, area, date):
+        """エリア・日付の番組表XMLを解析せずに返す
+        
+        通信エラーは呼び出し元に送出する。日付の形式が不正な場合はNoneを返す。
+        """
+        formatted_date = self._format_listing_date(date)
+        if formatted_date is None:
+            return None
+        
+        url = f"{self.getprogramlist()}/program/date/{formatted_date}/{area}.xml"
+        self.log.debug(f"Requesting URL: {url}")
+        return httpCache.get_shared_cache().get(url, timeout=30)
+
+    def fetchAreaListings(self, area, date):
+        """エリア・日付の番組表を1回で取得し、放送局IDをキー、ProgramRecordのリストを値に持つ辞書を返す
+        
+        通信・解析のエラーは呼び出し元に送出する。日付の形式が不正な場合はNoneを返す。
+        """
+        body = self.fetchAreaListingsXml(area, date)
+        if body is None:
+            return None
+        stations = programXmlParser.parse_programs(body)
+        self.log.debug(f"Successfully retrieved listings for {len(stations)} stations in area {area} on {date}")
+        return stations
+
+    def retrieveRadioListings(self, id, date):
+        try:
+            self.root = self.fetchRadioListings(id, date)
             
         except requests.RequestException as e:
             self.log.error(f"Failed to retrieve radio listings for station {id}: {e}")
@@ -109,24 +203,28 @@ class ProgramManager:
             self.log.error(f"Traceback: {traceback.format_exc()}")
             self.root = None
 
-    def gettitle(self):
+    def gettitle(self, root=None):
         try:
-            if not hasattr(self, 'root') or self.root is None:
+            if root is None:
+                root = getattr(self, 'root', None)
+            if root is None:
                 self.log.warning("Root element not available")
                 return []
-            title_elements = self.root.findall(".//title")
+            title_elements = root.findall(".//title")
             titles = [title.text if title.text else '' for title in title_elements]
             return titles
         except Exception as e:
             self.log.error(f"Failed to get titles: {e}")
             return []
 
-    def getpfm(self):
+    def getpfm(self, root=None):
         try:
-            if not hasattr(self, 'root') or self.root is None:
+            if root is None:
+                root = getattr(self, 'root', None)
+            if root is None:
                 self.log.warning("Root element not available")
                 return []
-            pfm_elements = self.root.findall(".//pfm")
+            pfm_elements = root.findall(".//pfm")
             names = [pfm.text if pfm.text else '' for pfm in pfm_elements]
             return names
         except Exception as e:
@@ -134,36 +232,32 @@ class ProgramManager:
             return []
 
     def jpCode(self):
-        """stationIdをキー、都道府県コードを値に持つ辞書を作成"""
-        self.values = {}
-        url = f"{self.getprogramlist()}/station/region/full.xml"
-        response = requests.get(url)
-        xml_data = response.content
-        root = ET.fromstring(xml_data)
-        id_elements = root.findall(".//id")
-        area_id_elements = root.findall(".//area_id")
-        station_id = [id.text for id in id_elements]
-        area_id = [areaid.text for areaid in area_id_elements]
-        for station,area in zip(station_id, area_id):
-            self.values[station] = area
+        """stationIdをキー、都道府県コードを値に持つ辞書を作成
+        
+        放送局一覧はプロセスで共有するカタログから引くため、有効期間内なら通信も解析もしない。
+        """
+        self.values = stationCatalog.get_shared_catalog().ensure_fresh().area_codes()
 
     def getNowProgram(self, id):
-        """現在再生中の番組タイトルを返す"""
+        """現在再生中の番組タイトルを返す（番組キャッシュに無い場合だけ通信する）"""
+        cached = self.get_cached_now_program(id)
+        if cached is not None:
+            self.log.debug(f"Found program title in cache for {id}: {cached['title']}")
+            return cached['title']
         try:
             # 方法1: 放送局IDを直接使用して番組情報を取得
             url = f"{self.getprogramlist()}/program/now/{id}.xml"
             self.log.debug(f"Trying direct station API for {id}: {url}")
             
             try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
+                body = httpCache.get_shared_cache().get(url, timeout=10)
             except requests.RequestException as e:
                 self.log.warning(f"Direct station API failed for {id}: {e}")
                 # 方法2: 都道府県コードを使用（フォールバック）
                 return self._getNowProgramByArea(id)
                 
             try:
-                root = ET.parse(url)
+                root = ET.fromstring(body)
                 results = root.xpath(".//station")
                 progs = root.xpath(".//progs")
             except Exception as e:
@@ -174,7 +268,6 @@ class ProgramManager:
             self.url = url
             self.progs = progs
             self.results = results
-            self.response = response
             
             # 直接取得した場合、該当する放送局の番組情報を探す
             for result, prog in zip(results, progs):
@@ -210,14 +303,13 @@ class ProgramManager:
             self.log.debug(f"Trying area-based API for {id} (area: {jp_number}): {url}")
             
             try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
+                body = httpCache.get_shared_cache().get(url, timeout=10)
             except requests.RequestException as e:
                 self.log.error(f"Failed to fetch program data by area: {e}")
                 return None
                 
             try:
-                root = ET.parse(url)
+                root = ET.fromstring(body)
                 results = root.xpath(".//station")
                 progs = root.xpath(".//progs")
             except Exception as e:
@@ -227,7 +319,6 @@ class ProgramManager:
             self.url = url
             self.progs = progs
             self.results = results
-            self.response = response
             
             for result, title in zip(results, progs):
                 try:
@@ -251,7 +342,10 @@ class ProgramManager:
             return None
 
     def getnowProgramPfm(self, id):
-        """現在放送中の番組の出演者を返す"""
+        """現在放送中の番組の出演者を返す（番組キャッシュに無い場合は直前のgetNowProgramの取得結果から探す）"""
+        cached = self.get_cached_now_program(id)
+        if cached is not None:
+            return cached['performer']
         try:
             # 直接取得した場合、該当する放送局の出演者情報を探す
             for result, prog in zip(self.results, self.progs):
@@ -284,7 +378,10 @@ class ProgramManager:
             return None
 
     def getNowProgramDsc(self, id):
-        """番組の説明を取得して返す"""
+        """番組の説明を取得して返す（番組キャッシュに無い場合は直前のgetNowProgramの取得結果から探す）"""
+        cached = self.get_cached_now_program(id)
+        if cached is not None:
+            return cached['description'] or None
         try:
             # 直接取得した場合、該当する放送局の説明情報を探す
             for result, prog in zip(self.results, self.progs):
@@ -294,7 +391,7 @@ class ProgramManager:
                         if desc_element and desc_element[0].text:
                             desc_text = desc_element[0].text
                             # HTMLタグを除去
-                            clean_text = re.sub(re.compile('<.*?>'), '', desc_text)
+                            clean_text = programXmlParser.strip_html(desc_text)
                             return clean_text
                     except Exception as e:
                         self.log.warning(f"Failed to extract description for station {id}: {e}")
@@ -308,7 +405,7 @@ class ProgramManager:
                     if desc_element and desc_element[0].text:
                         desc_text = desc_element[0].text
                         # HTMLタグを除去
-                        clean_text = re.sub(re.compile('<.*?>'), '', desc_text)
+                        clean_text = programXmlParser.strip_html(desc_text)
                         dsc_dic[result.get("id")] = clean_text
                 except Exception as e:
                     self.log.warning(f"Failed to extract description for station {result.get('id')}: {e}")
@@ -322,24 +419,28 @@ class ProgramManager:
             self.log.error(f"Unexpected error in getNowProgramDsc: {e}")
             return None
 
-    def get_ftl(self):
+    def get_ftl(self, root=None):
         try:
-            if not hasattr(self, 'root') or self.root is None:
+            if root is None:
+                root = getattr(self, 'root', None)
+            if root is None:
                 self.log.warning("Root element not available")
                 return []
-            prog_elements = self.root.findall(".//prog")
+            prog_elements = root.findall(".//prog")
             prog_ftl = [ftl.get("ftl") if ftl.get("ftl") else '' for ftl in prog_elements]
             return prog_ftl
         except Exception as e:
             self.log.error(f"Failed to get start times: {e}")
             return []
 
-    def get_tol(self):
+    def get_tol(self, root=None):
         try:
-            if not hasattr(self, 'root') or self.root is None:
+            if root is None:
+                root = getattr(self, 'root', None)
+            if root is None:
                 self.log.warning("Root element not available")
                 return []
-            prog_elements = self.root.findall(".//prog")
+            prog_elements = root.findall(".//prog")
             prog_tol = [tol.get("tol") if tol.get("tol") else '' for tol in prog_elements]
             return prog_tol
         except Exception as e:
@@ -349,10 +450,9 @@ class ProgramManager:
     def get_onair_music(self, id):
         """オンエア中の曲情報を取得"""
         url = f'http://radiko.jp/v3/feed/pc/noa/{id}.xml'
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        body = httpCache.get_shared_cache().get(url, timeout=10)
         
-        root = ET.parse(url)
+        root = ET.fromstring(body)
         items = root.xpath(".//item")
         
         if items and len(items) > 0:
@@ -367,12 +467,14 @@ class ProgramManager:
         else:
             return ""
 
-    def getDescriptions(self):
+    def getDescriptions(self, root=None):
         try:
-            if not hasattr(self, 'root') or self.root is None:
+            if root is None:
+                root = getattr(self, 'root', None)
+            if root is None:
                 self.log.warning("Root element not available")
                 return []
-            desc_elements = self.root.findall(".//desc")
+            desc_elements = root.findall(".//desc")
             descriptions = [description.text if description.text else '' for description in desc_elements]
             return descriptions
         except Exception as e:
@@ -4,19 +4,25 @@
 import wx
 import tcutil
 import time
+import threading
 import locale
 import winsound
 import region_dic
 import re
 import lxml.etree as ET
-import socket
 import subprocess
 import constants
 import globalVars
-import urllib
+import requests
 from simpleDialog import *
 from soundPlayer import player
 from soundPlayer.constants import *
+from views import nowPlayingService
+from views import onairMusicPoller
+from views import stationCatalog
+
+# 放送局ツリーの番組名を表示し直す最長の間隔（秒）。番組が変わる時刻が分かっていればその時刻に表示し直す
+TREE_PROGRAM_REFRESH_MAX_INTERVAL = 5 * 60
 
 
 class RadioManager:
@@ -29,16 +35,25 @@ class RadioManager:
         
         # ラジオ局関連の初期化
         self._player = player.player()
-        self.updateInfoTimer = wx.Timer()
         self.tmg = tcutil.TimeManager()
         self.clutl = tcutil.CalendarUtil()
         self.stid = {}
         self.region = region_dic.REGION
         self.area = None
         self.m3u8 = None
+        self.tree_program_timer = None
+        # 放送局ツリー用に放送時間帯のインデックスを作成中の番組キャッシュ
+        self.tree_index_building = None
+        # オンエア曲を購読している放送局（再生中の放送局）
+        self.onair_station_id = None
+        
+        # 放送中の番組は番組の切り替わりに合わせてバックグラウンドで取得し、表示はキャッシュから行う
+        self.now_playing = nowPlayingService.NowPlayingService(parent_view.progs)
+        self.now_playing.add_listener(self.events.onNowPlayingChanged)
+        self.now_playing.start()
 
-    def setup_radio_ui(self):
-        """ラジオ局関連のUIを設定"""
+    def setup_radio_ui(self, cached_only=False):
+        """ラジオ局関連のUIを設定（cached_onlyの場合は通信せず、保存済みの放送局一覧で描画する）"""
         self.volume, tmp = self.creator.slider(
             _("音量(&V)"), 
             event=self.events.onVolumeChanged, 
@@ -48,15 +63,16 @@ class RadioManager:
         self.volume.SetValue(self.app.config.getint("play", "volume"))
         
         self.AreaTreeCtrl()
-        self.setupradio()
-        self.setRadioList()
+        self.setupradio(cached_only)
+        self.setRadioList(cached_only)
 
 
     def AreaTreeCtrl(self):
         """放送局のツリーコントロールを作成"""
         self.tree, broadcaster = self.creator.treeCtrl(_("放送局"), size=(450,200), proportion=1)
+        self.tree_events_bound = False
 
-    def setupradio(self):
+    def setupradio(self, cached_only=False):
         """ステーションidを取得後、ツリービューに描画"""
         if self.area in self.region:
             self.log.debug("region:" + self.region[self.area])
@@ -64,113 +80,160 @@ class RadioManager:
         root = self.tree.AddRoot(_("放送局一覧"))
         # エリア情報の取得に失敗
         if not self.area:
-            errorDialog(_("エリア情報の取得に失敗しました。\nインターネットの接続状況をご確認ください"))
+            # 起動直後はエリアが分からなくても、起動処理の完了を待つ
+            if not cached_only:
+                errorDialog(_("エリア情報の取得に失敗しました。\nインターネットの接続状況をご確認ください"))
             self.tree.SetFocus()
             self.tree.Expand(root)
             self.tree.SelectItem(root, select=True)
             return
 
-    def get_radio_stations(self, url, max_retries=3, timeout=30):
-        """
-        ラジオ局情報を取得する関数
+    def load_station_list(self, area, cached_only=False):
+        """エリアで聴取できる放送局の (放送局ID, 放送局名) のリストを取得
         
-        Parameters:
-        - url: radiko.jpのAPI URL
-        - max_retries: 最大リトライ回数
-        - timeout: タイムアウト時間（秒）
+        UIには触れないため、別スレッドから呼び出せる。
+        放送局一覧はプロセスで共有するカタログから引き、有効期間を過ぎている場合だけ取得し直す。
+        cached_onlyの場合は通信せず、保存済みの放送局一覧だけを使う。
         
         Returns:
-        - tuple: (成功/失敗, XMLデータ/エラーメッセージ)
+        - tuple: (成功/失敗, リスト/エラーメッセージ（表示不要の場合はNone）)
         """
-        for attempt in range(max_retries):
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                parsed_url = urllib.parse.urlparse(url)
-                host = parsed_url.hostname
-                port = parsed_url.port or 443
-                sock.settimeout(timeout)
-                
-                result = sock.connect_ex((host, port))
-                sock.close()
-                
-                if result != 0:
-                    if attempt < max_retries - 1:
-                        wait_time = (attempt + 1) * 2
-                        self.log.debug(f"接続エラー。{wait_time}秒後にリトライします。(試行 {attempt + 1}/{max_retries})")
-                        time.sleep(wait_time)
-                        continue
-                    return False, "接続に失敗しました。インターネットの接続状況をご確認ください。"
-
-                req = urllib.request.Request(url)
-                req.add_header('User-Agent', 'Mozilla/5.0')
-                
-                with urllib.request.urlopen(req, timeout=timeout) as response:
-                    return True, response.read().decode()
-
-            except socket.timeout:
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2
-                    self.log.debug(f"タイムアウトが発生しました。{wait_time}秒後にリトライします。")
-                    time.sleep(wait_time)
-                else:
-                    return False, "タイムアウトによりデータの取得に失敗しました。"
-                
-            except Exception as e:
-                self.log.error(f"予期せぬエラーが発生しました: {str(e)}")
-                return False, f"予期せぬエラーが発生しました: {str(e)}"
-
-    def setRadioList(self):
-        """ラジオ局リストを設定"""
-        root = self.tree.GetRootItem()
-        # ラジオ局情報の取得
-        url = "https://radiko.jp/v3/station/region/full.xml"
-        success, result = self.get_radio_stations(url)
-        if not success:
-            errorDialog(_(result))
-            self.tree.SetFocus()
-            self.tree.Expand(root)
-            self.tree.SelectItem(root, select=True)
-            return
-
+        if area not in self.region:
+            return False, None
+        
+        catalog = stationCatalog.get_shared_catalog()
         try:
-            # XMLのパース
-            parsed = ET.fromstring(result.encode('utf-8'))
-            
-            for r in parsed:
-                for station in r:
-                    stream = {r.attrib["ascii_name"]: {}}
-                    stream[r.attrib["ascii_name"]] = {
-                        "radioname": station.find("name").text,
-                        "radioid": station.find("id").text
-                    }
-                    
-                    if "ZENKOKU" in stream:
-                        self.tree.AppendItem(root, stream["ZENKOKU"]["radioname"], data=stream["ZENKOKU"]["radioid"])
-                        self.stid[stream["ZENKOKU"]["radioid"]] = stream["ZENKOKU"]["radioname"]
-                    
-                    if self.region[self.area] in stream:
-                        self.tree.AppendItem(root, stream[self.region[self.area]]["radioname"], data=stream[self.region[self.area]]["radioid"])
-                        self.stid[stream[self.region[self.area]]["radioid"]] = stream[self.region[self.area]]["radioname"]
+            if cached_only:
+                if not catalog.load_snapshot():
+                    return False, None
+            else:
+                catalog.ensure_fresh()
+
+        except requests.Timeout:
+            return False, "タイムアウトによりデータの取得に失敗しました。"
+
+        except requests.ConnectionError:
+            return False, "接続に失敗しました。インターネットの接続状況をご確認ください。"
 
         except ET.ParseError:
             self.log.error("Failed to parse xml!")
-            errorDialog(_("放送局情報の取得に失敗しました。\nしばらく時間をおいて再度お試しください。"))
-            return
+            return False, "放送局情報の取得に失敗しました。\nしばらく時間をおいて再度お試しください。"
 
         except Exception as e:
-            self.log.error(f"An unexpected error occurred: {str(e)}")
-            return
+            self.log.error(f"予期せぬエラーが発生しました: {str(e)}")
+            return False, f"予期せぬエラーが発生しました: {str(e)}"
+
+        stations = catalog.stations_in_regions(("ZENKOKU", self.region[area]))
+        return True, [(station.station_id, station.name) for station in stations]
+
+    def populate_station_tree(self, stations, focus=True):
+        """放送局の一覧をツリーに描画（選択中の放送局は描画し直しても選択を保つ）"""
+        root = self.tree.GetRootItem()
+        selected = self.tree.GetSelection()
+        selected_id = self.tree.GetItemData(selected) if selected.IsOk() else None
+        
+        self.tree.DeleteChildren(root)
+        stid = {}
+        reselect = root
+        for station_id, name in stations:
+            item = self.tree.AppendItem(root, name, data=station_id)
+            stid[station_id] = name
+            if station_id == selected_id:
+                reselect = item
+        self.stid = stid
 
         # イベントバインドとツリーの設定
-        self.tree.Bind(wx.EVT_TREE_ITEM_ACTIVATED, self.events.onRadioActivated)
-        self.tree.Bind(wx.EVT_TREE_SEL_CHANGED, self.events.onRadioSelected)
-        self.tree.SetFocus()
+        if not self.tree_events_bound:
+            self.tree.Bind(wx.EVT_TREE_ITEM_ACTIVATED, self.events.onRadioActivated)
+            self.tree.Bind(wx.EVT_TREE_SEL_CHANGED, self.events.onRadioSelected)
+            self.tree_events_bound = True
+        if focus:
+            self.tree.SetFocus()
         self.tree.Expand(root)
-        self.tree.SelectItem(root, select=True)
+        self.tree.SelectItem(reselect, select=True)
+        self.update_station_tree_programs()
+
+    def update_station_tree_programs(self):
+        """放送局ツリーの各放送局に放送中の番組名を表示し、次に番組が変わる時刻に表示し直す
+        
+        番組キャッシュの放送時間帯インデックスから引くため通信しない。
+        番組キャッシュの準備ができていない場合は何もしない（準備ができた時点で呼ばれる）。
+        インデックスがまだ無い場合はバックグラウンドで作り、作り終えた時点で表示し直す。
+        """
+        if self.tree_program_timer:
+            self.tree_program_timer.Stop()
+            self.tree_program_timer = None
+        if not self.app.config.getboolean("play", "show_program_in_tree", True):
+            return
+        program_cache_controller = getattr(self.parent, 'program_cache_controller', None)
+        cache_manager = getattr(program_cache_controller, 'cache_manager', None)
+        index = cache_manager.get_interval_index(build=False) if cache_manager else None
+        if index is None:
+            if cache_manager:
+                self._build_tree_index(cache_manager)
+            return
+        
+        now = int(time.time())
+        on_air = index.programs_at(now)
+        root = self.tree.GetRootItem()
+        item, cookie = self.tree.GetFirstChild(root)
+        while item.IsOk():
+            station_id = self.tree.GetItemData(item)
+            name = self.stid.get(station_id, station_id)
+            program = on_air.get(station_id)
+            label = f"{name} - {program.title}" if program and program.title else name
+            if self.tree.GetItemText(item) != label:
+                self.tree.SetItemText(item, label)
+            item, cookie = self.tree.GetNextChild(root, cookie)
+        
+        next_change = index.next_change(now, set(self.stid))
+        delay = TREE_PROGRAM_REFRESH_MAX_INTERVAL
+        if next_change is not None:
+            delay = min(max(next_change - now, 1), delay)
+        self.tree_program_timer = wx.CallLater(delay * 1000, self.update_station_tree_programs)
+
+    def _build_tree_index(self, cache_manager):
+        """放送時間帯のインデックスをバックグラウンドで作り、作り終えたら放送局ツリーを表示し直す"""
+        if self.tree_index_building is cache_manager:
+            return
+        self.tree_index_building = cache_manager
+
+        def build():
+            index = cache_manager.get_interval_index()
+            wx.CallAfter(self._on_tree_index_built, cache_manager, index)
+
+        threading.Thread(target=build, name="IntervalIndexBuilder", daemon=True).start()
+
+    def _on_tree_index_built(self, cache_manager, index):
+        if self.tree_index_building is cache_manager:
+            self.tree_index_building = None
+        if index is not None:
+            self.update_station_tree_programs()
+
+    def setRadioList(self, cached_only=False):
+        """ラジオ局リストを設定"""
+        root = self.tree.GetRootItem()
+        # ラジオ局情報の取得
+        success, result = self.load_station_list(self.area, cached_only)
+        if not success:
+            if result and not cached_only:
+                errorDialog(_(result))
+            self.tree.SetFocus()
+            self.tree.Expand(root)
+            self.tree.SelectItem(root, select=True)
+            return
+
+        self.populate_station_tree(result)
 
     def areaDetermination(self, progs):
         """エリアを判定する"""
-        self.area = progs.getArea()
+        self.set_area(progs.getArea())
+
+    def set_area(self, area):
+        """エリアを設定し、次回起動時に通信を待たずに放送局一覧を描画できるよう保存する"""
+        self.area = area
+        if area:
+            self.app.config["play"]["area"] = area
 
     def get_streamUrl(self, stationid, progs):
         """ストリームURLを取得"""
@@ -189,9 +252,14 @@ class RadioManager:
         self.parent.menu.SetMenuLabel("FUNCTION_PLAY_PLAY", _("停止"))
         self.get_streamUrl(id, progs)
         self.player()
-        self.update_program_info()
+        self.update_program_info(id)
         self.events.playing = True
         
+        # よく聴く放送局の番組表を優先して収集できるよう記録
+        program_cache_controller = getattr(self.parent, 'program_cache_controller', None)
+        if program_cache_controller:
+            program_cache_controller.record_station_usage(id, 'play')
+        
         # スクリーンリーダーで再生開始を通知
         try:
             station_name = self.stid.get(id, id)
@@ -202,10 +270,9 @@ class RadioManager:
     def stop(self):
         """再生停止"""
         self._player.stop()
+        self.update_program_info(None)
         self.parent.menu.SetMenuLabel("FUNCTION_PLAY_PLAY", _("再生"))
         self.log.info("posed")
-        self.updateInfoTimer.Stop()
-        self.log.debug("timer is stoped!")
         self.events.playing = False
         
         # スクリーンリーダーで再生停止を通知
@@ -214,10 +281,18 @@ class RadioManager:
         except Exception as e:
             self.log.error(f"Failed to announce playback stop: {e}")
 
-    def update_program_info(self):
-        """番組情報更新タイマーを開始"""
-        self.updateInfoTimer.Start(self.tmg.replace_milliseconds(3))  # 設定した頻度で番組情報を更新
-        self.updateInfoTimer.Bind(wx.EVT_TIMER, self.events.onUpdateProcess)
+    def update_program_info(self, station_id):
+        """番組情報の更新の通知元を再生中の放送局に切り替える（Noneの場合は通知を止める）
+        
+        番組の切り替わりはnow_playingから、オンエア曲はオンエア曲のポーラーから通知される。
+        """
+        self.now_playing.watch([station_id] if station_id else [])
+        poller = onairMusicPoller.get_shared_poller()
+        if self.onair_station_id:
+            poller.unsubscribe(self.onair_station_id, self.events.onOnairMusicChanged)
+        self.onair_station_id = station_id
+        if station_id:
+            poller.subscribe(station_id, self.events.onOnairMusicChanged)
 
     def get_latest_programList(self, progs):
         """番組リストを最新に更新"""
@@ -232,4 +307,8 @@ class RadioManager:
 
     def exit(self):
         """終了処理"""
+        if self.tree_program_timer:
+            self.tree_program_timer.Stop()
+        self.now_playing.stop()
+        onairMusicPoller.stop_shared_poller()
         self._player.exit()
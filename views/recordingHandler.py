@@ -177,6 +177,11 @@ class RecordingHandler:
                 self.log.info(f"Recording started: {title}")
                 self._update_recording_menu_for_station(self.events.current_selected_station_id)
                 
+                # よく録音する放送局の番組表を優先して収集できるよう記録
+                program_cache_controller = getattr(self.parent, 'program_cache_controller', None)
+                if program_cache_controller:
+                    program_cache_controller.record_station_usage(self.events.current_selected_station_id, 'record')
+                
                 # スクリーンリーダーで録音開始を通知
                 try:
                     station_name = self.parent.radio_manager.stid.get(self.events.current_selected_station_id, self.events.current_selected_station_id)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 番組キャッシュの更新計画モジュール
+
+import datetime
+import time
+from logging import getLogger
+import constants
+
+# 今日の放送日からの日数ごとの再取得間隔（秒）。(この日数まで, 間隔) の順に判定する
+REFRESH_POLICIES = [
+    (0, 6 * 60 * 60),  # 今日: 番組の差し替えが最も多いので短い間隔で取り直す
+    (2, 3 * 24 * 60 * 60),  # 明日・明後日
+    (None, 7 * 24 * 60 * 60),  # それ以降: 一度取得したら今日に近づくまで取り直さない
+]
+
+class RefreshPlanner:
+    """放送局・放送日ごとの最終取得時刻から、取り直しが必要な組を選ぶクラス
+
+    一度も取得していない組（週間範囲に新しく入った日付など）は常に対象になる。
+    取得済みの組は、今日の放送日からの日数に応じた間隔を過ぎた場合だけ対象にする。
+    """
+
+    def __init__(self, policies=None):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.RefreshPlanner")
+        self.policies = policies or REFRESH_POLICIES
+
+    def ttl(self, offset):
+        """今日の放送日からの日数に対する再取得間隔（秒）"""
+        for max_offset, ttl in self.policies:
+            if max_offset is None or offset <= max_offset:
+                return ttl
+        return self.policies[-1][1]
+
+    def plan(self, targets, fetched_at, today, now=None):
+        """取り直しが必要な (放送局ID, 日付) を元の順序のまま返す
+
+        fetched_at: (放送局ID, 日付) -> 最終取得時刻（UNIX時刻）の辞書
+        today: 今日の放送日（YYYYMMDD）
+        """
+        now = time.time() if now is None else now
+        today_date = datetime.datetime.strptime(today, '%Y%m%d')
+        offsets = {}
+        due = []
+        missing = stale = 0
+        for station_id, date in targets:
+            offset = offsets.get(date)
+            if offset is None:
+                offset = offsets[date] = max(0, (datetime.datetime.strptime(date, '%Y%m%d') - today_date).days)
+            last_fetched = fetched_at.get((station_id, date))
+            if last_fetched is None:
+                missing += 1
+            elif now - last_fetched >= self.ttl(offset):
+                stale += 1
+            else:
+                continue
+            due.append((station_id, date))
+        self.log.info(f"Refresh plan: {len(due)}/{len(targets)} station-days due (not fetched={missing}, expired={stale})")
+        return due
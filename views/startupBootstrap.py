@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# 起動時の通信処理をバックグラウンドで行うモジュール
+
+import threading
+import time
+from logging import getLogger
+import wx
+import constants
+from views import programCacheController
+
+# 起動処理の手順（通知で使う名前, 説明）
+STEPS = [
+    ('area', "エリア判定"),
+    ('stations', "放送局一覧の取得"),
+    ('area_codes', "放送局のエリア情報の取得"),
+    ('program_cache', "番組キャッシュの準備"),
+]
+# GUIスレッドへの反映を待つ最大秒数
+APPLY_TIMEOUT = 30
+
+class StartupBootstrap:
+    """起動時の通信処理（認証・放送局一覧・番組キャッシュ）をバックグラウンドで行うクラス
+
+    画面は前回のエリアと保存済みの放送局一覧で先に表示し、ここで最新の状態に置き換える。
+    進捗は add_listener() で登録した関数に listener(手順, 状態, 詳細) の形でGUIスレッドから通知する。
+    状態は 'started'・'finished'・'failed' のいずれかで、すべて終わると ('all', 'finished', 所要秒数) を通知する。
+    """
+
+    def __init__(self, view):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.StartupBootstrap")
+        self.view = view
+        self.listeners = []
+        self.status = {name: None for name, _ in STEPS}
+        self.thread = None
+        self.finished = threading.Event()
+
+    def add_listener(self, listener):
+        """進捗の通知先を登録"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """起動処理を開始"""
+        self.thread = threading.Thread(target=self._run, name="StartupBootstrap", daemon=True)
+        self.thread.start()
+
+    def is_done(self, step):
+        """手順が成功して終わっているか"""
+        return self.status.get(step) == 'finished'
+
+    def _notify(self, step, state, detail=None):
+        self.status[step] = state
+        if state == 'failed':
+            self.log.warning(f"Startup step {step} failed: {detail}")
+        else:
+            self.log.info(f"Startup step {step} {state}")
+        for listener in self.listeners:
+            wx.CallAfter(listener, step, state, detail)
+
+    def _call_in_gui(self, func, *args):
+        """GUIスレッドでfuncを実行し、終わるまで待って戻り値を返す"""
+        done = threading.Event()
+        result = {}
+
+        def run():
+            try:
+                result['value'] = func(*args)
+            except Exception as e:
+                result['error'] = e
+            finally:
+                done.set()
+
+        wx.CallAfter(run)
+        if not done.wait(APPLY_TIMEOUT):
+            raise TimeoutError(f"GUI thread did not run {func.__name__}")
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    def _step(self, step, func):
+        """手順を1つ実行して進捗を通知する（例外は失敗として通知し、次の手順に進む）"""
+        self._notify(step, 'started')
+        try:
+            detail = func()
+        except Exception as e:
+            self._notify(step, 'failed', e)
+            return False
+        self._notify(step, 'finished', detail)
+        return True
+
+    def _run(self):
+        """起動処理の本体（バックグラウンドスレッド）"""
+        started = time.monotonic()
+        try:
+            # エリア判定（認証）。失敗しても前回のエリアがあれば続ける
+            self._step('area', self._determine_area)
+            self._step('stations', self._load_stations)
+            # 番組表の一括取得・現在の番組の取得に使うエリア情報
+            self._step('area_codes', self._load_area_codes)
+            # 番組キャッシュ（必要なら週間データの収集まで行う）
+            self._step('program_cache', self._prepare_program_cache)
+        finally:
+            self.finished.set()
+            self._notify('all', 'finished', time.monotonic() - started)
+
+    def _determine_area(self):
+        area = self.view.progs.getArea()
+        self._call_in_gui(self.view.radio_manager.set_area, area)
+        return area
+
+    def _load_stations(self):
+        radio_manager = self.view.radio_manager
+        success, result = radio_manager.load_station_list(radio_manager.area)
+        if not success:
+            raise RuntimeError(result or "放送局情報の取得に失敗しました。\nしばらく時間をおいて再度お試しください。")
+        self._call_in_gui(self._apply_station_list, result)
+        return len(result)
+
+    def _load_area_codes(self):
+        self.view.progs.jpCode()
+        # エリア情報を待っていた放送中の番組の取得を始める
+        self.view.radio_manager.now_playing.wake()
+        return len(self.view.progs.values)
+
+    def _prepare_program_cache(self):
+        # 週間データの収集は後回しにしてコントローラーを先に公開し、検索画面や放送中の番組から使えるようにする
+        controller = programCacheController.ProgramCacheController(self.view.radio_manager, defer_update=True)
+        self._call_in_gui(self._apply_program_cache, controller)
+        # 放送局ツリーに番組名を表示するためのインデックスは、GUIスレッドを待たせないようここで作っておく
+        if controller.cache_manager and controller.cache_manager.get_interval_index() is not None:
+            wx.CallAfter(self.view.radio_manager.update_station_tree_programs)
+        # 収集は検索画面と同じバックグラウンド更新で行う（検索画面からの更新要求はこれに合流する）
+        finished = threading.Event()
+        refresh = controller.start_pending_update(on_finished=lambda success, cancelled: finished.set())
+        if refresh is None:
+            return
+        finished.wait()
+        wx.CallAfter(self.view.radio_manager.update_station_tree_programs)
+        return refresh.result
+
+    def _apply_program_cache(self, controller):
+        """番組キャッシュコントローラーを設定（GUIスレッド）"""
+        self.view.program_cache_controller = controller
+        if controller.cache_manager:
+            # 現在放送中の番組は番組キャッシュから答え、無い場合だけ通信する
+            self.view.progs.set_program_cache(controller.cache_manager)
+
+    def _apply_station_list(self, stations):
+        """取得した放送局一覧をツリーに反映（GUIスレッド）"""
+        radio_manager = self.view.radio_manager
+        # 保存済みの一覧で描画できていなかった場合だけフォーカスを移す
+        radio_manager.populate_station_tree(stations, focus=not radio_manager.stid)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# 放送局一覧（station/region/full.xml）のプロセス共有カタログモジュール
+
+import threading
+import time
+from collections import namedtuple
+from logging import getLogger
+import lxml.etree as ET
+import constants
+from views import httpCache
+
+# 放送局一覧（全エリア）
+STATION_LIST_URL = "https://radiko.jp/v3/station/region/full.xml"
+# この秒数の間は取得し直さずに読み込み済みの一覧を使う（HTTPキャッシュの有効期間と同じ）
+CATALOG_TTL = 24 * 60 * 60
+
+# 放送局1つ分の情報（regionは地方のascii_name、area_idは都道府県コード）
+Station = namedtuple('Station', ['station_id', 'name', 'ascii_name', 'area_id', 'region', 'region_name'])
+
+def parse_catalog(content):
+    """放送局一覧のXMLを解析し、掲載順のStationのリストを返す（解析エラーはET.XMLSyntaxErrorとして送出する）"""
+    stations = []
+    root = ET.fromstring(content)
+    for region in root.iter('stations'):
+        for station in region.iter('station'):
+            stations.append(Station(
+                station.findtext('id') or '',
+                station.findtext('name') or '',
+                station.findtext('ascii_name') or '',
+                station.findtext('area_id') or '',
+                region.get('ascii_name', ''),
+                region.get('region_name', ''),
+            ))
+    return stations
+
+class StationCatalog:
+    """放送局一覧を1回だけ解析し、放送局ID・エリア・地方で引けるようにしてプロセス全体で共有するクラス
+
+    起動時はディスクに保存済みの一覧（HTTPキャッシュ）から通信せずに読み込み、
+    ensure_fresh()で有効期間を過ぎていれば条件付きリクエストで確認する。
+    内容が変わらなければ解析し直さない。
+    """
+
+    def __init__(self, url=STATION_LIST_URL):
+        self.log = getLogger(f"{constants.LOG_PREFIX}.StationCatalog")
+        self.url = url
+        self.lock = threading.Lock()
+        # 複数のスレッドが同時に期限切れに気づいても、取得は1回にする
+        self.refresh_lock = threading.Lock()
+        self.body = None
+        self.checked_at = 0
+        self.stations = []
+        self.by_id = {}
+        self.by_region = {}
+        self.by_area = {}
+
+    def is_loaded(self):
+        return self.body is not None
+
+    def load_snapshot(self):
+        """保存済みの一覧を通信せずに読み込む（読み込めたかどうかを返す）"""
+        if self.is_loaded():
+            return True
+        body = httpCache.get_shared_cache().get_stored(self.url)
+        if body is None:
+            return False
+        try:
+            self._apply(body, checked_at=0)
+        except ET.XMLSyntaxError as e:
+            self.log.error(f"Failed to parse stored station list: {e}")
+            return False
+        return True
+
+    def refresh(self, timeout=30):
+        """一覧を取得し直す（通信・解析のエラーは呼び出し元に送出する）"""
+        body = httpCache.get_shared_cache().get(self.url, timeout=timeout)
+        self._apply(body, checked_at=time.time())
+
+    def ensure_fresh(self, timeout=30):
+        """有効期間を過ぎていれば取得し直す
+
+        取得に失敗しても、読み込み済みの一覧があればそれを使い続ける（無ければエラーを送出する）。
+        """
+        with self.refresh_lock:
+            if self.is_loaded() and time.time() - self.checked_at < CATALOG_TTL:
+                return self
+            try:
+                self.refresh(timeout)
+            except Exception as e:
+                if not self.load_snapshot():
+                    raise
+                self.log.warning(f"Failed to refresh station list, using the stored one: {e}")
+        return self
+
+    def _apply(self, body, checked_at):
+        with self.lock:
+            if body == self.body:
+                self.checked_at = max(self.checked_at, checked_at)
+                return
+        stations = parse_catalog(body)
+        by_id = {}
+        by_region = {}
+        by_area = {}
+        for station in stations:
+            # 複数の地方に載っている放送局は最初の掲載を代表とする
+            representative = by_id.setdefault(station.station_id, station)
+            by_region.setdefault(station.region, []).append(station)
+            # 都道府県ごとの一覧には同じ放送局を重複して載せない
+            if representative is station:
+                by_area.setdefault(station.area_id, []).append(station)
+        with self.lock:
+            self.body = body
+            self.checked_at = checked_at
+            self.stations = stations
+            self.by_id = by_id
+            self.by_region = by_region
+            self.by_area = by_area
+        self.log.info(f"Station catalog loaded: {len(by_id)} stations in {len(by_region)} regions")
+
+    def get(self, station_id):
+        """放送局IDの放送局（無い場合はNone）"""
+        return self.by_id.get(station_id)
+
+    def stations_in_regions(self, regions):
+        """地方（ascii_name）の放送局を一覧の掲載順に返す（同じ放送局は1回だけ）"""
+        regions = set(regions)
+        result = []
+        seen = set()
+        for station in self.stations:
+            if station.region in regions and station.station_id not in seen:
+                seen.add(station.station_id)
+                result.append(station)
+        return result
+
+    def stations_in_area(self, area_id):
+        """都道府県コードの放送局"""
+        return list(self.by_area.get(area_id, ()))
+
+    def area_codes(self):
+        """放送局IDをキー、都道府県コードを値に持つ辞書"""
+        return {station_id: station.area_id for station_id, station in self.by_id.items()}
+
+_shared_catalog = None
+_shared_lock = threading.Lock()
+
+def get_shared_catalog():
+    """プロセス全体で共有するカタログを取得"""
+    global _shared_catalog
+    with _shared_lock:
+        if _shared_catalog is None:
+            _shared_catalog = StationCatalog()
+        return _shared_catalog
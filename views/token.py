@@ -1,13 +1,13 @@
 
 # -*- coding: utf-8 -*-
 
-import urllib.request, urllib.error, urllib.parse
 import os, sys, datetime, argparse, re
 import subprocess
 import base64
 import shlex
 import logging
 from sys import argv
+from views import httpClient
 
 
 class Token:
@@ -31,10 +31,10 @@ class Token:
             "X-Radiko-User":"dummy_user" ,
             "X-Radiko-Device":"pc" ,
         }
-        req = urllib.request.Request( url, None, headers  )
-        res = urllib.request.urlopen(req)
-        auth_response["body"] = res.read()
-        auth_response["headers"] = res.info()
+        res = httpClient.get(url, headers=headers, retry=False)
+        res.raise_for_status()
+        auth_response["body"] = res.content
+        auth_response["headers"] = res.headers
         #print(auth_response)
         return auth_response
 
@@ -62,9 +62,9 @@ class Token:
             "X-Radiko-User": "dummy_user",
             "X-Radiko-Device": 'pc' # 'pc' 蝗ｺ螳・
         }
-        req  = urllib.request.Request( url, None, headers  )
-        res  = urllib.request.urlopen(req)
-        txt = res.read()
+        res  = httpClient.get(url, headers=headers, retry=False)
+        res.raise_for_status()
+        txt = res.content
         self.area = txt.decode()
         return self.area
 
@@ -72,9 +72,9 @@ class Token:
         headers =  {
             "X-Radiko-AuthToken": auth_token,
         }
-        req  = urllib.request.Request( url, None, headers  )
-        res  = urllib.request.urlopen(req)
-        body = res.read().decode()
+        res  = httpClient.get(url, headers=headers, retry=False)
+        res.raise_for_status()
+        body = res.content.decode()
         lines = re.findall( '^https?://.+m3u8$' , body, flags=(re.MULTILINE) )
         # embed()
         return lines[0]